@@ -1,18 +1,45 @@
-from flask import Flask, render_template, jsonify
+from flask import Flask, render_template, jsonify, Response, request
 from flask_socketio import SocketIO
 import sqlite3
 import threading
 import time
 import urllib3
 import logging
+import uuid
+import metrics
+import tracing
+import llm_pool
+import db
+import blobs
+import search
+import migrations
+import dedupe
+import jobs
+import poll_scheduler
+import render_cache
+import resilience
+import credentials
+import argparse
+import hmac
+import re
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor
 from incidentassist import (
     pull_servicenow_incidents, 
     STATE_MAPPING,
-    get_rag_context,
+    get_rag_sections,
+    format_rag_context,
     generate_solution,
-    replace_inc_with_url
+    cached_rag_sections,
+    replace_inc_with_url,
+    normalize_incident,
+    field_value,
+    CLOSED_STATES,
+    GROUP_NAMES,
+    get_incident_records,
+    is_open,
+    incident_is_open,
+    HELD_STATES
 )
 
 # Disable SSL warnings
@@ -55,196 +82,432 @@ def setup_logging():
 setup_logging()
 logger = logging.getLogger('incidentgpt')
 
+def detect_async_mode():
+    """'gevent' when serve.py has monkey patched the process, otherwise plain threads (python app.py)"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return 'threading'
+    return 'gevent' if monkey.is_module_patched('socket') else 'threading'
+
 # Initialize Flask app and SocketIO
 app = Flask(__name__)
-socketio = SocketIO(app, cors_allowed_origins="*")
+# With the poller, workers and web server in separate processes, SocketIO events go through a
+# message queue (e.g. "redis://localhost:6379/0") so every web process can relay them
+SOCKETIO_MESSAGE_QUEUE = getattr(credentials, "SOCKETIO_MESSAGE_QUEUE", None)
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=detect_async_mode(),
+                    message_queue=SOCKETIO_MESSAGE_QUEUE)
+
+# Database file and background task timings
+DB_PATH = 'incidents.db'
+
+# ServiceNow webhook. With a token configured, new incidents arrive through /webhook/servicenow
+# and the poll becomes a slow reconciliation sweep that catches anything the webhook missed.
+WEBHOOK_TOKEN = getattr(credentials, "WEBHOOK_TOKEN", None)
+RECONCILE_INTERVAL = getattr(credentials, "RECONCILE_INTERVAL", 1800)  # Seconds between polls when the webhook is on
+WEBHOOK_MAX_RECORDS = 100  # Records accepted per request
+
+# The poll interval adapts between its floor and ceiling (poll_scheduler.py)
+if WEBHOOK_TOKEN:
+    scheduler = poll_scheduler.PollScheduler(
+        floor=RECONCILE_INTERVAL, ceiling=max(RECONCILE_INTERVAL, poll_scheduler.POLL_MAX_INTERVAL))
+else:
+    scheduler = poll_scheduler.PollScheduler()
+# ServiceNow field -> stored incident columns, kept from the stored incident when an update leaves it out
+WEBHOOK_FIELDS = {
+    'description': ('description',),
+    'short_description': ('short_description',),
+    'cmdb_ci': ('config_item',),
+    'state': ('status',),
+    'work_notes': ('work_notes',),
+    'sys_id': ('snurl', 'sys_id'),
+    'assignment_group': ('assignment_group',),
+}
+JOB_POLL_INTERVAL = 2  # Seconds between checks for jobs queued by another process
+HEARTBEAT_INTERVAL = 30  # Seconds between heartbeats for the jobs this process is running
+# Time budget for retrieving context, generating and linking one solution. Every upstream call
+# and the wait for an Ollama backend are cut short so a stuck generation frees its worker.
+INCIDENT_DEADLINE = getattr(credentials, "INCIDENT_DEADLINE", 900)
+
+# Process roles: everything in one process, or the parts run separately
+ROLES = ('all', 'web', 'poller', 'worker')
 
-# Solution generation queue and lock
-solution_queue = []
+# Dashboard pagination
+PAGE_SIZE = 50  # Incident cards per page
+MAX_PAGE_SIZE = 200
+SEARCH_PAGE_SIZE = 20  # Search results per page
+
+# Solution generation jobs are kept in the jobs table (jobs.py) so the poller, workers and web
+# server can be separate processes. A worker process runs one generation per slot in its Ollama
+# pool, and the number of slots follows each backend's adaptive concurrency limit.
 queue_lock = threading.Lock()
-is_processing = False
+active_workers = 0
+running_jobs = set()  # Ids of the jobs this process is generating right now
+jobs_available = threading.Event()  # Wakes the dispatcher when a job is queued or a slot frees up
+
+def update_queue_depth(conn):
+    depth = jobs.counts(conn).get('queued', 0)
+    metrics.QUEUE_DEPTH.set(depth)
+    return depth
 
-def process_solution_queue():
-    """Process solutions in the queue one at a time"""
-    global is_processing
+def dispatch_jobs():
+    """Claim queued jobs while the Ollama pool has free slots, each one is generated in its own task"""
+    global active_workers
+    last_heartbeat = 0
     
     while True:
         try:
-            with queue_lock:
-                if not solution_queue:
-                    is_processing = False
-                    return
-                
-                # Get next incident from queue
-                incident = solution_queue.pop(0)
-                
-            # Generate solution outside of lock
-            try:
-                generate_and_store_solution(incident)
-                # Add cooldown between generations
-                time.sleep(5)  # 5 second cooldown
-            except Exception as e:
-                logger.error(f"Error processing solution for incident {incident['number']}: {str(e)}")
-                
+            jobs_available.clear()
+            conn = get_db()
+            
+            # Keep our jobs' leases alive and take over the ones of workers that stopped
+            if time.time() - last_heartbeat >= HEARTBEAT_INTERVAL:
+                with queue_lock:
+                    running = list(running_jobs)
+                jobs.heartbeat(conn, running)
+                requeued = jobs.requeue_abandoned(conn)
+                conn.commit()
+                if requeued:
+                    logger.warning(f"Requeued {requeued} jobs abandoned by stopped workers")
+                last_heartbeat = time.time()
+            
+            while True:
+                with queue_lock:
+                    # The pool may have backed off or raised its limit since the last job
+                    if active_workers >= llm_pool.POOL.capacity():
+                        break
+                    active_workers += 1
+                try:
+                    job = jobs.claim(conn)
+                    conn.commit()
+                except sqlite3.Error:
+                    with queue_lock:
+                        active_workers -= 1
+                    raise
+                if job is None:
+                    with queue_lock:
+                        active_workers -= 1
+                    break
+                job_id, incident = job
+                with queue_lock:
+                    running_jobs.add(job_id)
+                tracing.event(incident['number'], incident['generation_id'], 'dequeue')
+                # A greenlet under serve.py, a daemon thread otherwise
+                socketio.start_background_task(run_job, job_id, incident)
+            
+            update_queue_depth(conn)
+            jobs_available.wait(JOB_POLL_INTERVAL)
         except Exception as e:
-            logger.error(f"Error in solution processor: {str(e)}")
+            logger.error(f"Error in job dispatcher: {str(e)}")
             time.sleep(5)  # Wait before retrying
 
+def run_job(job_id, incident):
+    """Generate the solution for a claimed job, then free its slot"""
+    global active_workers
+    try:
+        with metrics.worker_busy():
+            generate_and_store_solution(incident)
+    except Exception as e:
+        logger.error(f"Error processing solution for incident {incident['number']}: {str(e)}")
+    finally:
+        conn = get_db()
+        try:
+            jobs.finish(conn, job_id)
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Database error while finishing job {job_id}: {str(e)}")
+            conn.rollback()
+        # Each job runs on its own thread or greenlet, the next one reuses the connection
+        db.release_connections()
+        with queue_lock:
+            running_jobs.discard(job_id)
+            active_workers -= 1
+        jobs_available.set()
+
 def queue_solution_generation(incident):
-    """Add incident to solution generation queue"""
-    global is_processing
-    
-    with queue_lock:
-        # Check if incident is already in queue
-        if not any(i['number'] == incident['number'] for i in solution_queue):
-            solution_queue.append(incident)
-            logger.info(f"Queued solution generation for incident {incident['number']}")
-            
-            # Start processor if not running
-            if not is_processing:
-                is_processing = True
-                thread = threading.Thread(target=process_solution_queue)
-                thread.daemon = True
-                thread.start()
+    """Add a generation job for the incident, unless one is already queued"""
+    # Each generation gets its own id so its trace spans can be grouped
+    generation_id = uuid.uuid4().hex
+    incident = {k: v for k, v in incident.items() if k not in ('generation_id', 'similarity')}
+    conn = get_db()
+    try:
+        queued = jobs.enqueue(conn, incident, generation_id)
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Database error while queueing incident {incident['number']}: {str(e)}")
+        conn.rollback()
+        return
+    if queued:
+        depth = update_queue_depth(conn)
+        tracing.event(incident['number'], generation_id, 'enqueue', queue_depth=depth)
+        logger.info(f"Queued solution generation for incident {incident['number']}")
+        jobs_available.set()
 
 def generate_and_store_solution(incident):
     """Generate and store solution for an incident"""
+    generation_id = incident.get('generation_id') or uuid.uuid4().hex
     try:
-        # Get RAG context
-        rag_context = get_rag_context(incident['description'], incident['config_item'], logger)
-        
-        # Generate solution
-        solution = generate_solution(
-            incident_number=incident['number'],
-            ci=incident['config_item'],
-            description=incident['description'],
-            work_notes=incident['work_notes'],
-            rag_context=rag_context
-        )
-
-        # Replace INCxxxxxxxx strings in the solution with URLs
-        solution = replace_inc_with_url(solution, logging)
+        with resilience.deadline(INCIDENT_DEADLINE):
+            # Get RAG context. Without it (e.g. PrivateGPT is down) the solution is generated from the incident alone.
+            # Regenerations of an unchanged problem reuse the sections their cached context was built from.
+            rag_sections = cached_rag_sections(incident['number'], incident['config_item'], incident['description'])
+            if rag_sections is None:
+                with tracing.span(incident['number'], generation_id, 'retrieval'):
+                    rag_sections = get_rag_sections(incident['description'], incident['config_item'], logger)
+            rag_context = format_rag_context(rag_sections, logger)
+
+            # Generate solution
+            solution = generate_solution(
+                incident_number=incident['number'],
+                ci=incident['config_item'],
+                description=incident['description'],
+                work_notes=incident['work_notes'],
+                rag_sections=rag_sections,
+                generation_id=generation_id
+            )
+
+            # Replace INCxxxxxxxx strings in the solution with URLs
+            with tracing.span(incident['number'], generation_id, 'link_resolution'):
+                solution = replace_inc_with_url(solution, logging)
         
         # Store solution
         conn = get_db()
         try:
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO solutions 
-                (incident_number, solution, generated_at, work_notes_snapshot, rag_context)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                incident['number'],
-                solution,
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                incident['work_notes'],
-                rag_context
-            ))
-            conn.commit()
+            with metrics.stage('db_write'), tracing.span(incident['number'], generation_id, 'store'):
+                c = conn.cursor()
+                # The large text values are stored once each in the blobs table
+                c.execute('''
+                    INSERT INTO solutions 
+                    (incident_number, solution, generated_at, work_notes_hash, rag_context_hash,
+                    generation_id, content_hash)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    incident['number'],
+                    solution,
+                    datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    blobs.put(conn, incident['work_notes']),
+                    blobs.put(conn, rag_context),
+                    generation_id,
+                    content_hash(incident)
+                ))
+                # Point the incident at its newest solution in the same transaction
+                solution_id = c.lastrowid
+                c.execute('''
+                    UPDATE incidents SET latest_solution_id = ?
+                    WHERE incident_number = ?
+                ''', (solution_id, incident['number']))
+                render_cache.bump(conn)
+                conn.commit()
             
             # Notify clients
             socketio.emit('solution_updated', {'incident_number': incident['number']})
             logger.info(f"Generated and stored solution for incident {incident['number']}")
-        finally:
-            conn.close()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
             
+    except resilience.DeadlineExceeded:
+        # Nothing is stored, so the incident is queued again by the next poll
+        metrics.DEADLINES_EXCEEDED.inc()
+        logger.warning(f"Solution for incident {incident['number']} not done within {INCIDENT_DEADLINE}s, giving up")
+        release_near_duplicates(incident, None)
+        return
+    except llm_pool.NoBackendAvailable as e:
+        logger.warning(f"No Ollama backend for incident {incident['number']}, retrying on the next poll: {str(e)}")
+        release_near_duplicates(incident, None)
+        return
     except Exception as e:
         logger.error(f"Error generating solution for incident {incident['number']}: {str(e)}")
+        release_near_duplicates(incident, None)
+        return
+    
+    # Near-duplicates can reuse this solution for a while
+    if dedupe.DEDUPE_ENABLED:
+        dedupe.INDEX.add(incident['number'], incident['config_item'], dedupe.incident_signature(incident),
+                         solution_id=solution_id, solved_at=time.time())
+    release_near_duplicates(incident, solution_id)
+
+def release_near_duplicates(incident, solution_id):
+    """Give incidents waiting on this one its solution, or queue them normally if it failed"""
+    conn = get_db()
+    try:
+        waiting = jobs.take_waiting(conn, incident['number'])
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Database error while releasing near-duplicates of {incident['number']}: {str(e)}")
+        conn.rollback()
+        return
+    if solution_id is None:
+        dedupe.INDEX.remove(incident['number'])
+    for waiting_incident in waiting:
+        score = waiting_incident.pop('similarity', 0.0)
+        if solution_id is None or not store_derived_solution(waiting_incident, incident['number'], solution_id, score):
+            queue_solution_generation(waiting_incident)
+
+def store_derived_solution(incident, source_number, source_solution_id, score):
+    """Store a copy of a near-duplicate's solution for this incident, marked with where it came from"""
+    generation_id = uuid.uuid4().hex
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        c.execute('''
+            SELECT s.solution, s.rag_context_hash, i.snurl
+            FROM solutions s
+            JOIN incidents i ON i.incident_number = s.incident_number
+            WHERE s.id = ?
+        ''', (source_solution_id,))
+        row = c.fetchone()
+        if row is None:
+            return False
+        source_solution, rag_context_hash, source_url = row
+        marker = (f'<em>Derived from <a href="{source_url}">{source_number}</a> '
+                  f'({round(score * 100)}% similar), not generated for this incident.</em><br>')
+        c.execute('''
+            INSERT INTO solutions 
+            (incident_number, solution, generated_at, work_notes_hash, rag_context_hash,
+            generation_id, content_hash, derived_from)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            incident['number'],
+            marker + (source_solution or ''),
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            blobs.put(conn, incident['work_notes']),
+            rag_context_hash,
+            generation_id,
+            content_hash(incident),
+            source_number
+        ))
+        c.execute('UPDATE incidents SET latest_solution_id = ? WHERE incident_number = ?',
+                  (c.lastrowid, incident['number']))
+        render_cache.bump(conn)
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Database error while storing derived solution for {incident['number']}: {str(e)}")
+        conn.rollback()
+        return False
+    
+    metrics.SOLUTIONS_DERIVED.inc()
+    tracing.event(incident['number'], generation_id, 'derived', source=source_number, similarity=round(score, 3))
+    socketio.emit('solution_updated', {'incident_number': incident['number']})
+    logger.info(f"Reused solution of {source_number} for near-duplicate incident {incident['number']} ({score:.2f})")
+    return True
+
+def reuse_near_duplicate(incident):
+    """
+    Handle a new incident that closely matches a recent one with the same CI, without a
+    generation of its own: reuse the solution if the match is solved, otherwise wait for it.
+    Returns False when there is no match and the incident should be queued.
+    """
+    signature = dedupe.incident_signature(incident)
+    match = dedupe.INDEX.find(incident['number'], incident['config_item'], signature)
+    if match is None:
+        # Index it while it is queued, so near-duplicates arriving meanwhile wait for it
+        dedupe.INDEX.add(incident['number'], incident['config_item'], signature)
+        return False
+    entry, score = match
+    if entry.solution_id is not None:
+        return store_derived_solution(incident, entry.number, entry.solution_id, score)
+    conn = get_db()
+    try:
+        if jobs.is_pending(conn, entry.number, ('queued', 'running')):
+            jobs.wait(conn, incident, uuid.uuid4().hex, entry.number, score)
+            conn.commit()
+            logger.info(f"Incident {incident['number']} waits for the solution of near-duplicate {entry.number}")
+            return True
+    except sqlite3.Error as e:
+        logger.error(f"Database error while parking near-duplicate {incident['number']}: {str(e)}")
+        conn.rollback()
+        return False
+    # Its generation is gone (it failed), don't wait for it
+    dedupe.INDEX.remove(entry.number)
+    return False
+
+def load_recent_solutions():
+    """Index the solutions generated within the dedupe window, so they can be reused after a restart"""
+    since = datetime.fromtimestamp(time.time() - dedupe.DEDUPE_WINDOW).strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        c = get_db().cursor()
+        c.execute('''
+            SELECT i.incident_number, i.config_item, i.short_description, i.description, s.id, s.generated_at
+            FROM incidents i
+            JOIN solutions s ON s.id = i.latest_solution_id
+            WHERE s.derived_from IS NULL AND s.generated_at >= ?
+        ''', (since,))
+        rows = c.fetchall()
+    except sqlite3.Error as e:
+        logger.error(f"Database error while loading recent solutions: {str(e)}")
+        return 0
+    for number, config_item, short_description, description, solution_id, generated_at in rows:
+        signature = dedupe.incident_signature({'short_description': short_description, 'description': description})
+        solved_at = datetime.strptime(generated_at, '%Y-%m-%d %H:%M:%S').timestamp()
+        dedupe.INDEX.add(number, config_item, signature, solution_id=solution_id, solved_at=solved_at)
+    return len(rows)
+
+def poll_once():
+    """
+    Pull incidents from ServiceNow once, storing each page and queueing its missing or stale
+    solutions as it arrives, then archive the incidents the pull no longer returned.
+    Returns the number of new, changed or archived incidents, or None if the poll failed.
+    """
+    updated = []
+
+    def store_page(incidents):
+        # The first pages get their solutions queued while the rest are still loading
+        updated.extend(upsert_incidents(incidents))
+
+    incidents = pull_servicenow_incidents(logger, on_page=store_page)
+    if incidents is not None:
+        # Only a complete pull tells which incidents are gone
+        updated.extend(archive_missing({i['number'] for i in incidents}))
+
+    if updated:
+        # Notify clients
+        socketio.emit('incidents_updated', {'updated': updated})
+    return None if incidents is None else len(updated)
 
 def check_for_updates():
-    """Background task to check for new incidents and generate solutions"""
+    """Background task polling ServiceNow, sooner while incidents are changing and less often when idle"""
     while True:
+        started = time.time()
         try:
-            # Get current incidents from ServiceNow
-            incidents = pull_servicenow_incidents(logger)
-            if incidents:
-                # Store them in the database
-                store_incidents(incidents)
-                
-                # Queue solutions for incidents that don't have one
-                conn = get_db()
-                try:
-                    c = conn.cursor()
-                    for incident in incidents:
-                        # Check if incident already has a solution
-                        c.execute('''
-                            SELECT COUNT(*) FROM solutions 
-                            WHERE incident_number = ?
-                        ''', (incident['number'],))
-                        if c.fetchone()[0] == 0:
-                            # No solution exists, queue one
-                            queue_solution_generation(incident)
-                finally:
-                    conn.close()
-                
-                # Notify clients
-                socketio.emit('incidents_updated', {'updated': [i['number'] for i in incidents]})
-            
-            # Sleep for 5 minutes
-            time.sleep(300)
+            changes = poll_once()
         except Exception as e:
             logger.error(f"Error in update checker: {str(e)}")
-            time.sleep(60)  # Sleep for 1 minute on error before retrying
+            changes = None
+        delay = scheduler.record(changes, time.time() - started)
+        logger.info(f"Next ServiceNow poll in {delay:.0f}s")
+        time.sleep(delay)
 
 def get_db():
-    """Get database connection with timeout"""
-    logger.debug("Getting database connection")
-    return sqlite3.connect('incidents.db', timeout=30)
+    """Get this thread's database connection (reused between calls, don't close it)"""
+    return db.get_connection(DB_PATH)
+
+@app.teardown_appcontext
+def release_db(exception):
+    """Give the request's connection back to the pool, each request runs on a new thread or greenlet"""
+    db.release_connections()
 
 def init_db():
-    """Initialize SQLite database with new schema"""
+    """Create or upgrade the database schema, keeping existing incidents and solutions"""
     logger.info("Initializing database")
     try:
-        conn = get_db()
-        c = conn.cursor()
-        
-        # Drop existing tables if they exist
-        c.execute('DROP TABLE IF EXISTS incidents')
-        c.execute('DROP TABLE IF EXISTS solutions')
-        
-        # Create new incidents table
-        c.execute('''CREATE TABLE incidents (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            incident_number TEXT UNIQUE,
-            description TEXT,
-            short_description TEXT,
-            config_item TEXT,
-            status TEXT,
-            work_notes TEXT,
-            last_updated TEXT,
-            snurl TEXT,
-            archived BOOLEAN DEFAULT 0,
-            resolved_at TEXT
-        )''')
-        
-        # Create new solutions table
-        c.execute('''CREATE TABLE solutions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            incident_number TEXT,
-            solution TEXT,
-            generated_at TEXT,
-            work_notes_snapshot TEXT,
-            rag_context TEXT,
-            FOREIGN KEY (incident_number) REFERENCES incidents(incident_number)
-        )''')
-        
-        conn.commit()
-        logger.info("Database initialized successfully")
+        version = migrations.migrate(get_db())
+        logger.info(f"Database initialized successfully (schema version {version})")
     except sqlite3.Error as e:
         logger.error(f"Database initialization error: {str(e)}")
         raise
-    finally:
-        if 'conn' in locals():
-            conn.close()
-            logger.debug("Database connection closed")
+
+# Incident fields upsert_incident() stores, under the same column names
+STORED_FIELDS = ('description', 'short_description', 'config_item', 'status', 'work_notes',
+                 'snurl', 'assignment_group', 'sys_id')
+
+def content_hash(incident):
+    """Hash of the fields a solution depends on (description, CI and work notes)"""
+    return migrations.incident_content_hash(incident['description'], incident['config_item'], incident['work_notes'])
 
 def has_incident_changed(stored, new):
     """Check if incident details have changed"""
-    return (
-        stored['work_notes'] != new['work_notes'] or
-        stored['description'] != new['description'] or
-        stored['config_item'] != new['config_item']
-    )
+    return stored['content_hash'] != content_hash(new)
 
 def get_stored_incident(incident_number):
     """Get a single incident from the database"""
@@ -263,162 +526,329 @@ def get_stored_incident(incident_number):
     except sqlite3.Error as e:
         logger.error(f"Database error while retrieving incident: {str(e)}")
         return None
-    finally:
-        conn.close()
 
-def store_incidents(incidents):
-    """Store incidents in the database and handle changes"""
-    conn = get_db()
+def archive_incidents(c, incident_numbers):
+    """Mark incidents as resolved, returns the numbers of those that were still active"""
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    archived = []
+    for incident_number in incident_numbers:
+        logger.info(f"Archiving resolved incident {incident_number}")
+        c.execute('''
+            UPDATE incidents 
+            SET archived = 1, resolved_at = ? 
+            WHERE incident_number = ? AND archived = 0
+        ''', (now, incident_number))
+        if c.rowcount:
+            archived.append(incident_number)
+    return archived
+
+def upsert_incident(c, incident):
+    """
+    Insert or update one incident, inside the caller's transaction. Returns True if it was
+    written: new, reopened, or any stored field changed. Unchanged incidents are left alone.
+    """
+    # Check if incident exists and has changed
+    stored_incident = get_stored_incident(incident['number'])
+    
+    if stored_incident:
+        # Check if important fields have changed
+        if has_incident_changed(stored_incident, incident):
+            logger.info(f"Changes detected in incident {incident['number']}, will generate new solution")
+            tracing.event(incident['number'], None, 'change_seen')
+        elif not stored_incident['archived'] and all(
+                stored_incident[field] == incident.get(field) for field in STORED_FIELDS):
+            return False
+    else:
+        tracing.event(incident['number'], None, 'first_seen')
+    
+    # Insert or update incident (an upsert, so latest_solution_id is kept)
+    c.execute('''
+        INSERT INTO incidents 
+        (incident_number, description, short_description, config_item, 
+        status, work_notes, last_updated, snurl, content_hash, assignment_group, sys_id, archived, resolved_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, NULL)
+        ON CONFLICT(incident_number) DO UPDATE SET
+            description = excluded.description,
+            short_description = excluded.short_description,
+            config_item = excluded.config_item,
+            status = excluded.status,
+            work_notes = excluded.work_notes,
+            last_updated = excluded.last_updated,
+            snurl = excluded.snurl,
+            content_hash = excluded.content_hash,
+            assignment_group = excluded.assignment_group,
+            sys_id = excluded.sys_id,
+            archived = 0,
+            resolved_at = NULL
+    ''', (
+        incident['number'],
+        incident['description'],
+        incident['short_description'],
+        incident['config_item'],
+        incident['status'],
+        incident['work_notes'],
+        datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        incident['snurl'],
+        content_hash(incident),
+        incident.get('assignment_group'),
+        incident.get('sys_id')
+    ))
+    return True
+
+def archive_missing(seen_numbers):
+    """
+    Archive the active incidents a complete pull didn't return, once ServiceNow confirms they
+    left it (closed, on hold, reassigned or deleted). Ones that are still open were only missed
+    because incidents changed between pages, those are stored again. Returns the numbers of
+    the archived or changed incidents.
+    """
     try:
-        c = conn.cursor()
-        
-        # Get current incident numbers from ServiceNow
-        current_incident_numbers = set()
-        for incident in incidents:
-            if 'number' not in incident or not incident['number']:
-                logger.error("Found incident without number in input data")
-                continue
-            current_incident_numbers.add(incident['number'])
-            logger.debug(f"Processing incident number: {incident['number']}")
-        
-        # Get all non-archived incidents from database
-        c.execute('SELECT incident_number FROM incidents WHERE archived = 0')
-        stored_incident_numbers = set(row[0] for row in c.fetchall())
-        
-        # Find incidents that are no longer in ServiceNow
-        resolved_incidents = stored_incident_numbers - current_incident_numbers
-        if resolved_incidents:
-            # Mark these incidents as archived
-            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            for incident_number in resolved_incidents:
-                logger.info(f"Archiving resolved incident {incident_number}")
-                c.execute('''
-                    UPDATE incidents 
-                    SET archived = 1, resolved_at = ? 
-                    WHERE incident_number = ?
-                ''', (now, incident_number))
-        
-        # Process current incidents
-        for incident in incidents:
-            # Check if incident exists and has changed
-            stored_incident = get_stored_incident(incident['number'])
-            needs_new_solution = False
-            
-            if stored_incident:
-                # Check if important fields have changed
-                if has_incident_changed(stored_incident, incident):
-                    logger.info(f"Changes detected in incident {incident['number']}, will generate new solution")
-                    needs_new_solution = True
-            
-            # Insert or update incident
-            c.execute('''
-                INSERT OR REPLACE INTO incidents 
-                (incident_number, description, short_description, config_item, 
-                status, work_notes, last_updated, snurl, archived, resolved_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, NULL)
-            ''', (
-                incident['number'],
-                incident['description'],
-                incident['short_description'],
-                incident['config_item'],
-                incident['status'],
-                incident['work_notes'],
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                incident['snurl']
-            ))
-            
-            # Queue solution generation if needed
-            if needs_new_solution:
-                queue_solution_generation(incident)
-                
-        conn.commit()
+        rows = get_db().execute('SELECT incident_number, sys_id FROM incidents WHERE archived = 0').fetchall()
     except sqlite3.Error as e:
-        logger.error(f"Database error while storing incidents: {str(e)}")
-        raise
-    finally:
-        conn.close()
+        logger.error(f"Database error while finding missing incidents: {str(e)}")
+        return []
+    missing = {number: sys_id for number, sys_id in rows if number not in seen_numbers}
+    if not missing:
+        return []
+
+    records = get_incident_records([sys_id for sys_id in missing.values() if sys_id], logger)
+    if records is None:
+        logger.warning(f"Could not confirm the state of {len(missing)} incidents missing from the poll, "
+                       "keeping them until the next poll")
+        return []
+    current = {field_value(record, 'number'): record for record in records}
+    still_open = [normalize_incident(current[number], logger)
+                  for number in missing if number in current and is_open(current[number])]
+    # Incidents without a stored sys_id can't be looked up, their absence has to do
+    closed = [number for number in missing if number not in current or not is_open(current[number])]
+    if still_open:
+        logger.info(f"{len(still_open)} incidents missing from the poll are still open, keeping them")
+    return upsert_incidents(still_open, closed)
 
-def get_stored_incidents(archived=False):
-    """Retrieve incidents from the database"""
+def upsert_incidents(incidents, resolved=()):
+    """
+    Store created / updated incidents and archive the resolved ones, then queue stale
+    solutions. Used for each page of a poll and by the webhook. Returns the numbers of the
+    new, changed or archived incidents.
+    """
+    with metrics.stage('store_incidents'):
+        conn = get_db()
+        try:
+            c = conn.cursor()
+            changes = archive_incidents(c, resolved)
+            for incident in incidents:
+                if upsert_incident(c, incident):
+                    changes.append(incident['number'])
+            if changes:
+                render_cache.bump(conn)
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Error while storing incidents: {str(e)}")
+            conn.rollback()
+            raise
+    queue_stale_incidents()
+    return changes
+
+def queue_stale_incidents():
+    """
+    Queue every active incident without a solution for its current content (no solution yet,
+    or the content hash changed since the latest one). Also run at startup, so only incidents
+    that changed while the app was down get regenerated. New incidents that are near-duplicates
+    of a recent one reuse its solution instead.
+    """
+    if dedupe.DEDUPE_ENABLED:
+        # Solutions may have been stored by a worker process
+        load_recent_solutions()
     conn = get_db()
     try:
+        released = jobs.release_orphans(conn)
+        conn.commit()
+        if released:
+            logger.info(f"Queued {released} near-duplicates whose source generation is gone")
         c = conn.cursor()
+        c.execute('''
+            SELECT i.incident_number, i.description, i.short_description, i.config_item,
+                   i.status, i.work_notes, i.snurl, s.id IS NULL
+            FROM incidents i
+            LEFT JOIN solutions s ON s.id = i.latest_solution_id
+            WHERE i.archived = 0 AND (s.id IS NULL OR s.content_hash IS NOT i.content_hash)
+            ORDER BY i.last_updated
+        ''')
+        rows = c.fetchall()
+    except sqlite3.Error as e:
+        logger.error(f"Database error while finding stale solutions: {str(e)}")
+        conn.rollback()
+        return 0
+    queued = 0
+    for row in rows:
+        incident = dict(zip(
+            ('number', 'description', 'short_description', 'config_item', 'status', 'work_notes', 'snurl'), row))
+        # Already queued, being generated or waiting for a near-duplicate. If the content changes
+        # during a generation, the next poll sees the stored solution is stale and queues it again.
+        if jobs.is_pending(conn, incident['number']):
+            continue
+        # A first solution can come from a near-duplicate solved minutes ago
+        if row[7] and dedupe.DEDUPE_ENABLED and reuse_near_duplicate(incident):
+            continue
+        queue_solution_generation(incident)
+        queued += 1
+    return queued
+
+def encode_cursor(last_updated, row_id):
+    """Keyset cursor pointing just past the given row"""
+    return f"{last_updated}|{row_id}"
+
+def decode_cursor(cursor):
+    last_updated, row_id = cursor.rsplit('|', 1)
+    return last_updated, int(row_id)
+
+def get_incident_summaries(archived=False, limit=PAGE_SIZE, cursor=None, group=None):
+    """
+    One page of lightweight incident rows for the dashboard cards, newest first, optionally of
+    one assignment group only. The heavy fields (description, work notes, solution, RAG context)
+    are left for get_incident_details. Returns (incidents, next_cursor), next_cursor is None on
+    the last page. Database errors are raised, so cached_response() doesn't cache an empty page.
+    """
+    where = 'i.archived = ?'
+    params = [1 if archived else 0]
+    if group:
+        where += ' AND i.assignment_group = ?'
+        params.append(group)
+    if cursor:
+        last_updated, row_id = decode_cursor(cursor)
+        where += ' AND (i.last_updated < ? OR (i.last_updated = ? AND i.id < ?))'
+        params += [last_updated, last_updated, row_id]
+    c = get_db().cursor()
+    c.execute(f'''
+        SELECT 
+            i.id,
+            i.incident_number,
+            i.short_description,
+            i.config_item,
+            i.status,
+            i.snurl,
+            i.archived,
+            i.resolved_at,
+            i.last_updated,
+            s.generated_at,
+            i.assignment_group
+        FROM incidents i
+        LEFT JOIN solutions s ON s.id = i.latest_solution_id
+        WHERE {where}
+        ORDER BY i.last_updated DESC, i.id DESC
+        LIMIT ?
+    ''', params + [limit + 1])
+    rows = c.fetchall()
+
+    # One extra row was fetched to tell whether there is another page
+    next_cursor = encode_cursor(rows[limit - 1][8], rows[limit - 1][0]) if len(rows) > limit else None
+    incidents = [{
+        'number': row[1],
+        'short_description': row[2],
+        'config_item': row[3],
+        'status': row[4],
+        'snurl': row[5],
+        'archived': row[6],
+        'resolved_at': row[7],
+        'last_updated': row[8],
+        'has_solution': row[9] is not None,
+        'generated_at': row[9],
+        'assignment_group': row[10]
+    } for row in rows[:limit]]
+    return incidents, next_cursor
+
+def get_incident_details(incident_number):
+    """The heavy fields of one incident, loaded when its card is expanded"""
+    try:
+        c = get_db().cursor()
         c.execute('''
             SELECT 
-                i.incident_number as number,
+                i.incident_number,
                 i.description,
                 i.short_description,
                 i.config_item,
-                i.status,
                 i.work_notes,
-                i.last_updated,
-                i.snurl,
-                i.archived,
-                i.resolved_at,
                 s.solution,
                 s.generated_at,
-                s.rag_context
+                s.rag_context_hash,
+                s.derived_from
             FROM incidents i
-            LEFT JOIN (
-                SELECT incident_number, solution, generated_at, rag_context,
-                       ROW_NUMBER() OVER (PARTITION BY incident_number ORDER BY generated_at DESC) as rn
-                FROM solutions
-            ) s ON i.incident_number = s.incident_number AND s.rn = 1
-            WHERE i.archived = ?
-            ORDER BY i.last_updated DESC
-        ''', (1 if archived else 0,))
-        incidents = []
-        for row in c.fetchall():
-            # Create a dictionary with explicit column mapping
-            incident = {
-                'number': row[0],  # incident_number as number
-                'description': row[1],
-                'short_description': row[2],
-                'config_item': row[3],
-                'status': row[4],
-                'work_notes': row[5],
-                'last_updated': row[6],
-                'snurl': row[7],
-                'archived': row[8],
-                'resolved_at': row[9],
-                'solution': row[10],
-                'generated_at': row[11],
-                'rag_context': row[12]
-            }
-            if not incident['number']:
-                logger.error("Found incident without number in database")
-                continue
-            logger.debug(f"Retrieved incident from DB: {incident['number']}")
-            incidents.append(incident)
-        return incidents
+            LEFT JOIN solutions s ON s.id = i.latest_solution_id
+            WHERE i.incident_number = ?
+        ''', (incident_number,))
+        row = c.fetchone()
+        rag_context = blobs.get(c.connection, row[7]) if row else None
+    except sqlite3.Error as e:
+        logger.error(f"Database error while retrieving incident details: {str(e)}")
+        return None
+    if row is None:
+        return None
+    return {
+        'number': row[0],
+        'description': row[1],
+        'short_description': row[2],
+        'config_item': row[3],
+        'work_notes': row[4],
+        'solution': row[5],
+        'generated_at': row[6],
+        'rag_context': rag_context,
+        'derived_from': row[8]
+    }
+
+def cached_response(render, mimetype):
+    """
+    Serve a dashboard response from the render cache. It is keyed on the URL and the change
+    counter, so render() (returning the body bytes) only runs after the data changed.
+    """
+    try:
+        key = (request.full_path, render_cache.version(get_db()))
+        entry = render_cache.CACHE.get(key, render, mimetype)
     except sqlite3.Error as e:
         logger.error(f"Database error while retrieving incidents: {str(e)}")
-        return []
-    finally:
-        conn.close()
+        return Response('Incidents are unavailable, try again shortly', status=503, mimetype='text/plain')
+    return render_cache.respond(entry)
 
 @app.route('/')
 def index():
-    """Render main page with active and archived incidents"""
-    try:
-        # Get incidents from ServiceNow
-        incidents = pull_servicenow_incidents(logger)
-        if incidents:
-            # Store them in the database
-            store_incidents(incidents)
-        
-        # Get active and archived incidents from database
-        active_incidents = get_stored_incidents(archived=False)
-        archived_incidents = get_stored_incidents(archived=True)
-        
-        return render_template('index.html', 
-                             active_incidents=active_incidents,
-                             archived_incidents=archived_incidents)
-    except Exception as e:
-        logger.error(f"Error in index route: {str(e)}")
+    """Render the dashboard with the first page of active and archived incident summaries, ?group=<name> filters"""
+    # Only reads the database, the poller keeps it up to date
+    group = request.args.get('group') or None
+
+    def render():
+        active_incidents, active_cursor = get_incident_summaries(archived=False, group=group)
+        archived_incidents, archived_cursor = get_incident_summaries(archived=True, group=group)
         return render_template('index.html', 
-                             active_incidents=[],
-                             archived_incidents=[])
+                             active_page={'incidents': active_incidents, 'next_cursor': active_cursor},
+                             archived_page={'incidents': archived_incidents, 'next_cursor': archived_cursor},
+                             groups=GROUP_NAMES, group=group).encode('utf-8')
+    return cached_response(render, 'text/html')
+
+@app.route('/api/incidents')
+def api_incidents():
+    """Paginated incident summaries: ?archived=1&limit=50&cursor=<next_cursor from the last page>&group=<name>"""
+    archived = request.args.get('archived', '0') in ('1', 'true')
+    group = request.args.get('group') or None
+    try:
+        limit = max(1, min(int(request.args.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE))
+        cursor = request.args.get('cursor') or None
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+
+    def render():
+        incidents, next_cursor = get_incident_summaries(archived=archived, limit=limit, cursor=cursor, group=group)
+        return jsonify({'incidents': incidents, 'next_cursor': next_cursor}).get_data()
+    # Every open dashboard reloads the same page after each poll
+    return cached_response(render, 'application/json')
+
+@app.route('/api/incidents/<incident_number>')
+def api_incident_details(incident_number):
+    """Description, work notes, current solution and RAG context for one incident"""
+    details = get_incident_details(incident_number)
+    if details is None:
+        return jsonify({'error': 'Incident not found'}), 404
+    return jsonify(details)
 
 def get_solution_history(incident_number):
     """Get solution history for an incident"""
@@ -426,17 +856,17 @@ def get_solution_history(incident_number):
     try:
         c = conn.cursor()
         c.execute('''
-            SELECT solution, generated_at, work_notes_snapshot
+            SELECT solution, generated_at, work_notes_hash
             FROM solutions
             WHERE incident_number = ?
             ORDER BY generated_at DESC
         ''', (incident_number,))
-        return c.fetchall()
+        rows = c.fetchall()
+        snapshots = blobs.get_many(conn, [row[2] for row in rows])
+        return [(solution, generated_at, snapshots.get(digest)) for solution, generated_at, digest in rows]
     except sqlite3.Error as e:
         logger.error(f"Database error while getting solution history: {str(e)}")
         return []
-    finally:
-        conn.close()
 
 @app.route('/solution-history/<incident_number>')
 def solution_history(incident_number):
@@ -444,18 +874,198 @@ def solution_history(incident_number):
     solutions = get_solution_history(incident_number)
     return jsonify(solutions)
 
+@app.route('/traces/<incident_number>')
+def incident_traces(incident_number):
+    """Get the pipeline trace spans for an incident"""
+    conn = get_db()
+    try:
+        return jsonify(tracing.get_traces(conn, incident_number))
+    except sqlite3.Error as e:
+        logger.error(f"Database error while getting traces: {str(e)}")
+        return jsonify({'incident_number': incident_number, 'events': [], 'generations': []})
+
+@app.route('/traces/<incident_number>/view')
+def incident_trace_view(incident_number):
+    """Render a waterfall of the pipeline spans for each generation of an incident"""
+    conn = get_db()
+    try:
+        traces = tracing.get_traces(conn, incident_number)
+    except sqlite3.Error as e:
+        logger.error(f"Database error while getting traces: {str(e)}")
+        traces = {'incident_number': incident_number, 'events': [], 'generations': []}
+
+    # Lay each generation out relative to the poll that triggered it (first sighting or change)
+    generations = []
+    for generation in traces['generations']:
+        spans = generation['spans']
+        start = min(s['started_at'] for s in spans)
+        trigger = next((e for e in reversed(traces['events']) if e['started_at'] <= start), None)
+        origin = trigger['started_at'] if trigger else start
+        total = max(max(s['ended_at'] for s in spans) - origin, 0.001)
+        rows = []
+        if trigger:
+            rows.append({'name': trigger['name'], 'offset': 0, 'width': 0, 'duration': 0, 'at': 0})
+        for span in spans:
+            rows.append({
+                'name': span['name'],
+                'offset': round((span['started_at'] - origin) / total * 100, 2),
+                'width': round((span['ended_at'] - span['started_at']) / total * 100, 2),
+                'duration': span['duration'],
+                'at': round(span['started_at'] - origin, 3)
+            })
+        generations.append({
+            'generation_id': generation['generation_id'],
+            'started': datetime.fromtimestamp(origin).strftime('%Y-%m-%d %H:%M:%S'),
+            'total': round(total, 3),
+            'rows': rows
+        })
+
+    return render_template('trace.html', incident_number=incident_number, generations=generations)
+
+@app.route('/search')
+def search_incidents():
+    """Ranked full-text search over incidents and solutions: ?q=<text>&page=1"""
+    query = request.args.get('q', '').strip()
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+        limit = max(1, min(int(request.args.get('limit', SEARCH_PAGE_SIZE)), MAX_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'Invalid page or limit'}), 400
+    try:
+        results, has_more = search.search(get_db(), query, limit=limit, offset=(page - 1) * limit)
+    except sqlite3.Error as e:
+        logger.error(f"Database error while searching: {str(e)}")
+        return jsonify({'error': 'Search failed'}), 500
+    return jsonify({'query': query, 'page': page, 'results': results, 'has_more': has_more})
+
+def webhook_authorized(header):
+    """Constant time check of an `Authorization: Bearer <WEBHOOK_TOKEN>` header"""
+    scheme, _, token = header.partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(token.strip().encode(), WEBHOOK_TOKEN.encode())
+
+def webhook_records(payload):
+    """The incident records of a webhook payload and an error message, one of them None"""
+    if isinstance(payload, dict) and isinstance(payload.get('records', payload.get('result')), list):
+        records = payload.get('records', payload.get('result'))
+    elif isinstance(payload, dict):
+        records = [payload]
+    elif isinstance(payload, list):
+        records = payload
+    else:
+        return None, 'Expected a JSON incident record or a list of them'
+    if not records:
+        return None, 'No records'
+    if len(records) > WEBHOOK_MAX_RECORDS:
+        return None, f'At most {WEBHOOK_MAX_RECORDS} records per request'
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            return None, f'Record {index} is not an object'
+        if not re.fullmatch(r'INC\d+', field_value(record, 'number')):
+            return None, f'Record {index} has no valid incident number'
+        for name, value in record.items():
+            if value is not None and not isinstance(value, (str, int, float, bool, dict)):
+                return None, f'Record {index} field {name} has an unsupported type'
+    return records, None
+
+@app.route('/webhook/servicenow', methods=['POST'])
+def servicenow_webhook():
+    """
+    Incident create / update notifications from a ServiceNow business rule or outbound REST
+    message. Takes one record, a list, or {"records": [...]} in table API format (plain or
+    display values). Incidents the poll would leave out (on hold, pending, resolved, closed,
+    canceled, or in a group that isn't polled) are archived. The rest are stored and queued
+    for generation right away.
+    """
+    if not WEBHOOK_TOKEN:
+        return jsonify({'error': 'Webhook is not configured'}), 404
+    if not webhook_authorized(request.headers.get('Authorization', '')):
+        return jsonify({'error': 'Unauthorized'}), 401
+    records, error = webhook_records(request.get_json(silent=True))
+    if error:
+        return jsonify({'error': error}), 400
+    
+    incidents = []
+    resolved = []
+    for record in records:
+        state = field_value(record, 'state')
+        if state in CLOSED_STATES or state in HELD_STATES:
+            # Left out of the poll as well, no need to look at the rest
+            resolved.append(field_value(record, 'number'))
+            continue
+        incident = normalize_incident(record, logger)
+        stored_incident = get_stored_incident(incident['number'])
+        if stored_incident:
+            # Updates may only carry the fields that changed
+            for field, columns in WEBHOOK_FIELDS.items():
+                if field not in record:
+                    for column in columns:
+                        incident[column] = stored_incident[column]
+        # The same test the poll uses, so the two never disagree about an incident
+        if incident_is_open(incident):
+            incidents.append(incident)
+        else:
+            resolved.append(incident['number'])
+    try:
+        changed = upsert_incidents(incidents, resolved)
+    except Exception as e:
+        logger.error(f"Error storing webhook incidents: {str(e)}")
+        return jsonify({'error': 'Could not store incidents'}), 500
+    
+    # Deliveries that change nothing (e.g. repeated notifications) don't make clients reload
+    if changed:
+        socketio.emit('incidents_updated', {'updated': changed})
+    return jsonify({'stored': len(incidents), 'archived': len(resolved)})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Per-stage latency, error and throughput metrics in Prometheus text format"""
+    try:
+        # The queue may be filled by a poller in another process
+        update_queue_depth(get_db())
+    except sqlite3.Error as e:
+        logger.error(f"Database error while reading queue depth: {str(e)}")
+    return Response(metrics.render(workers=llm_pool.POOL.capacity()), mimetype='text/plain; version=0.0.4')
+
+def start_services(role='all'):
+    """Prepare the database and start the background tasks of this process's role"""
+    logger.info(f"Starting {role} role ({socketio.async_mode} mode)")
+    if role != 'all' and not SOCKETIO_MESSAGE_QUEUE:
+        logger.warning("SOCKETIO_MESSAGE_QUEUE is not set, events won't be relayed between processes")
+    init_db()
+    tracing.start(DB_PATH)
+    
+    if role in ('all', 'worker'):
+        llm_pool.POOL.start_health_checks()
+        socketio.start_background_task(dispatch_jobs)
+    
+    if role in ('all', 'poller'):
+        # Existing solutions are kept, only regenerate what changed while we were down
+        logger.info(f"Queued {queue_stale_incidents()} incidents with missing or stale solutions")
+        socketio.start_background_task(check_for_updates)
+
+def wait_forever():
+    """Keep a process without a web server running while its background tasks work"""
+    while True:
+        socketio.sleep(3600)
+
+def parse_args(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--role', choices=ROLES, default='all',
+                        help="Run everything, or only the web server, the ServiceNow poller or a generation worker")
+    parser.add_argument('--host', default='127.0.0.1', help="Interface to listen on")
+    parser.add_argument('--port', type=int, default=5001, help="Port to listen on")
+    return parser.parse_args()
+
 if __name__ == '__main__':
+    # Development server, use serve.py in production
+    args = parse_args("Run IncidentGPT on the development server.")
     try:
-        logger.info("Starting application")
-        init_db()
-        
-        # Start background task
-        thread = threading.Thread(target=check_for_updates)
-        thread.daemon = True
-        thread.start()
-        
-        # Start web server with SocketIO
-        logger.info("Starting web server on http://127.0.0.1:5001")
-        socketio.run(app, host='127.0.0.1', port=5001, debug=False, allow_unsafe_werkzeug=True)
+        start_services(args.role)
+        if args.role in ('all', 'web'):
+            # Start web server with SocketIO
+            logger.info(f"Starting web server on http://{args.host}:{args.port}")
+            socketio.run(app, host=args.host, port=args.port, debug=False, allow_unsafe_werkzeug=True)
+        else:
+            wait_forever()
     except Exception as e:
         logger.error(f"Startup error: {str(e)}", exc_info=True)
@@ -0,0 +1,183 @@
+"""
+Load test for concurrent dashboard clients. Ramps up Socket.IO connections against a running
+server in steps, holding all of them open, and at each step times new connections and a burst
+of dashboard API requests. The reported capacity is the last step where connection failures
+and API latency stayed within the limits.
+
+The clients are greenlets, so one process can hold thousands of connections. Requires
+`pip install gevent python-socketio[client]`. Usage (from the repository root):
+    python serve.py &    # or python app.py to measure the development server
+    python benchmarks/bench_connections.py --url http://127.0.0.1:5001 --max-clients 2000 --step 250
+"""
+from gevent import monkey
+
+monkey.patch_all()
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+
+import gevent  # noqa: E402
+import requests  # noqa: E402
+import socketio  # noqa: E402
+from gevent.pool import Pool  # noqa: E402
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+
+from bench_pipeline import percentile  # noqa: E402
+
+
+def raise_file_limit():
+    """Every connection is a file descriptor, allow as many as the hard limit."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or hard > soft:
+        target = 65536 if hard == resource.RLIM_INFINITY else hard
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        soft = target
+    return soft
+
+
+class Clients:
+    """The Socket.IO clients held open by the test."""
+
+    def __init__(self, url, transports, timeout):
+        self.url = url
+        self.transports = transports
+        self.timeout = timeout
+        self.connected = []
+        self.events = 0
+
+    def connect_one(self):
+        """Open one client, returns (seconds, error)."""
+        client = socketio.Client(reconnection=False)
+
+        @client.on('incidents_updated')
+        def on_update(data):
+            self.events += 1
+
+        start = time.perf_counter()
+        try:
+            client.connect(self.url, transports=self.transports, wait_timeout=self.timeout)
+        except Exception as e:
+            return time.perf_counter() - start, str(e) or type(e).__name__
+        self.connected.append(client)
+        return time.perf_counter() - start, None
+
+    def grow(self, count, concurrency):
+        pool = Pool(concurrency)
+        results = pool.map(lambda _: self.connect_one(), range(count))
+        return [seconds for seconds, error in results if error is None], [error for _, error in results if error]
+
+    def alive(self):
+        self.connected = [c for c in self.connected if c.connected]
+        return len(self.connected)
+
+    def close(self):
+        gevent.joinall([gevent.spawn(c.disconnect) for c in self.connected], timeout=30)
+
+
+def probe_http(url, requests_count, concurrency, timeout):
+    """A burst of dashboard API calls while the clients are connected, returns (latencies, errors)."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    def fetch(_):
+        start = time.perf_counter()
+        try:
+            response = session.get(f"{url}/api/incidents", params={"limit": 50}, timeout=timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            return time.perf_counter() - start, str(e)
+        return time.perf_counter() - start, None
+
+    results = Pool(concurrency).map(fetch, range(requests_count))
+    return [seconds for seconds, error in results if error is None], [error for _, error in results if error]
+
+
+def summary(values):
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p99_ms": round(percentile(values, 99) * 1000, 1),
+        "max_ms": round(max(values) * 1000, 1) if values else 0.0,
+    }
+
+
+def run(args):
+    transports = None if args.transport == "auto" else [args.transport]
+    clients = Clients(args.url.rstrip('/'), transports, args.timeout)
+    steps = []
+    capacity = 0
+    try:
+        for target in range(args.step, args.max_clients + 1, args.step):
+            connect_times, connect_errors = clients.grow(target - len(clients.connected), args.connect_concurrency)
+            gevent.sleep(args.hold)  # Let the connections settle (and heartbeat) before probing
+            http_times, http_errors = probe_http(args.url.rstrip('/'), args.requests, args.http_concurrency, args.timeout)
+            alive = clients.alive()
+
+            attempted = len(connect_times) + len(connect_errors)
+            failure_rate = len(connect_errors) / attempted if attempted else 0.0
+            http_p99 = percentile(http_times, 99)
+            ok = (failure_rate <= args.max_failure_rate and not http_errors
+                  and alive >= target * (1 - args.max_failure_rate) and http_p99 <= args.latency_slo)
+            step = {
+                "target_clients": target,
+                "connected": alive,
+                "connect": summary(connect_times),
+                "connect_errors": len(connect_errors),
+                "http": summary(http_times),
+                "http_errors": len(http_errors),
+                "within_limits": ok,
+            }
+            if connect_errors or http_errors:
+                step["sample_error"] = (connect_errors or http_errors)[0]
+            steps.append(step)
+            print(json.dumps(step), file=sys.stderr)
+            if not ok:
+                break
+            capacity = alive
+    finally:
+        clients.close()
+    return {"capacity_clients": capacity, "events_received": clients.events, "steps": steps}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ramp concurrent Socket.IO clients and report capacity.")
+    parser.add_argument("--url", default="http://127.0.0.1:5001", help="Server to test")
+    parser.add_argument("--max-clients", type=int, default=2000, help="Stop ramping at this many clients")
+    parser.add_argument("--step", type=int, default=250, help="Clients added per step")
+    parser.add_argument("--transport", choices=("auto", "websocket", "polling"), default="auto",
+                        help="Socket.IO transport, auto starts with polling and upgrades")
+    parser.add_argument("--connect-concurrency", type=int, default=100, help="Connections opened at once")
+    parser.add_argument("--hold", type=float, default=5, help="Seconds to hold each step before probing")
+    parser.add_argument("--requests", type=int, default=200, help="Dashboard API requests per probe")
+    parser.add_argument("--http-concurrency", type=int, default=20, help="Concurrent API requests per probe")
+    parser.add_argument("--timeout", type=float, default=10, help="Seconds before a connect or request fails")
+    parser.add_argument("--max-failure-rate", type=float, default=0.01, help="Connection failures tolerated per step")
+    parser.add_argument("--latency-slo", type=float, default=1.0, help="Highest acceptable API p99 in seconds")
+    parser.add_argument("--json", dest="json_path", help="Also write the report to this JSON file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    report = {"config": vars(args), "file_limit": raise_file_limit()}
+    report.update(run(args))
+    print(json.dumps(report, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Concurrency benchmark for the SQLite layer: dashboard reads running while the poller writes.
+Compares a fresh rollback-journal connection per call (the old get_db) with the tuned,
+per-thread connections from db.py, kept for the thread's life (poller, workers) or returned
+to the pool after every call (web requests), using the app's own schema and queries.
+
+Usage (from the repository root):
+    python benchmarks/bench_db.py --incidents 200 --solutions-per-incident 20 --readers 8 --seconds 10
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.abspath(os.path.join(script_dir, '..'))
+if repo_dir not in sys.path:
+    sys.path.insert(0, repo_dir)
+
+import db
+from bench_pipeline import percentile
+
+SCHEMA = '''
+CREATE TABLE incidents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    incident_number TEXT UNIQUE,
+    description TEXT,
+    short_description TEXT,
+    config_item TEXT,
+    status TEXT,
+    work_notes TEXT,
+    last_updated TEXT,
+    snurl TEXT,
+    archived BOOLEAN DEFAULT 0,
+    resolved_at TEXT,
+    latest_solution_id INTEGER
+);
+CREATE TABLE solutions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    incident_number TEXT,
+    solution TEXT,
+    generated_at TEXT,
+    work_notes_snapshot TEXT,
+    rag_context TEXT,
+    generation_id TEXT
+);
+CREATE INDEX idx_solutions_incident ON solutions (incident_number, generated_at);
+CREATE INDEX idx_incidents_archived ON incidents (archived, last_updated);
+'''
+
+DASHBOARD_QUERY = '''
+    SELECT i.incident_number, i.description, i.short_description, i.config_item, i.status,
+           i.work_notes, i.last_updated, i.snurl, i.archived, i.resolved_at,
+           s.solution, s.generated_at, s.rag_context
+    FROM incidents i
+    LEFT JOIN solutions s ON s.id = i.latest_solution_id
+    WHERE i.archived = ?
+    ORDER BY i.last_updated DESC
+'''
+
+UPSERT = '''
+    INSERT INTO incidents
+    (incident_number, description, short_description, config_item,
+    status, work_notes, last_updated, snurl, archived, resolved_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, NULL)
+    ON CONFLICT(incident_number) DO UPDATE SET
+        work_notes = excluded.work_notes,
+        last_updated = excluded.last_updated
+'''
+
+
+def text(words):
+    return " ".join(random.choice(("printer", "interface", "HL7", "queue", "restart", "timeout", "feed"))
+                    for _ in range(words))
+
+
+def populate(path, incidents, solutions_per_incident):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    for n in range(incidents):
+        number = f"INC{n:07d}"
+        conn.execute(UPSERT, (number, text(60), text(8), "CI", "2", text(200), "2024-01-01 00:00:00", ""))
+        for k in range(solutions_per_incident):
+            cur = conn.execute('''
+                INSERT INTO solutions (incident_number, solution, generated_at, work_notes_snapshot, rag_context)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (number, text(80), f"2024-01-01 00:{k // 60:02d}:{k % 60:02d}", text(200), text(400)))
+        if solutions_per_incident:
+            conn.execute('UPDATE incidents SET latest_solution_id = ? WHERE incident_number = ?', (cur.lastrowid, number))
+    conn.commit()
+    conn.close()
+
+
+def legacy_connection(path):
+    return sqlite3.connect(path, timeout=30)
+
+
+def run(path, mode, readers, seconds, batch):
+    """Readers hammer the dashboard query while one writer upserts poll batches."""
+    if mode == "thread_local":
+        get_conn, release = db.get_connection, lambda conn: None
+    elif mode == "pooled":
+        get_conn, release = db.get_connection, lambda conn: db.release_connections()
+    else:
+        # The old journal mode must be restored, WAL persists in the file
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA journal_mode = DELETE')
+        conn.close()
+        get_conn, release = legacy_connection, lambda conn: conn.close()
+
+    numbers = [row[0] for row in sqlite3.connect(path).execute('SELECT incident_number FROM incidents')]
+    stop = time.time() + seconds
+    read_times, write_times, errors = [], [], []
+    lock = threading.Lock()
+
+    def reader():
+        local = []
+        while time.time() < stop:
+            start = time.perf_counter()
+            try:
+                conn = get_conn(path)
+                conn.execute(DASHBOARD_QUERY, (0,)).fetchall()
+                release(conn)
+            except sqlite3.Error as e:
+                errors.append(str(e))
+            local.append(time.perf_counter() - start)
+        with lock:
+            read_times.extend(local)
+
+    def writer():
+        while time.time() < stop:
+            start = time.perf_counter()
+            try:
+                conn = get_conn(path)
+                now = time.strftime('%Y-%m-%d %H:%M:%S')
+                for number in random.sample(numbers, min(batch, len(numbers))):
+                    conn.execute(UPSERT, (number, "", "", "CI", "2", text(200), now, ""))
+                conn.commit()
+                release(conn)
+            except sqlite3.Error as e:
+                errors.append(str(e))
+            write_times.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)] + [threading.Thread(target=writer)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    def summary(values):
+        return {
+            "count": len(values),
+            "per_sec": round(len(values) / seconds, 1),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+            "max_ms": round(max(values) * 1000, 3) if values else 0.0,
+        }
+
+    return {"reads": summary(read_times), "poll_writes": summary(write_times), "errors": len(errors)}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark dashboard reads during poll writes.")
+    parser.add_argument("--incidents", type=int, default=200, help="Incidents in the database")
+    parser.add_argument("--solutions-per-incident", type=int, default=20, help="Solution history per incident")
+    parser.add_argument("--readers", type=int, default=8, help="Concurrent dashboard reader threads")
+    parser.add_argument("--batch", type=int, default=50, help="Incidents upserted per poll write")
+    parser.add_argument("--seconds", type=float, default=10, help="Duration of each run")
+    parser.add_argument("--json", dest="json_path", help="Also write the report to this JSON file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="incidentgpt-bench-db-")
+    report = {"config": vars(args), "workdir": workdir}
+    for name, mode in (("per_call_connections", "per_call"), ("tuned_thread_local", "thread_local"),
+                       ("tuned_pooled_per_call", "pooled")):
+        path = os.path.join(workdir, f"{name}.db")
+        populate(path, args.incidents, args.solutions_per_incident)
+        report[name] = run(path, mode, args.readers, args.seconds, args.batch)
+
+    print(json.dumps(report, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+End-to-end benchmark of the incident pipeline and the ingest tools, run entirely against the
+local fakes in benchmarks/fakes.py (no ServiceNow, PrivateGPT or GPU box needed).
+
+Usage (from the repository root):
+    python benchmarks/bench_pipeline.py --incidents 50 --polls 3 --tokens-per-sec 40
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.abspath(os.path.join(script_dir, '..'))
+for path in (repo_dir, script_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from fakes import (
+    IncidentCorpus, Latency, FakeServiceNow, FakePrivateGPT, FakeOllama, FakeWiki
+)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def install_credentials(servicenow, privategpt, wiki, ollama_fakes, max_concurrency):
+    """Register a credentials module pointing at the fakes, for both app and tools imports."""
+    credentials = types.ModuleType("credentials")
+    credentials.servicenow_instance = servicenow.url
+    credentials.user = "bench"
+    credentials.password = "bench"
+    credentials.endpoint = f"{servicenow.url}/api/now/table/incident"
+    credentials.WIKIURL = f"{wiki.url}/graphql"
+    credentials.WIKIAPITOKEN = "bench"
+    credentials.PRIVATEGPT_URL = privategpt.url
+    credentials.OLLAMA_HOSTS = [{"url": fake.url, "max_concurrency": max_concurrency} for fake in ollama_fakes]
+
+    package = types.ModuleType("incidentgpt")
+    package.__path__ = [repo_dir]
+    package.credentials = credentials
+    sys.modules["credentials"] = credentials
+    sys.modules["incidentgpt"] = package
+    sys.modules["incidentgpt.credentials"] = credentials
+    return credentials
+
+
+def queue_is_idle(app):
+    with app.queue_lock:
+        if app.active_workers:
+            return False
+    return not app.jobs.counts(app.get_db())
+
+
+def wait_for_queue(app, timeout):
+    """Wait until the solution queue has drained, returns False on timeout."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if queue_is_idle(app):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def bench_app(args, corpus):
+    """Drive poll -> store -> queue -> RAG -> generate -> store and time each solution."""
+    import app
+
+    app.DB_PATH = os.path.join(os.getcwd(), "bench_incidents.db")
+    # The schema persists across restarts now, start each run from an empty database
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(app.DB_PATH + suffix):
+            os.remove(app.DB_PATH + suffix)
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    queued_at = {}
+    solved = []
+    lock = threading.Lock()
+    original_queue = app.queue_solution_generation
+    original_generate = app.generate_and_store_solution
+
+    def timed_queue(incident):
+        with lock:
+            queued_at.setdefault(incident['number'], time.time())
+        return original_queue(incident)
+
+    def timed_generate(incident):
+        result = original_generate(incident)
+        with lock:
+            start = queued_at.pop(incident['number'], None)
+            if start is not None:
+                solved.append(time.time() - start)
+        return result
+
+    app.queue_solution_generation = timed_queue
+    app.generate_and_store_solution = timed_generate
+
+    app.init_db()
+    app.tracing.start(app.DB_PATH)
+    app.socketio.start_background_task(app.dispatch_jobs)
+    poll_times = []
+    timed_out = False
+    start = time.time()
+
+    for poll in range(args.polls):
+        if poll > 0:
+            corpus.add_open(args.new_per_poll)
+            corpus.add_work_notes(args.update_fraction)
+            corpus.resolve(args.resolve_per_poll)
+        poll_start = time.time()
+        app.poll_once()
+        poll_times.append(time.time() - poll_start)
+        if not wait_for_queue(app, args.timeout):
+            timed_out = True
+            break
+
+    elapsed = time.time() - start
+    app.queue_solution_generation = original_queue
+    app.generate_and_store_solution = original_generate
+
+    return {
+        "elapsed_sec": round(elapsed, 3),
+        "solutions": len(solved),
+        "timed_out": timed_out,
+        "throughput_per_min": round(len(solved) / elapsed * 60, 2) if elapsed else 0.0,
+        "time_to_solution_sec": {
+            "p50": round(percentile(solved, 50), 3),
+            "p90": round(percentile(solved, 90), 3),
+            "p99": round(percentile(solved, 99), 3),
+            "max": round(max(solved), 3) if solved else 0.0,
+        },
+        "poll_sec": {
+            "p50": round(percentile(poll_times, 50), 3),
+            "max": round(max(poll_times), 3) if poll_times else 0.0,
+        },
+    }
+
+
+def bench_tools(args, wiki_fake):
+    """Run the ServiceNow and Wiki.js ingest tools against the fakes."""
+    from tools import incident_processor, wiki
+
+    results = {}
+
+    start = time.time()
+    incident_processor.IncidentProcessor().process_incidents()
+    results["incident_processor_sec"] = round(time.time() - start, 3)
+
+    wiki.MANIFEST_PATH = os.path.join(os.getcwd(), "bench_manifest.json")
+    client = wiki.initialize_client()
+    ingest_client = wiki.IngestClient()
+
+    def wiki_run():
+        manifest = wiki.load_manifest()
+        ragdocs = ingest_client.get_doc_info()
+        response = wiki.filter_new_pages(wiki.fetch_pages(client), ingest_client, manifest)
+        run_start = time.time()
+        stats = wiki.ingest_stream(wiki.stream_pages(response, client), manifest, ragdocs, ingest_client)
+        stats["sec"] = round(time.time() - run_start, 3)
+        return stats
+
+    results["wiki_initial"] = wiki_run()
+
+    # Touch a third of the pages without changing content, and edit one section of another third
+    page_ids = sorted(wiki_fake.pages)
+    for page_id in page_ids[::3]:
+        wiki_fake.edit(page_id)
+    for page_id in page_ids[1::3]:
+        content = wiki_fake.pages[page_id]["content"].replace("## Step 2\n", "## Step 2\nUpdated paragraph.\n", 1)
+        wiki_fake.edit(page_id, content=content)
+    results["wiki_incremental"] = wiki_run()
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the incident pipeline against local fakes.")
+    parser.add_argument("--incidents", type=int, default=50, help="Open incidents at the first poll")
+    parser.add_argument("--resolved", type=int, default=500, help="Resolved incidents in the RAG corpus")
+    parser.add_argument("--polls", type=int, default=3, help="Number of poll cycles to run")
+    parser.add_argument("--new-per-poll", type=int, default=5, help="Incidents opened between polls")
+    parser.add_argument("--resolve-per-poll", type=int, default=3, help="Incidents resolved between polls")
+    parser.add_argument("--update-fraction", type=float, default=0.1, help="Fraction of open incidents given a new work note between polls")
+    parser.add_argument("--servicenow-latency", type=float, default=0.2, help="ServiceNow base latency (s)")
+    parser.add_argument("--rag-latency", type=float, default=0.3, help="PrivateGPT /v1/chunks latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Uniform latency jitter added to every fake (s)")
+    parser.add_argument("--prefill-tokens-per-sec", type=float, default=400.0, help="Simulated Ollama prompt processing rate")
+    parser.add_argument("--tokens-per-sec", type=float, default=40.0, help="Simulated Ollama decode rate")
+    parser.add_argument("--output-tokens", type=int, default=120, help="Tokens generated per solution")
+    parser.add_argument("--ollama-parallel", type=int, default=1, help="Parallel slots on each fake Ollama")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="Concurrency ceiling per host for the adaptive limit")
+    parser.add_argument("--ollama-hosts", type=int, default=1, help="Number of fake Ollama hosts in the pool")
+    parser.add_argument("--wiki-pages", type=int, default=30, help="Pages on the fake wiki")
+    parser.add_argument("--skip-tools", action="store_true", help="Only benchmark the app pipeline")
+    parser.add_argument("--timeout", type=float, default=1800, help="Maximum seconds to wait for the queue to drain")
+    parser.add_argument("--json", dest="json_path", help="Also write the report to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Keep application logging on the console")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    corpus = IncidentCorpus(open_count=args.incidents, resolved_count=args.resolved)
+    servicenow = FakeServiceNow(corpus, latency=Latency(args.servicenow_latency, args.jitter)).start()
+    privategpt = FakePrivateGPT(corpus, latency=Latency(0, args.jitter),
+                                chunk_latency=Latency(args.rag_latency)).start()
+    ollama_fakes = [FakeOllama(latency=Latency(0, args.jitter),
+                               prefill_tokens_per_sec=args.prefill_tokens_per_sec,
+                               tokens_per_sec=args.tokens_per_sec,
+                               output_tokens=args.output_tokens,
+                               parallel=args.ollama_parallel).start()
+                    for _ in range(max(1, args.ollama_hosts))]
+    wiki_fake = FakeWiki(page_count=args.wiki_pages, latency=Latency(0.02, args.jitter)).start()
+
+    install_credentials(servicenow, privategpt, wiki_fake, ollama_fakes, args.max_concurrency)
+
+    if args.json_path:
+        args.json_path = os.path.abspath(args.json_path)
+    workdir = tempfile.mkdtemp(prefix="incidentgpt-bench-")
+    os.chdir(workdir)
+
+    report = {"config": vars(args), "workdir": workdir}
+    try:
+        report["pipeline"] = bench_app(args, corpus)
+        if not args.skip_tools:
+            report["tools"] = bench_tools(args, wiki_fake)
+        report["api_calls"] = {
+            "servicenow": dict(servicenow.calls),
+            "privategpt": dict(privategpt.calls),
+            "ollama": [dict(fake.calls) for fake in ollama_fakes],
+            "wiki": dict(wiki_fake.calls),
+        }
+        report["ollama_prompt_tokens"] = [dict(fake.prompt_tokens) for fake in ollama_fakes]
+    finally:
+        for server in [servicenow, privategpt, wiki_fake] + ollama_fakes:
+            server.stop()
+
+    print(json.dumps(report, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,435 @@
+"""
+Local stand-ins for ServiceNow, PrivateGPT, Ollama and Wiki.js, for benchmarking without
+touching production. Each fake is a small threaded HTTP server on 127.0.0.1 with configurable
+latency, counts every call it receives, and serves a synthetic corpus.
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+CONFIG_ITEMS = ["Cerner PowerChart", "Epic Interface Engine", "Cloverleaf", "Rhapsody", "Lab Analyzer Gateway", "Meditech"]
+SYMPTOMS = [
+    "interface queue is backing up and messages are not flowing",
+    "users cannot log in and receive a timeout error",
+    "ADT messages are delayed by more than 30 minutes",
+    "results are not crossing to the downstream system",
+    "the service stopped responding after the overnight patch",
+    "printer mappings are missing for the unit",
+]
+FIXES = [
+    "Restarted the interface engine thread and cleared the stuck message.",
+    "Recycled the application pool and confirmed users could log in.",
+    "Resent the failed batch after correcting the mapping table.",
+    "Rolled back the patch and escalated to the vendor.",
+    "Re-added the printer mappings through the admin console.",
+]
+
+
+class Latency:
+    """Sleeps for a base latency plus uniform jitter (both in seconds)."""
+
+    def __init__(self, base=0.0, jitter=0.0):
+        self.base = base
+        self.jitter = jitter
+
+    def wait(self):
+        delay = self.base + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class IncidentCorpus:
+    """Synthetic open and resolved incidents for one or more assignment groups."""
+
+    def __init__(self, open_count=50, resolved_count=500, groups=("dcebd8cc1b5320d06d418622dd4bcbfe",), seed=1):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.groups = list(groups)
+        self.next_number = 1000000
+        self.open = [self._make_incident(state=self.rng.choice(["1", "2"])) for _ in range(open_count)]
+        self.resolved = [self._make_incident(state=self.rng.choice(["6", "7"])) for _ in range(resolved_count)]
+
+    def _make_incident(self, state):
+        self.next_number += 1
+        ci = self.rng.choice(CONFIG_ITEMS)
+        symptom = self.rng.choice(SYMPTOMS)
+        opened = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time.time() - self.rng.randint(0, 90 * 86400)))
+        return {
+            "sys_id": uuid.UUID(int=self.rng.getrandbits(128)).hex,
+            "number": f"INC{self.next_number:010d}",
+            "assignment_group": self.rng.choice(self.groups),
+            "description": f"{ci}: {symptom}. Reported by the unit clerk, affecting multiple users.",
+            "short_description": f"{ci} - {symptom[:40]}",
+            "opened_at": opened,
+            "resolved_at": opened if state in ("6", "7") else "",
+            "cmdb_ci": ci,
+            "state": state,
+            "work_notes": "",
+            "close_notes": self.rng.choice(FIXES) if state in ("6", "7") else "",
+            "caller_id": "Synthetic Caller",
+            "category": "Software",
+            "assigned_to": "Synthetic Analyst",
+            "resolved_by": "Synthetic Analyst" if state in ("6", "7") else "",
+            "u_email": "caller@example.com",
+        }
+
+    def add_open(self, count=1):
+        """Open new incidents and return them."""
+        with self.lock:
+            created = [self._make_incident(state="1") for _ in range(count)]
+            self.open.extend(created)
+            return created
+
+    def add_work_notes(self, fraction=0.1):
+        """Append a work note to a random fraction of open incidents and return their numbers."""
+        with self.lock:
+            touched = self.rng.sample(self.open, max(1, int(len(self.open) * fraction))) if self.open else []
+            for incident in touched:
+                incident["work_notes"] = (
+                    f"{time.strftime('%Y-%m-%d %H:%M:%S')} - Synthetic Analyst (Work notes)\n"
+                    f"Checked {incident['cmdb_ci']}, still investigating. See also INC{self.rng.randint(1000001, self.next_number):010d}.\n\n"
+                    + incident["work_notes"]
+                )
+            return [incident["number"] for incident in touched]
+
+    def resolve(self, count=1):
+        """Resolve some open incidents and return their numbers."""
+        with self.lock:
+            resolved = self.open[:count]
+            self.open = self.open[count:]
+            for incident in resolved:
+                incident["state"] = "6"
+                incident["close_notes"] = self.rng.choice(FIXES)
+            self.resolved.extend(resolved)
+            return [incident["number"] for incident in resolved]
+
+    def all(self):
+        with self.lock:
+            return self.open + self.resolved
+
+
+class FakeServer:
+    """Base class: a threaded HTTP server with per-route call counting."""
+
+    def __init__(self, latency=None):
+        self.latency = latency or Latency()
+        self.calls = Counter()
+        self.calls_lock = threading.Lock()
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, route):
+        with self.calls_lock:
+            self.calls[route] += 1
+
+    def handle(self, handler, method, path, query, body):
+        """Return (status, headers dict, body bytes or iterable of bytes)."""
+        raise NotImplementedError
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _dispatch(self, method):
+                parsed = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                fake.latency.wait()
+                status, headers, payload = fake.handle(self, method, parsed.path, parse_qs(parsed.query), body)
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                if isinstance(payload, (bytes, bytearray)):
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                else:
+                    # Streamed response using chunked transfer encoding
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for chunk in payload:
+                        self.wfile.write(f"{len(chunk):X}\r\n".encode() + chunk + b"\r\n")
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def do_DELETE(self):
+                self._dispatch("DELETE")
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+
+
+def json_response(data, status=200):
+    return status, {"Content-Type": "application/json"}, json.dumps(data).encode("utf-8")
+
+
+class FakeServiceNow(FakeServer):
+    """ServiceNow table API: GET /api/now/table/incident with display values."""
+
+    def __init__(self, corpus, latency=None):
+        super().__init__(latency)
+        self.corpus = corpus
+
+    @staticmethod
+    def _display(incident, fields):
+        record = dict(incident)
+        record["cmdb_ci"] = {"display_value": incident["cmdb_ci"]}
+        if fields:
+            wanted = {f.strip() for f in fields.split(",")}
+            record = {key: value for key, value in record.items() if key in wanted}
+        return record
+
+    def handle(self, handler, method, path, query, body):
+        if method != "GET" or not path.endswith("/api/now/table/incident"):
+            return json_response({"error": "not found"}, 404)
+
+        sysparm_query = query.get("sysparm_query", [""])[0]
+        fields = query.get("sysparm_fields", [""])[0]
+        limit = int(query.get("sysparm_limit", ["10000"])[0])
+        offset = int(query.get("sysparm_offset", ["0"])[0])
+
+        if "number" in query:
+            self.count("incident_by_number")
+            records = [i for i in self.corpus.all() if i["number"] == query["number"][0]]
+        elif re.search(r"sys_idIN|sys_id=", sysparm_query):
+            self.count("incident_by_sys_id")
+            ids = set(re.findall(r"[0-9a-f]{32}", sysparm_query))
+            records = [i for i in self.corpus.all() if i["sys_id"] in ids]
+        elif "state=6" in sysparm_query or "state=7" in sysparm_query:
+            self.count("resolved_incidents")
+            with self.corpus.lock:
+                records = list(self.corpus.resolved)
+        else:
+            self.count("open_incidents")
+            with self.corpus.lock:
+                records = list(self.corpus.open)
+            groups = re.findall(r"assignment_group(?:=|IN)([0-9a-f,]+)", sysparm_query)
+            if groups:
+                wanted = set(",".join(groups).split(","))
+                records = [i for i in records if i["assignment_group"] in wanted]
+
+        page = records[offset:offset + limit]
+        return json_response({"result": [self._display(i, fields) for i in page]})
+
+
+class FakePrivateGPT(FakeServer):
+    """PrivateGPT: /v1/chunks retrieval and /v1/ingest/{file,list,<doc_id>}."""
+
+    def __init__(self, corpus, latency=None, chunk_latency=None):
+        super().__init__(latency)
+        self.corpus = corpus
+        self.chunk_latency = chunk_latency or Latency()
+        self.documents = {}
+        self.documents_lock = threading.Lock()
+
+    def _record_text(self, incident):
+        return (
+            f"{incident['number']} | {incident['opened_at']}\n"
+            f"Submitted by: {incident['caller_id']} | Resolved by: {incident['resolved_by']}\n"
+            f"---- Problem:\n{incident['cmdb_ci']}\n{incident['short_description']}\n{incident['description']}\n"
+            f"---- Solution:\n{incident['close_notes']}\n\n\n"
+            "--------------------------------------------------------------\n\n\n\n"
+        )
+
+    def handle(self, handler, method, path, query, body):
+        if method == "POST" and path == "/v1/chunks":
+            self.count("chunks")
+            self.chunk_latency.wait()
+            request = json.loads(body or b"{}")
+            limit = request.get("limit", 5)
+            context = request.get("prev_next_chunks", 0)
+            with self.corpus.lock:
+                resolved = list(self.corpus.resolved)
+            words = set(request.get("text", "").lower().split())
+            scored = sorted(
+                resolved,
+                key=lambda i: len(words & set(i["description"].lower().split())),
+                reverse=True
+            )[:limit]
+            data = []
+            for rank, incident in enumerate(scored):
+                neighbours = random.sample(resolved, min(len(resolved), max(0, min(context, 3))))
+                data.append({
+                    "object": "context.chunk",
+                    "score": round(1.0 - rank * 0.05, 3),
+                    "document": {"object": "ingest.document", "doc_id": incident["sys_id"],
+                                 "doc_metadata": {"file_name": "incidents_rag_synthetic.txt"}},
+                    "text": self._record_text(incident),
+                    "previous_texts": [self._record_text(n) for n in neighbours[:1]],
+                    "next_texts": [self._record_text(n) for n in neighbours[1:]],
+                })
+            return json_response({"object": "list", "model": "private-gpt", "data": data})
+
+        if method == "POST" and path == "/v1/ingest/file":
+            self.count("ingest_file")
+            message = BytesParser(policy=default_policy).parsebytes(
+                f"Content-Type: {handler.headers.get('Content-Type')}\r\n\r\n".encode() + body
+            )
+            created = []
+            for part in message.iter_parts():
+                filename = part.get_filename() or "upload"
+                content = part.get_payload(decode=True) or b""
+                # PrivateGPT splits documents into several chunks, each with its own doc_id
+                with self.documents_lock:
+                    for _ in range(max(1, len(content) // 2000 + 1)):
+                        doc_id = str(uuid.uuid4())
+                        self.documents[doc_id] = filename
+                        created.append({"object": "ingest.document", "doc_id": doc_id,
+                                        "doc_metadata": {"file_name": filename}})
+            return json_response({"object": "list", "model": "private-gpt", "data": created})
+
+        if method == "GET" and path == "/v1/ingest/list":
+            self.count("ingest_list")
+            with self.documents_lock:
+                data = [{"object": "ingest.document", "doc_id": doc_id, "doc_metadata": {"file_name": name}}
+                        for doc_id, name in self.documents.items()]
+            return json_response({"object": "list", "model": "private-gpt", "data": data})
+
+        if method == "DELETE" and path.startswith("/v1/ingest/"):
+            self.count("ingest_delete")
+            with self.documents_lock:
+                self.documents.pop(path.rsplit("/", 1)[-1], None)
+            return json_response({})
+
+        return json_response({"error": "not found"}, 404)
+
+
+class FakeOllama(FakeServer):
+    """
+    Ollama /api/generate with simulated prefill and decode rates and a fixed number of
+    parallel slots. Requests beyond the slot count wait, like OLLAMA_NUM_PARALLEL.
+    """
+
+    def __init__(self, latency=None, prefill_tokens_per_sec=400.0, tokens_per_sec=20.0,
+                 output_tokens=120, parallel=1, model="llama3.1:8b-instruct-q4_K_M"):
+        super().__init__(latency)
+        self.model = model
+        self.prefill_tokens_per_sec = prefill_tokens_per_sec
+        self.tokens_per_sec = tokens_per_sec
+        self.output_tokens = output_tokens
+        self.slots = threading.Semaphore(parallel)
+        self.prompt_tokens = Counter()
+
+    @staticmethod
+    def estimate_tokens(text):
+        return max(1, len(text) // 4)
+
+    def handle(self, handler, method, path, query, body):
+        if method == "GET" and path in ("/api/tags", "/api/version", "/api/ps"):
+            self.count(path)
+            models = [{"name": self.model, "model": self.model}]
+            return json_response({"models": models, "version": "0.0.0-fake"})
+        if method != "POST" or path != "/api/generate":
+            return json_response({"error": "not found"}, 404)
+
+        self.count("generate")
+        request = json.loads(body or b"{}")
+        context = request.get("context") or []
+        prompt_tokens = self.estimate_tokens(request.get("prompt", ""))
+        num_predict = (request.get("options") or {}).get("num_predict") or self.output_tokens
+        if num_predict < 0:
+            num_predict = self.output_tokens
+        output_tokens = min(num_predict, self.output_tokens)
+        with self.calls_lock:
+            self.prompt_tokens["evaluated"] += prompt_tokens
+            self.prompt_tokens["reused"] += len(context)
+
+        words = ("Restart the interface engine thread and confirm messages are flowing again. " * 50).split()
+        model = request.get("model", "fake")
+
+        def generate():
+            with self.slots:
+                start = time.time()
+                time.sleep(prompt_tokens / self.prefill_tokens_per_sec)
+                prefill = time.time() - start
+                for index in range(output_tokens):
+                    time.sleep(1.0 / self.tokens_per_sec)
+                    yield {"model": model, "response": words[index % len(words)] + " ", "done": False}
+                yield {
+                    "model": model, "response": "", "done": True, "done_reason": "stop",
+                    "context": list(context) + list(range(prompt_tokens + output_tokens)),
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": int(prefill * 1e9),
+                    "eval_count": output_tokens,
+                    "eval_duration": int((time.time() - start - prefill) * 1e9),
+                    "total_duration": int((time.time() - start) * 1e9),
+                }
+
+        if request.get("stream", True):
+            stream = (json.dumps(part).encode("utf-8") + b"\n" for part in generate())
+            return 200, {"Content-Type": "application/x-ndjson"}, stream
+
+        parts = list(generate())
+        final = dict(parts[-1])
+        final["response"] = "".join(part["response"] for part in parts)
+        return json_response(final)
+
+
+class FakeWiki(FakeServer):
+    """Wiki.js GraphQL: pages.list and pages.single(id) queries."""
+
+    def __init__(self, page_count=50, sections_per_page=6, latency=None, seed=1):
+        super().__init__(latency)
+        rng = random.Random(seed)
+        self.pages = {}
+        for page_id in range(1, page_count + 1):
+            body = "\n\n".join(
+                f"## Step {n}\n{rng.choice(FIXES)} {rng.choice(SYMPTOMS)}." for n in range(1, sections_per_page + 1)
+            )
+            self.pages[page_id] = {
+                "id": page_id, "path": f"runbooks/page-{page_id}", "title": f"Runbook {page_id}",
+                "updatedAt": "2024-01-01T00:00:00.000Z", "content": f"Overview of runbook {page_id}.\n\n{body}",
+            }
+
+    def edit(self, page_id, content=None, updated_at=None):
+        """Change a page's content and/or updatedAt."""
+        page = self.pages[page_id]
+        if content is not None:
+            page["content"] = content
+        page["updatedAt"] = updated_at or time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+
+    def handle(self, handler, method, path, query, body):
+        request = json.loads(body or b"{}")
+        text = request.get("query", "")
+        single = re.search(r"single\(id:\s*(\d+)\)", text)
+        if single:
+            self.count("page_single")
+            page = self.pages.get(int(single.group(1)), {})
+            return json_response({"data": {"pages": {"single": {
+                "content": page.get("content"), "createdAt": page.get("updatedAt"), "updatedAt": page.get("updatedAt")
+            }}}})
+        self.count("page_list")
+        listing = [{key: page[key] for key in ("id", "path", "title", "updatedAt")} for page in self.pages.values()]
+        return json_response({"data": {"pages": {"list": listing}}})
@@ -0,0 +1,183 @@
+"""
+Content-addressed, compressed storage for the large text values attached to solutions (the
+RAG context and the work notes snapshot). Each distinct text is stored once in `blobs`, keyed
+by its SHA-256, and solutions reference it by hash. Regenerations for the same incident mostly
+share their RAG context and notes, so this removes most of the duplication.
+
+Run directly to move inline values of an existing database into blobs and print a size report:
+    python blobs.py --db incidents.db
+"""
+import argparse
+import hashlib
+import json
+import logging
+import sqlite3
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # Optional, zlib is used otherwise
+    zstandard = None
+
+logger = logging.getLogger('incidentgpt.blobs')
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 9
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+) WITHOUT ROWID'''
+
+# solutions column holding inline text -> column holding the blob hash
+INLINE_COLUMNS = {
+    'rag_context': 'rag_context_hash',
+    'work_notes_snapshot': 'work_notes_hash',
+}
+
+
+def create_table(conn):
+    conn.execute(SCHEMA)
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def compress(raw):
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return 'zlib', zlib.compress(raw, ZLIB_LEVEL)
+
+
+def decompress(codec, data):
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Blob is zstd compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == 'raw':
+        return data
+    raise ValueError(f"Unknown blob codec {codec}")
+
+
+def put(conn, text):
+    """Store `text` (if it isn't already) and return its hash. None stays None."""
+    if text is None:
+        return None
+    digest = content_hash(text)
+    if conn.execute('SELECT 1 FROM blobs WHERE hash = ?', (digest,)).fetchone() is None:
+        raw = text.encode('utf-8')
+        codec, data = compress(raw)
+        if len(data) >= len(raw):
+            codec, data = 'raw', raw
+        conn.execute('INSERT OR IGNORE INTO blobs (hash, codec, size, data) VALUES (?, ?, ?, ?)',
+                     (digest, codec, len(raw), data))
+    return digest
+
+
+def get(conn, digest):
+    """The text stored under `digest`, or None."""
+    if digest is None:
+        return None
+    row = conn.execute('SELECT codec, data FROM blobs WHERE hash = ?', (digest,)).fetchone()
+    if row is None:
+        logger.warning(f"Missing blob {digest}")
+        return None
+    return decompress(row[0], row[1]).decode('utf-8')
+
+
+def get_many(conn, digests):
+    """Look up several blobs in one query, returns {hash: text}."""
+    wanted = list({d for d in digests if d})
+    found = {}
+    for start in range(0, len(wanted), 500):
+        chunk = wanted[start:start + 500]
+        rows = conn.execute(f'SELECT hash, codec, data FROM blobs WHERE hash IN ({",".join("?" * len(chunk))})', chunk)
+        for digest, codec, data in rows:
+            found[digest] = decompress(codec, data).decode('utf-8')
+    return found
+
+
+def size_report(conn):
+    """Database size plus how much the solution text takes inline and in blobs."""
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    report = {
+        'database_bytes': conn.execute('PRAGMA page_count').fetchone()[0] * page_size,
+        'free_bytes': conn.execute('PRAGMA freelist_count').fetchone()[0] * page_size,
+    }
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(solutions)')}
+    report['solutions'] = conn.execute('SELECT COUNT(*) FROM solutions').fetchone()[0]
+    for column in INLINE_COLUMNS:
+        if column in columns:
+            report[f'inline_{column}_bytes'] = conn.execute(
+                f'SELECT COALESCE(SUM(LENGTH(CAST({column} AS BLOB))), 0) FROM solutions').fetchone()[0]
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'blobs'").fetchone():
+        count, raw, stored = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM blobs').fetchone()
+        report.update(blobs=count, blob_uncompressed_bytes=raw, blob_stored_bytes=stored)
+    return report
+
+
+def migrate_inline_columns(conn, batch_size=500, commit=True):
+    """
+    Move inline rag_context / work_notes_snapshot values of existing solutions into blobs,
+    then drop the inline columns. Safe to run again, it does nothing once migrated.
+    With commit=False the caller owns the transaction (migrations.py runs it as one step).
+    """
+    create_table(conn)
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(solutions)')}
+    for inline, hashed in INLINE_COLUMNS.items():
+        if hashed not in columns:
+            conn.execute(f'ALTER TABLE solutions ADD COLUMN {hashed} TEXT')
+    present = [column for column in INLINE_COLUMNS if column in columns]
+    if not present:
+        return 0
+
+    moved = 0
+    last_id = 0
+    select = ', '.join(present)
+    while True:
+        rows = conn.execute(f'SELECT id, {select} FROM solutions WHERE id > ? ORDER BY id LIMIT ?',
+                            (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            assignments = {INLINE_COLUMNS[column]: put(conn, value) for column, value in zip(present, row[1:])}
+            conn.execute(f'UPDATE solutions SET {", ".join(f"{c} = ?" for c in assignments)} WHERE id = ?',
+                         list(assignments.values()) + [row[0]])
+        moved += len(rows)
+        last_id = rows[-1][0]
+        if commit:
+            conn.commit()
+
+    for column in present:
+        conn.execute(f'ALTER TABLE solutions DROP COLUMN {column}')
+    if commit:
+        conn.commit()
+    logger.info(f"Moved inline text of {moved} solutions into blobs")
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move inline solution text into compressed blobs.")
+    parser.add_argument('--db', default='incidents.db', help="Path to the SQLite database")
+    parser.add_argument('--no-vacuum', action='store_true', help="Skip the VACUUM that returns freed pages to the OS")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    conn = sqlite3.connect(args.db, timeout=30)
+    before = size_report(conn)
+    migrate_inline_columns(conn)
+    if not args.no_vacuum:
+        conn.execute('VACUUM')
+    after = size_report(conn)
+    conn.close()
+    print(json.dumps({'before': before, 'after': after}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
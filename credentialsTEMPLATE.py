@@ -3,4 +3,28 @@ user = 'snapiuser'
 password = 'snapipassword' 
 endpoint = f'{servicenow_instance}/api/now/table/incident'
 WIKIURL = "https://wiki.js:3443/graphql"
-WIKIAPITOKEN = "wiki.js_token"
\ No newline at end of file
+WIKIAPITOKEN = "wiki.js_token"
+# Optional overrides (defaults are in incidentassist.py)
+# PRIVATEGPT_URL = "https://privategpt.host:8001"
+# OLLAMA_MODEL = "llama3.1:8b-instruct-q4_K_M"
+# ASSIGNMENT_GROUPS = [  # ServiceNow groups to poll and ingest, all sharing one model, queue and dashboard
+#     {"name": "MWS", "sys_id": "dcebd8cc1b5320d06d418622dd4bcbfe"},  # The name is shown in the dashboard group filter
+#     {"name": "Integration", "sys_id": "<sys_user_group sys_id>"},
+# ]
+# INCREMENTAL_REGENERATION = True  # Reuse the previous Ollama context when only work notes change
+# PROMPT_TOKEN_BUDGET = 3000  # Tokens of RAG context, problem and work notes sent to the model
+# NUM_PREDICT = 256  # Maximum tokens generated per solution
+# OLLAMA_HOSTS = [  # Ollama backends to spread generations across, each must have OLLAMA_MODEL pulled
+#     {"url": "http://gpu01:11434", "max_concurrency": 4},  # Ceiling for the adaptive limit, e.g. OLLAMA_NUM_PARALLEL
+#     {"url": "http://gpu02:11434", "max_concurrency": 2},
+# ]
+# DEDUPE_ENABLED = True  # Reuse the solution of a near-identical incident (same CI) solved recently
+# DEDUPE_THRESHOLD = 0.85  # Minimum estimated Jaccard similarity of the descriptions
+# DEDUPE_WINDOW = 1800  # Seconds a solved incident's solution stays reusable
+# SOCKETIO_MESSAGE_QUEUE = "redis://localhost:6379/0"  # Needed when the web, poller and worker roles run as separate processes
+# POLL_MIN_INTERVAL = 60  # Poll interval while incidents are changing, it doubles after each idle, slow or failed poll
+# POLL_MAX_INTERVAL = 600  # Longest interval between polls
+# POLL_JITTER = 0.1  # Random +/- fraction added to each interval
+# WEBHOOK_TOKEN = "long-random-string"  # Enables POST /webhook/servicenow, sent as "Authorization: Bearer <token>"
+# RECONCILE_INTERVAL = 1800  # Seconds between ServiceNow polls while the webhook is enabled
+# INCIDENT_DEADLINE = 900  # Seconds one solution (RAG retrieval, generation, INC links) may take before it is abandoned
@@ -0,0 +1,98 @@
+"""
+SQLite connection management. Each thread uses one connection per database file, set up
+with WAL journaling (readers don't block the poller's writes and vice versa), tuned pragmas
+and a larger prepared statement cache.
+
+Long-lived threads (poller, workers) keep their connection. Web requests run on a new thread
+or greenlet each, so they give theirs back with release_connections() when they end, and the
+next request takes it from a small per-process pool instead of opening and tuning a new one.
+"""
+import logging
+import sqlite3
+import threading
+
+from text_utils import html_to_text
+
+logger = logging.getLogger('incidentgpt.db')
+
+BUSY_TIMEOUT = 30  # Seconds to wait on a locked database
+STATEMENT_CACHE_SIZE = 256  # Prepared statements kept per connection
+POOL_SIZE = 8  # Idle connections kept per database file for the next request
+
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',  # Safe with WAL, only the last commits can be lost on power failure
+    'PRAGMA cache_size = -16000',  # 16 MB page cache per connection
+    'PRAGMA mmap_size = 268435456',  # Memory-map up to 256 MB of the database file
+    'PRAGMA temp_store = MEMORY',
+)
+
+_local = threading.local()
+_idle = {}  # Database path -> idle connections, most recently released last
+_idle_lock = threading.Lock()
+
+
+def connect(path):
+    """Open a new, tuned connection. Most code should use get_connection() instead."""
+    # Pooled connections move between threads, but only one thread uses a connection at a time
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, cached_statements=STATEMENT_CACHE_SIZE,
+                           check_same_thread=False)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    # Used by the full-text search triggers (search.py)
+    conn.create_function('html_to_text', 1, html_to_text, deterministic=True)
+    return conn
+
+
+def get_connection(path):
+    """
+    The calling thread's connection to `path`, taken from the pool or opened on first use.
+    Don't close it, call release_connections() when a short-lived thread is done. Helpers
+    called during a write get the same connection and join its transaction, so whoever starts
+    a write must commit or roll back before returning (an open transaction keeps the lock).
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        with _idle_lock:
+            idle = _idle.get(path)
+            conn = idle.pop() if idle else None
+        if conn is None:
+            logger.debug(f"Opening database connection to {path} for {threading.current_thread().name}")
+            conn = connect(path)
+        connections[path] = conn
+    return conn
+
+
+def release_connections():
+    """Return the calling thread's connections to the pool, e.g. at the end of a web request."""
+    connections = getattr(_local, 'connections', None) or {}
+    for path, conn in connections.items():
+        if conn.in_transaction:
+            # Left open by an error, the next user must not inherit it
+            logger.warning(f"Rolling back a transaction left open on {path}")
+            conn.rollback()
+        with _idle_lock:
+            idle = _idle.setdefault(path, [])
+            if len(idle) < POOL_SIZE:
+                idle.append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+    connections.clear()
+
+
+def close_connections():
+    """Close the calling thread's connections and the idle ones, e.g. before the thread exits or in tests."""
+    connections = getattr(_local, 'connections', None) or {}
+    for conn in connections.values():
+        conn.close()
+    connections.clear()
+    with _idle_lock:
+        for idle in _idle.values():
+            for conn in idle:
+                conn.close()
+        _idle.clear()
+
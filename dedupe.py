@@ -0,0 +1,149 @@
+"""
+Near-duplicate detection for bursts of templated incidents (same CI, same description).
+Incidents are turned into MinHash signatures of their normalized description shingles and
+kept in an LSH index while they are queued and for a while after their solution is stored.
+A new incident that matches one of them closely enough reuses that solution instead of
+going through its own RAG + LLM cycle.
+"""
+import hashlib
+import random
+import re
+import threading
+import time
+
+import credentials
+from text_utils import html_to_text
+
+DEDUPE_ENABLED = getattr(credentials, "DEDUPE_ENABLED", True)
+DEDUPE_THRESHOLD = getattr(credentials, "DEDUPE_THRESHOLD", 0.85)  # Estimated Jaccard similarity to reuse a solution
+DEDUPE_WINDOW = getattr(credentials, "DEDUPE_WINDOW", 1800)  # Seconds a solved incident stays reusable
+
+NUM_PERM = 128  # Hash functions per signature
+BANDS = 16  # LSH bands of NUM_PERM / BANDS rows, candidates from about 0.7 similarity
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3  # Words per shingle
+MIN_SHINGLES = 3  # Shorter texts are too generic to match on
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1)  # Fixed seed, signatures must be comparable across restarts
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def normalize(text):
+    """Lowercase words with numbers collapsed, so timestamps, IPs and counts don't break a match."""
+    text = html_to_text(text or '').lower()
+    text = re.sub(r'\d+', '0', text)
+    return re.findall(r'\w+', text)
+
+
+def shingles(text):
+    words = normalize(text)
+    if len(words) < SHINGLE_SIZE:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _hash(shingle):
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def signature(text):
+    """MinHash signature of the text, or None if it is too short to compare."""
+    values = [_hash(s) for s in shingles(text)]
+    if len(values) < MIN_SHINGLES:
+        return None
+    return tuple(min((a * v + b) % _PRIME for v in values) for a, b in _PERMUTATIONS)
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / NUM_PERM
+
+
+def incident_signature(incident):
+    return signature(f"{incident.get('short_description') or ''} {incident.get('description') or ''}")
+
+
+class Entry:
+    def __init__(self, number, config_item, sig, solution_id=None, solved_at=None):
+        self.number = number
+        self.config_item = (config_item or '').strip().lower()
+        self.signature = sig
+        self.solution_id = solution_id  # None while the incident is still waiting for its solution
+        self.solved_at = solved_at
+
+
+class MinHashIndex:
+    """LSH index of recent incidents. Thread safe."""
+
+    def __init__(self, threshold=DEDUPE_THRESHOLD, window=DEDUPE_WINDOW):
+        self.threshold = threshold
+        self.window = window
+        self.entries = {}
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def _bands(self, sig):
+        return [(band, hash(sig[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+
+    def _remove(self, number):
+        entry = self.entries.pop(number, None)
+        if entry is None:
+            return
+        for key in self._bands(entry.signature):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(number)
+                if not bucket:
+                    del self.buckets[key]
+
+    def _expire(self, now):
+        expired = [n for n, e in self.entries.items() if e.solved_at is not None and now - e.solved_at > self.window]
+        for number in expired:
+            self._remove(number)
+
+    def add(self, number, config_item, sig, solution_id=None, solved_at=None):
+        """Index an incident, pending (no solution_id yet) or solved."""
+        if sig is None:
+            return
+        with self.lock:
+            self._remove(number)
+            self.entries[number] = Entry(number, config_item, sig, solution_id, solved_at)
+            for key in self._bands(sig):
+                self.buckets.setdefault(key, set()).add(number)
+
+    def remove(self, number):
+        with self.lock:
+            self._remove(number)
+
+    def find(self, number, config_item, sig):
+        """
+        The most similar other incident with the same CI above the threshold, as
+        (entry, similarity), or None. Solved incidents win over pending ones.
+        """
+        if sig is None:
+            return None
+        config_item = (config_item or '').strip().lower()
+        with self.lock:
+            self._expire(time.time())
+            candidates = set()
+            for key in self._bands(sig):
+                candidates.update(self.buckets.get(key, ()))
+            best = None
+            for other in candidates - {number}:
+                entry = self.entries[other]
+                if entry.config_item != config_item:
+                    continue
+                score = similarity(sig, entry.signature)
+                if score < self.threshold:
+                    continue
+                rank = (entry.solution_id is not None, score)
+                if best is None or rank > best[0]:
+                    best = (rank, entry, score)
+            return (best[1], best[2]) if best else None
+
+    def __len__(self):
+        return len(self.entries)
+
+
+INDEX = MinHashIndex()
@@ -1,12 +1,76 @@
-import requests
 from requests.auth import HTTPBasicAuth
 import json
 import credentials
 from datetime import datetime
 import difflib
-import ollama
 import logging
 import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import metrics
+import tracing
+import prompt_builder
+import llm_pool
+import resilience
+from text_utils import html_to_text, clean_work_notes
+
+# PrivateGPT and Ollama settings, overridable from credentials.py
+PRIVATEGPT_URL = getattr(credentials, "PRIVATEGPT_URL", "https://wsmwsllm01.healthy.bewell.ca:8001")
+OLLAMA_MODEL = llm_pool.OLLAMA_MODEL
+
+# ServiceNow assignment groups to poll, a list of {"name": ..., "sys_id": ...} in credentials.py.
+# All groups are pulled with one query and share the job queue, dedupe index and context cache.
+# The name is what the dashboard shows and filters on.
+ASSIGNMENT_GROUPS = getattr(credentials, "ASSIGNMENT_GROUPS", None) or [
+    {"name": "MWS", "sys_id": "dcebd8cc1b5320d06d418622dd4bcbfe"}
+]
+GROUP_NAMES = [group["name"] for group in ASSIGNMENT_GROUPS]
+
+# The live pull is paged, so it isn't capped at one request's worth of incidents
+PULL_PAGE_SIZE = 100  # Incidents per ServiceNow request
+PULL_MAX_PAGES = 100  # Stop paging after this many requests
+INCIDENT_FIELDS = "sys_id,number,assignment_group,description,opened_at,short_description,u_email,cmdb_ci,state,work_notes"
+
+# Regenerations reuse the previous generation's context and only send the new work notes
+INCREMENTAL_REGENERATION = getattr(credentials, "INCREMENTAL_REGENERATION", True)
+CONTEXT_REUSE_MAX_TOKENS = 6000  # Fall back to a full prompt before the model's context window fills up
+CONTEXT_CACHE_SIZE = 200  # Incidents whose last generation context is kept in memory
+
+# Prompt parts. The prefix (instructions, RAG context, problem) stays identical between
+# regenerations of an incident, so only the work notes and suffix differ.
+PROMPT_PREFIX = """You are an AI working for a healthcare IT team called the Middleware Services Team (MWS).
+The following are solved/closed tickets that contain possible solutions to this problem.
+
+Context from similar incidents:
+{rag_context}
+
+Current Incident:
+CI: {ci}
+Problem: {description}
+"""
+
+PROMPT_WORK_NOTES = """
+Work Notes History:
+{work_notes}
+
+Based on ALL available information above, determine a concise potential solution.
+If the context is not relevant, answer that you do not know.
+Output only a few sentences or less, with no preamble."""
+
+PROMPT_REGENERATION = """
+
+New work notes have been added to the current incident since your last answer:
+{work_notes_delta}
+
+Based on ALL available information above, including the new work notes, determine a concise potential solution.
+If the context is not relevant, answer that you do not know.
+Output only a few sentences or less, with no preamble."""
+
+# incident number -> {rag_key, rag_sections, prefix_key, prefix, work_notes, context} from the last generation
+_context_cache = OrderedDict()
+_context_cache_lock = threading.Lock()
 
 STATE_MAPPING = {
     "1": "New",
@@ -19,6 +83,53 @@ STATE_MAPPING = {
     "8": "Canceled"
 }
 
+# States (values and display values) after which an incident no longer needs a solution
+CLOSED_STATES = {"6", "7", "8", "Resolved", "Closed", "Canceled"}
+# Not closed, but left out of the live pull as well
+HELD_STATES = {"3", "4", "On Hold", "Pending"}
+
+def field_value(record, name):
+    """A field of a ServiceNow record as text. Reference and display_value=all fields come as {"display_value", "value"} objects."""
+    value = record.get(name)
+    if isinstance(value, dict):
+        return value.get("display_value") or value.get("value") or ""
+    return "" if value is None else str(value)
+
+def group_name(record):
+    """
+    The assignment group of a ServiceNow record: its configured name if it is one of
+    ASSIGNMENT_GROUPS (matched by sys_id or name), else ServiceNow's name. None if missing.
+    """
+    value = record.get("assignment_group")
+    if not value:
+        return None
+    if isinstance(value, dict):
+        # Display value records only carry the sys_id at the end of the reference link
+        link_id = (value.get("link") or "").rstrip("/").rsplit("/", 1)[-1]
+        candidates = {value.get("value"), link_id, value.get("display_value")}
+    else:
+        candidates = {str(value)}
+    for group in ASSIGNMENT_GROUPS:
+        if group["sys_id"] in candidates or group["name"] in candidates:
+            return group["name"]
+    return field_value(record, "assignment_group") or None
+
+def normalize_incident(record, logging):
+    """Turn a ServiceNow incident record (table API result or webhook payload) into the incident dict the app stores."""
+    # Turn \n into <br> for HTML display
+    worknotesbr = field_value(record, "work_notes").replace("\n", "<br>")
+    return {
+        "number": field_value(record, "number"),
+        "description": field_value(record, "description"),
+        "short_description": field_value(record, "short_description"),
+        "config_item": field_value(record, "cmdb_ci"),
+        "status": field_value(record, "state"),
+        "assignment_group": group_name(record),
+        "sys_id": field_value(record, "sys_id") or None,
+        "work_notes": replace_inc_with_url(worknotesbr, logging),
+        "snurl": f"{credentials.servicenow_instance}/nav_to.do?uri=incident.do?sys_id={field_value(record, 'sys_id')}"
+    }
+
 def get_work_notes(sys_id, logging):
     """Gets the work notes for a specific incident."""
     headers = {"Content-Type": "application/json", "Accept": "application/json"}
@@ -31,8 +142,8 @@ def get_work_notes(sys_id, logging):
     try:
         logging.info(f"Fetching work notes for incident {sys_id}")
         # Make the request to ServiceNow API
-        response = requests.get(
-            credentials.endpoint,
+        response = resilience.request(
+            "servicenow", "GET", credentials.endpoint,
             auth=HTTPBasicAuth(credentials.user, credentials.password),
             headers=headers,
             params=params,
@@ -52,10 +163,13 @@ def get_work_notes(sys_id, logging):
     
     return {"work_notes": "", "state": ""}
 
-def get_rag_context(description, ci, logging):
-    """Get relevant context from RAG database"""
+def get_rag_sections(description, ci, logging):
+    """
+    Get the most relevant previous incidents from the RAG database as plain-text sections
+    with their relevance score. Returns None if the RAG API call failed.
+    """
     # PrivateGPT API endpoint
-    url = "https://wsmwsllm01.healthy.bewell.ca:8001/v1/chunks"
+    url = f"{PRIVATEGPT_URL}/v1/chunks"
     headers = {"Content-Type": "application/json"}
     # https://docs.privategpt.dev/api-reference/api-reference/context-chunks/chunks-retrieval
     data = {
@@ -64,187 +178,379 @@ def get_rag_context(description, ci, logging):
         "prev_next_chunks": 20
     }
     
-    try:
-        # Make the request to the RAG API
-        logging.info(f"Fetching RAG context for description: {description[:100]}...")
-        response = requests.post(url, json=data, headers=headers, verify=False)
-        logging.info(f"RAG API response status: {response.status_code}")
+    with metrics.stage("get_rag_context") as stage:
+        try:
+            # Make the request to the RAG API. Chunk retrieval only reads, so it is safe to retry.
+            logging.info(f"Fetching RAG context for description: {description[:100]}...")
+            response = resilience.request("privategpt", "POST", url, json=data, headers=headers, verify=False,
+                                          retries=resilience.RETRY_ATTEMPTS - 1)
+            stage.add_bytes(len(response.content))
+            logging.info(f"RAG API response status: {response.status_code}")
         
-        if response.status_code == 200:
-            returndata = response.json()
-            logging.info(f"RAG API returned {len(returndata.get('data', []))} chunks")
+            if response.status_code == 200:
+                returndata = response.json()
+                logging.info(f"RAG API returned {len(returndata.get('data', []))} chunks")
             
-            finaltext = ""
-            # The response contains a list of chunks which we must combine into a single text block
-            for idx, item in enumerate(returndata.get("data", [])):
-                text = item.get("text", "")
-                previous_texts = item.get("previous_texts", [])
-                next_texts = item.get("next_texts", [])
+                sections = []
+                # The response contains a list of chunks which we must combine into a single text block
+                for item in returndata.get("data", []):
+                    text = item.get("text", "")
+                    previous_texts = item.get("previous_texts", [])
+                    next_texts = item.get("next_texts", [])
                 
-                # Combine text blocks
-                previous_texts = previous_texts or []  # Convert None to empty list
-                next_texts = next_texts or []  # Convert None to empty list
-                combined = "".join(previous_texts[::-1]) + text + "".join(next_texts) # The previous texts are in reverse order
-                # After combining, we need to find the most relevant section since we'll have the beginning/end of other irrelevant incidents in there too. Just a limitation of how the RAG works.
-                relevant = find_most_similar_section(combined, text)
-                # Filter out irrelevant sections based on CI
-                if ci in relevant or ci == "Unknown CI":
-                    finaltext += f"---- {idx+1} ----\n{relevant}\n\n"
+                    # Combine text blocks
+                    previous_texts = previous_texts or []  # Convert None to empty list
+                    next_texts = next_texts or []  # Convert None to empty list
+                    combined = "".join(previous_texts[::-1]) + text + "".join(next_texts) # The previous texts are in reverse order
+                    # After combining, we need to find the most relevant section since we'll have the beginning/end of other irrelevant incidents in there too. Just a limitation of how the RAG works.
+                    relevant = find_most_similar_section(combined, text)
+                    # Filter out irrelevant sections based on CI
+                    if ci in relevant or ci == "Unknown CI":
+                        sections.append({"text": relevant, "score": item.get("score") or 0})
             
-            if not finaltext:
-                logging.warning("RAG context processing resulted in empty text")
-                return "No relevant previous incidents found."
-                
-            logging.info(f"Generated RAG context length: {len(finaltext)} characters")
-            finaltext = replace_inc_with_url(finaltext, logging)  # Replace INCxxxxxxxxx numbers with actual ServiceNow URLs
-            return finaltext.replace("\n", "<br>") # Replace \n with <br> for HTML display
-        else: 
-            logging.error(f"RAG API error: {response.status_code} - {response.text}")
-            return "Error fetching relevant incidents."
-            
-    except Exception as e:
-        logging.error(f"RAG Error: {str(e)}", exc_info=True)
-        return "Error processing relevant incidents."
+                if not sections:
+                    logging.warning("RAG context processing resulted in empty text")
+                else:
+                    logging.info(f"Generated RAG context length: {sum(len(s['text']) for s in sections)} characters")
+                return sections
+            else: 
+                logging.error(f"RAG API error: {response.status_code} - {response.text}")
+                stage.fail()
+                return None
+
+        except resilience.CircuitOpen:
+            # PrivateGPT is down, the solution gets generated without RAG context
+            logging.warning("PrivateGPT is unavailable, skipping RAG context")
+            stage.fail()
+            return None
+        except Exception as e:
+            logging.error(f"RAG Error: {str(e)}", exc_info=True)
+            stage.fail()
+            return None
+
+def format_rag_context(sections, logging):
+    """Format RAG sections as HTML for display, with INC numbers linked to ServiceNow."""
+    if sections is None:
+        return "Error fetching relevant incidents."
+    if not sections:
+        return "No relevant previous incidents found."
+    finaltext = "".join(f"---- {idx+1} ----\n{section['text']}\n\n" for idx, section in enumerate(sections))
+    finaltext = replace_inc_with_url(finaltext, logging)  # Replace INCxxxxxxxxx numbers with actual ServiceNow URLs
+    return finaltext.replace("\n", "<br>") # Replace \n with <br> for HTML display
+
+def get_rag_context(description, ci, logging):
+    """Get relevant context from RAG database, formatted for display"""
+    return format_rag_context(get_rag_sections(description, ci, logging), logging)
 
 def find_most_similar_section(big_string, substring, separator="--------------------------------------------------------------"):
     """Find most relevant section in combined text blocks.
     After doing the RAG API call, we need to find the most relevant section since we'll have the beginning/end of other irrelevant incidents in there too."""
-    sections = big_string.split(separator) # In the dataset, the sections are separated by a long line of dashes
-    max_similarity = 0
-    best_section = None
+    with metrics.stage("find_most_similar_section") as stage:
+        stage.add_bytes(len(big_string))
+        sections = big_string.split(separator) # In the dataset, the sections are separated by a long line of dashes
+        max_similarity = 0
+        best_section = None
     
-    normalized_substring = ' '.join(substring.lower().split())
-    # Normalize the sections by removing extra spaces and converting to lowercase
-    for section in sections:
-        normalized_section = ' '.join(section.lower().split())
-        # Calculate similarity using difflib. Kind of a weird solution but it works and the CPU time is negligible compared to the LLM call.
-        similarity = difflib.SequenceMatcher(None, normalized_substring, normalized_section).ratio()
+        normalized_substring = ' '.join(substring.lower().split())
+        # Normalize the sections by removing extra spaces and converting to lowercase
+        for section in sections:
+            normalized_section = ' '.join(section.lower().split())
+            # Calculate similarity using difflib. Kind of a weird solution but it works and the CPU time is negligible compared to the LLM call.
+            similarity = difflib.SequenceMatcher(None, normalized_substring, normalized_section).ratio()
         
-        if similarity > max_similarity:
-            max_similarity = similarity
-            best_section = section.strip()
+            if similarity > max_similarity:
+                max_similarity = similarity
+                best_section = section.strip()
     
-    return best_section if best_section else "Not found."
+        return best_section if best_section else "Not found."
 
-def generate_solution(incident_number, ci, description, work_notes, rag_context):
-    """Generate new solution using LLM (ollama)"""
+def work_notes_delta(previous, current):
+    """
+    Return the work notes added since `previous`, or None if `current` doesn't simply extend it.
+    ServiceNow lists work notes newest first, so new notes normally appear at the start.
+    """
+    if not previous or current == previous:
+        return None
+    if current.endswith(previous):
+        return current[:-len(previous)].strip() or None
+    if current.startswith(previous):
+        return current[len(previous):].strip() or None
+    return None
+
+def _cached_context(incident_number, prefix_key):
+    with _context_cache_lock:
+        cached = _context_cache.get(incident_number)
+        if cached and cached['prefix_key'] == prefix_key:
+            _context_cache.move_to_end(incident_number)
+            return cached
+    return None
+
+def _rag_key(ci, description):
+    return hashlib.sha256(f"{ci}\n{description.strip()}".encode("utf-8")).hexdigest()
+
+def cached_rag_sections(incident_number, ci, description):
+    """
+    The RAG sections the incident's cached context was built from, if its CI and description
+    are unchanged. Regenerations reuse them, so a different retrieval result (or PrivateGPT
+    being down) doesn't change the prompt prefix and throw the context away. None if there are
+    none to reuse.
+    """
+    with _context_cache_lock:
+        cached = _context_cache.get(incident_number)
+        if cached and cached['rag_key'] == _rag_key(ci, description):
+            return cached['rag_sections']
+    return None
+
+def _store_context(incident_number, rag_key, rag_sections, prefix_key, prefix, work_notes, context):
+    with _context_cache_lock:
+        if context:
+            _context_cache[incident_number] = {'rag_key': rag_key, 'rag_sections': rag_sections,
+                                               'prefix_key': prefix_key, 'prefix': prefix,
+                                               'work_notes': work_notes, 'context': list(context)}
+            _context_cache.move_to_end(incident_number)
+            while len(_context_cache) > CONTEXT_CACHE_SIZE:
+                _context_cache.popitem(last=False)
+        else:
+            # The backend didn't return a context, so there is nothing to reuse next time
+            _context_cache.pop(incident_number, None)
+
+def generate_solution(incident_number, ci, description, work_notes, rag_sections, generation_id=None):
+    """
+    Generate new solution using LLM (ollama). The prompt is plain text assembled within
+    prompt_builder's token budget, `rag_sections` come from get_rag_sections() (None if it
+    failed) or cached_rag_sections().
+    """
     logging.info(f"Generating solution for incident {incident_number}")
-    try:
-        prompt = f"""You are an AI working for a healthcare IT team called the Middleware Services Team (MWS).
-The following are solved/closed tickets that contain possible solutions to this problem.
+    with metrics.stage("generate_solution") as stage:
+        try:
+            with tracing.span(incident_number, generation_id, "prompt_build"):
+                # Work notes are stored as display HTML, the model only needs the text
+                work_notes = clean_work_notes(html_to_text(work_notes))
+                # A failed retrieval isn't kept for reuse, the next generation retrieves again
+                retrieved = rag_sections
+                rag_sections = rag_sections or []
+                prefix, fitted_notes = prompt_builder.fit_prompt(
+                    PROMPT_PREFIX, PROMPT_WORK_NOTES, ci, description.strip(), rag_sections, work_notes)
+                # Keyed on what the prefix is built from rather than its text, which also depends
+                # on the token estimate and so changes whenever the counter is calibrated
+                prefix_key = hashlib.sha256(json.dumps(
+                    [OLLAMA_MODEL, ci, description.strip(), rag_sections], sort_keys=True, default=str
+                ).encode("utf-8")).hexdigest()
 
-Context from similar incidents:
-{rag_context}
+                # If only new work notes were added, continue from the previous generation's
+                # context so the model doesn't re-process the whole prompt
+                context = None
+                cached = _cached_context(incident_number, prefix_key) if INCREMENTAL_REGENERATION else None
+                if cached:
+                    # The prefix text the cached context was built from
+                    prefix = cached['prefix']
+                delta = work_notes_delta(cached['work_notes'], work_notes) if cached else None
+                if delta and len(cached['context']) + len(delta) // 3 < CONTEXT_REUSE_MAX_TOKENS:
+                    context = cached['context']
+                    prompt = PROMPT_REGENERATION.format(work_notes_delta=prompt_builder.fit_work_notes(
+                        delta, int(prompt_builder.PROMPT_TOKEN_BUDGET * prompt_builder.WORK_NOTES_SHARE)))
+                else:
+                    prompt = prefix + PROMPT_WORK_NOTES.format(work_notes=fitted_notes)
+            mode = "incremental" if context else "full"
 
-Current Incident:
-CI: {ci}
-Problem: {description}
+            # Stream the response so time to first token can be traced. If the backend fails
+            # part way through, the pool retries the whole request on another host.
+            def stream(backend):
+                parts = []
+                final = {}
+                first_token = False
+                for chunk in backend.client.generate(
+                    model=OLLAMA_MODEL,
+                    prompt=prompt,
+                    context=context,
+                    keep_alive="120m",
+                    options={"num_predict": prompt_builder.NUM_PREDICT},
+                    stream=True
+                ):
+                    # Stop mid-stream once the incident's deadline has passed
+                    resilience.check_deadline()
+                    if chunk.get('response'):
+                        if not first_token:
+                            first_token = True
+                            tracing.record(incident_number, generation_id, "first_token", time.time(), backend=backend.url)
+                        parts.append(chunk['response'])
+                    if chunk.get('done'):
+                        final = chunk
+                return parts, final
 
-Work Notes History:
-{work_notes}
+            started_at = time.time()
+            parts, final = llm_pool.POOL.run(stream, count_tokens=lambda result: result[1].get('eval_count') or 0)
+            finished_at = time.time()
 
-Based on ALL available information above, determine a concise potential solution.
-If the context is not relevant, answer that you do not know.
-Output only a few sentences or less, with no preamble."""
+            if not context:
+                prompt_builder.COUNTER.calibrate(prompt, final.get('prompt_eval_count'))
+            prefill_saved = len(context) if context else 0
+            metrics.REGENERATIONS.inc(mode=mode)
+            metrics.PREFILL_TOKENS_SAVED.inc(prefill_saved)
+            if context:
+                logging.info(f"Incremental regeneration for {incident_number}: reused {prefill_saved} context tokens, "
+                             f"prefilled {final.get('prompt_eval_count')} new tokens")
 
-        response = ollama.generate(
-            model="llama3.1:8b-instruct-q4_K_M",
-            prompt=prompt,
-            keep_alive="120m"
-        )
+            tracing.record(incident_number, generation_id, "last_token", finished_at)
+            tracing.record(incident_number, generation_id, "generation", started_at, finished_at,
+                           mode=mode, prefill_tokens_saved=prefill_saved,
+                           prompt_tokens=final.get('prompt_eval_count'), completion_tokens=final.get('eval_count'))
+
+            solution = "".join(parts)
+            stage.add_tokens("prompt", final.get('prompt_eval_count') or 0)
+            stage.add_tokens("completion", final.get('eval_count') or 0)
+            stage.add_bytes(len(solution))
+
+            if final and INCREMENTAL_REGENERATION:
+                _store_context(incident_number, _rag_key(ci, description), retrieved, prefix_key, prefix,
+                               work_notes, final.get('context'))
         
-        return response.get('response', 'Failed to generate solution')
-    except Exception as e:
-        logging.error(f"Solution Generation Error: {str(e)}")
-        return "Failed to generate solution"
+            return solution if final else 'Failed to generate solution'
+        except (resilience.DeadlineExceeded, llm_pool.NoBackendAvailable):
+            # Nothing to store, the incident is queued again by the next poll
+            stage.fail()
+            raise
+        except Exception as e:
+            logging.error(f"Solution Generation Error: {str(e)}")
+            stage.fail()
+            return "Failed to generate solution"
     
-def pull_servicenow_incidents(logging):
-    """Pulls unresolved incidents from ServiceNow."""
+def get_incident_page(params, logging, stage_name="poll"):
+    """One request to the ServiceNow incident table. Returns the records, or None if it failed."""
     headers = {"Content-Type": "application/json", "Accept": "application/json"}
-    params = {
-        "sysparm_limit": 50,
-        "sysparm_display_value": True,
-        "sysparm_fields": "sys_id,number,assignment_group,description,opened_at,short_description,u_email,cmdb_ci,state,work_notes",
-        "sysparm_query": "assignment_group=dcebd8cc1b5320d06d418622dd4bcbfe^stateNOT IN3,4,6,7,8^ORDERBYDESCopened_at"
-    }
-    
-    try:
-        start_time = datetime.now()
-        logging.info(f"Making ServiceNow API request to: {credentials.endpoint}")
-        logging.info(f"Using assignment group: dcebd8cc1b5320d06d418622dd4bcbfe")
-        logging.info(f"Query parameters:\n{json.dumps(params, indent=2)}")
-        
-        response = requests.get(
-            credentials.endpoint,
-            auth=HTTPBasicAuth(credentials.user, credentials.password),
-            headers=headers,
-            params=params,
-        )
-        
-        api_time = datetime.now() - start_time
-        logging.info(f"ServiceNow API response time: {api_time.total_seconds():.2f}s")
-        #logging.info(f"Response status code: {response.status_code}")
-        #logging.info(f"Response headers:\n{json.dumps(dict(response.headers), indent=2)}")
-        
-        if response.status_code == 200:
-            result = response.json()["result"]
-            logging.info(f"Retrieved {len(result)} incidents from ServiceNow")
-            
-            incidents = []
-            for incident in result:
-                # Debug raw incident data
-                #logging.info(f"\nRaw incident data: {json.dumps(incident, indent=2)}")
-                
-                incident_number = incident.get("number")
-                if not incident_number:
-                    logging.error("Skipping incident with missing number")
-                    continue
-                    
-                state = incident.get("state", "")
-                status_text = STATE_MAPPING.get(state, "Unknown")
-                
-                logging.info(f"\nProcessing Incident: {incident_number}")
-                logging.info(f"Raw number field: {incident.get('number', 'NOT FOUND')}")
-                logging.info(f"Status: {status_text} (state: {state})")
-                logging.info(f"Short Description: {incident.get('short_description', '')}")
-                logging.info(f"Config Item: {incident.get('cmdb_ci', {}).get('display_value', '')}")
-                logging.info(f"Work Notes Length: {len(incident.get('work_notes', ''))}")
-                
-                # Turn \n into <br> for HTML display
-                worknotesbr = incident.get("work_notes", "").replace("\n", "<br>")
-                worknotesbrlinks = replace_inc_with_url(worknotesbr, logging)
-
-                # Create incident dictionary with validated number
-                incident_data = {
-                    "number": incident_number,  # Validated number
-                    "description": incident.get("description", ""),
-                    "short_description": incident.get("short_description", ""),
-                    "config_item": incident.get("cmdb_ci", {}).get("display_value", ""),
-                    "status": state,  # Store text state value
-                    "work_notes": worknotesbrlinks,
-                    "snurl": f"{credentials.servicenow_instance}/nav_to.do?uri=incident.do?sys_id={incident.get('sys_id')}"
-                }
-                
-                # Log the complete incident data for debugging
-                logging.debug(f"Adding incident with data: {json.dumps(incident_data, indent=2)}")
-                incidents.append(incident_data)
-            
-            total_time = datetime.now() - start_time
-            logging.info(f"\nTotal processing time: {total_time.total_seconds():.2f}s")
-            logging.info("Incident pull completed successfully")
-            return incidents
-            
-        else:
+    with metrics.stage(stage_name) as stage:
+        try:
+            start_time = datetime.now()
+            logging.info(f"Query parameters:\n{json.dumps(params, indent=2)}")
+            response = resilience.request(
+                "servicenow", "GET", credentials.endpoint,
+                auth=HTTPBasicAuth(credentials.user, credentials.password),
+                headers=headers,
+                params=params,
+            )
+            stage.add_bytes(len(response.content))
+            api_time = datetime.now() - start_time
+            logging.info(f"ServiceNow API response time: {api_time.total_seconds():.2f}s")
+
+            if response.status_code == 200:
+                return response.json()["result"]
             logging.error(f"ServiceNow API Error:")
             logging.error(f"Status Code: {response.status_code}")
             logging.error(f"Response Headers: {json.dumps(dict(response.headers), indent=2)}")
             logging.error(f"Response Body: {response.text}")
-            
-    except Exception as e:
-        logging.error("ServiceNow API Error:", exc_info=True)
-        logging.error(f"Error Details: {str(e)}")
-    
-    return []
+            stage.fail()
+
+        except resilience.CircuitOpen:
+            logging.warning("ServiceNow is unavailable, skipping the request")
+            stage.fail()
+        except Exception as e:
+            logging.error("ServiceNow API Error:", exc_info=True)
+            logging.error(f"Error Details: {str(e)}")
+            stage.fail()
+    return None
+
+def pull_servicenow_incidents(logging, on_page=None):
+    """
+    Pulls the unresolved incidents of ASSIGNMENT_GROUPS from ServiceNow, PULL_PAGE_SIZE per
+    request. Each page is handed to on_page(incidents) as soon as it arrives. Returns all the
+    incidents, or None if a request failed (the pages before it were already handed on).
+    """
+    params = {
+        "sysparm_limit": PULL_PAGE_SIZE,
+        "sysparm_display_value": True,
+        "sysparm_no_count": "true",
+        "sysparm_fields": INCIDENT_FIELDS,
+        # Every configured group in one query. Oldest first, so incidents opened during the
+        # pull land on the last page instead of shifting the pages still to come.
+        "sysparm_query": f"assignment_groupIN{','.join(group['sys_id'] for group in ASSIGNMENT_GROUPS)}"
+                         "^stateNOT IN3,4,6,7,8^ORDERBYopened_at^ORDERBYsys_id"
+    }
+
+    start_time = datetime.now()
+    logging.info(f"Making ServiceNow API request to: {credentials.endpoint}")
+    logging.info(f"Using assignment groups: {', '.join(GROUP_NAMES)}")
+    incidents = []
+    seen = set()
+    for page in range(PULL_MAX_PAGES):
+        params["sysparm_offset"] = page * PULL_PAGE_SIZE
+        result = get_incident_page(params, logging)
+        if result is None:
+            return None
+        logging.info(f"Retrieved {len(result)} incidents from ServiceNow (page {page + 1})")
+
+        page_incidents = []
+        for incident in result:
+            # Debug raw incident data
+            #logging.info(f"\nRaw incident data: {json.dumps(incident, indent=2)}")
+
+            incident_number = incident.get("number")
+            if not incident_number:
+                logging.error("Skipping incident with missing number")
+                continue
+            if incident_number in seen:
+                # Pushed onto this page by a change between requests
+                continue
+            seen.add(incident_number)
+
+            state = incident.get("state", "")
+            status_text = STATE_MAPPING.get(state, "Unknown")
+
+            logging.info(f"\nProcessing Incident: {incident_number}")
+            logging.info(f"Raw number field: {incident.get('number', 'NOT FOUND')}")
+            logging.info(f"Status: {status_text} (state: {state})")
+            logging.info(f"Short Description: {incident.get('short_description', '')}")
+            logging.info(f"Config Item: {incident.get('cmdb_ci', {}).get('display_value', '')}")
+            logging.info(f"Work Notes Length: {len(incident.get('work_notes', ''))}")
+
+            # Same conversion as the webhook uses
+            incident_data = normalize_incident(incident, logging)
+
+            # Log the complete incident data for debugging
+            logging.debug(f"Adding incident with data: {json.dumps(incident_data, indent=2)}")
+            page_incidents.append(incident_data)
+
+        if on_page and page_incidents:
+            on_page(page_incidents)
+        incidents.extend(page_incidents)
+        if len(result) < PULL_PAGE_SIZE:
+            break
+    else:
+        logging.warning(f"Stopped the incident pull after {PULL_MAX_PAGES} pages")
+
+    total_time = datetime.now() - start_time
+    logging.info(f"\nTotal processing time: {total_time.total_seconds():.2f}s")
+    logging.info("Incident pull completed successfully")
+    return incidents
+
+def get_incident_records(sys_ids, logging):
+    """
+    The current ServiceNow records (same fields as the pull) of the given incidents. Incidents
+    that no longer exist are left out. Returns None if a request failed.
+    """
+    records = []
+    sys_ids = list(sys_ids)
+    for start in range(0, len(sys_ids), PULL_PAGE_SIZE):
+        batch = sys_ids[start:start + PULL_PAGE_SIZE]
+        result = get_incident_page({
+            "sysparm_limit": len(batch),
+            "sysparm_display_value": True,
+            "sysparm_no_count": "true",
+            "sysparm_fields": INCIDENT_FIELDS,
+            "sysparm_query": f"sys_idIN{','.join(batch)}",
+        }, logging, stage_name="state_check")
+        if result is None:
+            return None
+        records.extend(result)
+    return records
+
+def incident_is_open(incident):
+    """True if an incident from normalize_incident() belongs in the live pull: one of ASSIGNMENT_GROUPS and not on hold or closed."""
+    status = incident["status"]
+    return status not in CLOSED_STATES and status not in HELD_STATES and incident.get("assignment_group") in GROUP_NAMES
+
+def is_open(record):
+    """incident_is_open() for a raw ServiceNow record."""
+    return incident_is_open({"status": field_value(record, "state"), "assignment_group": group_name(record)})
 
 def get_id_from_inc(subject, logging):
     """ServiceNow doesn't use the INC____ in the URLs, there's a different unique identifier. This pulls that 'sys_id' for the incident."""
@@ -258,22 +564,32 @@ def get_id_from_inc(subject, logging):
     }
     print(f"Pulling in sys_id for {subject}...")
     logging.info(f"Pulling in sys_id for {subject}...")
-    response = requests.get(
-        credentials.endpoint,
-        auth=HTTPBasicAuth(credentials.user, credentials.password),
-        headers=headers,
-        params=params,
-    )
-    if response.status_code == 200:
-        incidents = response.json()["result"]
-        if len(incidents) == 1:
-            incident = incidents[0]
-            return incident.get("sys_id")
+    with metrics.stage("sys_id_resolution") as stage:
+        try:
+            response = resilience.request(
+                "servicenow", "GET", credentials.endpoint,
+                auth=HTTPBasicAuth(credentials.user, credentials.password),
+                headers=headers,
+                params=params,
+            )
+        except Exception as e:
+            # Leave the number unlinked rather than fail the whole text
+            stage.fail()
+            logging.warning(f"Could not look up sys_id for {subject}: {str(e)}")
+            return "na"
+        stage.add_bytes(len(response.content))
+        if response.status_code == 200:
+            incidents = response.json()["result"]
+            if len(incidents) == 1:
+                incident = incidents[0]
+                return incident.get("sys_id")
+            else:
+                return "na"
         else:
+            stage.fail()
+            print(f"Error: {response.status_code} - {response.text}")
+            logging.error(f"Error: {response.status_code} - {response.text}")
             return "na"
-    else:
-        print(f"Error: {response.status_code} - {response.text}")
-        logging.error(f"Error: {response.status_code} - {response.text}")
 
 
 def replace_inc_with_url(text, logging):
@@ -0,0 +1,134 @@
+"""
+Solution generation jobs, kept in the database so the poller, the generation workers and the
+web server can run as separate processes. The poller enqueues, workers claim jobs atomically
+and delete them when done. A worker refreshes the heartbeat of the jobs it is running, and
+jobs whose worker stopped heart-beating are handed out again.
+
+Job status is 'queued', 'running', or 'waiting' for a near-duplicate's solution (dedupe.py).
+"""
+import json
+import os
+import socket
+import time
+
+JOB_LEASE = 120  # Seconds without a heartbeat before a running job is considered abandoned
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        incident_number TEXT NOT NULL,
+        generation_id TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        wait_for TEXT,
+        worker TEXT,
+        enqueued_at REAL,
+        started_at REAL,
+        heartbeat_at REAL,
+        attempts INTEGER NOT NULL DEFAULT 0
+    )''',
+    # At most one queued job per incident, enqueue() relies on it to skip duplicates
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_queued ON jobs (incident_number) WHERE status = 'queued'",
+    'CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, incident_number)',
+    'CREATE INDEX IF NOT EXISTS idx_jobs_wait_for ON jobs (wait_for) WHERE wait_for IS NOT NULL',
+)
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def create_table(conn):
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+
+def enqueue(conn, incident, generation_id):
+    """Queue a generation unless the incident already has a queued job. Returns True if queued."""
+    cur = conn.execute('''
+        INSERT OR IGNORE INTO jobs (incident_number, generation_id, payload, status, enqueued_at)
+        VALUES (?, ?, ?, 'queued', ?)
+    ''', (incident['number'], generation_id, json.dumps(incident), time.time()))
+    return cur.rowcount > 0
+
+
+def wait(conn, incident, generation_id, source_number, similarity):
+    """Park an incident until `source_number` has a solution it can reuse."""
+    conn.execute('''
+        INSERT INTO jobs (incident_number, generation_id, payload, status, wait_for, enqueued_at)
+        VALUES (?, ?, ?, 'waiting', ?, ?)
+    ''', (incident['number'], generation_id, json.dumps(dict(incident, similarity=similarity)), source_number,
+          time.time()))
+
+
+def claim(conn, worker=WORKER_ID):
+    """
+    Atomically take the oldest queued job whose incident isn't already being generated.
+    Returns (job_id, incident) with the generation id in the incident, or None.
+    """
+    now = time.time()
+    row = conn.execute('''
+        UPDATE jobs SET status = 'running', worker = ?, started_at = ?, heartbeat_at = ?, attempts = attempts + 1
+        WHERE id = (
+            SELECT j.id FROM jobs j
+            WHERE j.status = 'queued' AND NOT EXISTS (
+                SELECT 1 FROM jobs r WHERE r.incident_number = j.incident_number AND r.status = 'running'
+            )
+            ORDER BY j.id LIMIT 1
+        )
+        RETURNING id, generation_id, payload
+    ''', (worker, now, now)).fetchone()
+    if row is None:
+        return None
+    incident = dict(json.loads(row[2]), generation_id=row[1])
+    return row[0], incident
+
+
+def finish(conn, job_id):
+    conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+
+
+def heartbeat(conn, job_ids):
+    if job_ids:
+        conn.execute(f'UPDATE jobs SET heartbeat_at = ? WHERE id IN ({",".join("?" * len(job_ids))})',
+                     [time.time()] + list(job_ids))
+
+
+def requeue_abandoned(conn, lease=JOB_LEASE):
+    """Put running jobs of dead workers back in the queue, returns how many."""
+    cutoff = time.time() - lease
+    # OR IGNORE: an incident that was queued again in the meantime keeps that job instead
+    count = conn.execute('''
+        UPDATE OR IGNORE jobs SET status = 'queued', worker = NULL
+        WHERE status = 'running' AND heartbeat_at < ?
+    ''', (cutoff,)).rowcount
+    conn.execute("DELETE FROM jobs WHERE status = 'running' AND heartbeat_at < ?", (cutoff,))
+    return count
+
+
+def take_waiting(conn, source_number):
+    """Remove and return the incidents waiting for `source_number`, each with its 'similarity'."""
+    rows = conn.execute('''
+        DELETE FROM jobs WHERE status = 'waiting' AND wait_for = ?
+        RETURNING generation_id, payload
+    ''', (source_number,)).fetchall()
+    return [dict(json.loads(payload), generation_id=generation_id) for generation_id, payload in rows]
+
+
+def release_orphans(conn):
+    """Queue waiting incidents whose near-duplicate has no job any more (e.g. its worker died)."""
+    orphaned = '''status = 'waiting' AND wait_for NOT IN (
+        SELECT incident_number FROM jobs WHERE status IN ('queued', 'running')
+    )'''
+    count = conn.execute(f"UPDATE OR IGNORE jobs SET status = 'queued', wait_for = NULL WHERE {orphaned}").rowcount
+    conn.execute(f'DELETE FROM jobs WHERE {orphaned}')
+    return count
+
+
+def is_pending(conn, incident_number, statuses=('queued', 'running', 'waiting')):
+    return conn.execute(f'''
+        SELECT 1 FROM jobs WHERE incident_number = ? AND status IN ({",".join("?" * len(statuses))}) LIMIT 1
+    ''', (incident_number,) + tuple(statuses)).fetchone() is not None
+
+
+def counts(conn):
+    """Number of jobs per status."""
+    return dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
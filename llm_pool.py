@@ -0,0 +1,249 @@
+"""
+Pool of Ollama generation backends. Each host has its own concurrency limit. Requests go to
+the healthy host with the fewest outstanding requests relative to its limit. A host that
+fails is marked down and the request is retried on another one, and a background health
+check brings hosts back once they answer again.
+"""
+import logging
+import os
+import statistics
+import threading
+import time
+
+import ollama
+
+import credentials
+import metrics
+import resilience
+
+logger = logging.getLogger('incidentgpt.llm_pool')
+
+OLLAMA_MODEL = getattr(credentials, "OLLAMA_MODEL", "llama3.1:8b-instruct-q4_K_M")
+# List of {"url": ..., "max_concurrency": ...} in credentials.py, every host must serve OLLAMA_MODEL.
+# max_concurrency is the most requests a host gets at once (set it to OLLAMA_NUM_PARALLEL),
+# the actual limit adapts between 1 and that. Defaults to the local Ollama (or OLLAMA_HOST).
+OLLAMA_HOSTS = getattr(credentials, "OLLAMA_HOSTS", None) or [
+    {"url": os.environ.get("OLLAMA_HOST") or "http://127.0.0.1:11434", "max_concurrency": 4}
+]
+HEALTH_CHECK_INTERVAL = 30  # Seconds between health checks
+HEALTH_CHECK_TIMEOUT = 5  # Seconds before a health check counts as failed
+REQUEST_TIMEOUT = 600  # Seconds without data from a host before a generation request is abandoned
+ACQUIRE_TIMEOUT = 900  # Seconds to wait for a free backend before giving up
+
+# Adaptive concurrency (AIMD) per backend
+ADAPT_MIN_SAMPLES = 4  # Completed requests per evaluation window (at least 2x the current limit)
+THROUGHPUT_GAIN = 1.05  # Aggregate tokens/sec must beat the last window by this factor to raise the limit
+LATENCY_TOLERANCE = 1.5  # Back off when per-token latency exceeds the best seen by this factor
+DECREASE_FACTOR = 0.7  # Multiplicative decrease on latency degradation or failure
+
+
+class NoBackendAvailable(Exception):
+    """Raised when no healthy backend frees up in time, or every backend failed the request."""
+
+
+class ConcurrencyLimit:
+    """
+    AIMD concurrency limit for one backend. Every window of completed requests compares the
+    aggregate token throughput with the previous window and the per-token latency with the
+    best seen. The limit goes up by one while throughput keeps improving with the backend
+    saturated, and is cut multiplicatively when latency degrades or a request fails.
+    A window with less throughput than the one before steps the limit back down by one.
+    Not thread safe on its own, the pool calls it under its lock.
+    """
+
+    def __init__(self, maximum, initial=1):
+        self.maximum = maximum
+        self.limit = min(initial, maximum)
+        self.best_latency = None
+        self.last_throughput = None
+        self.reset_window()
+
+    def reset_window(self):
+        self.window_start = time.monotonic()
+        self.window_tokens = 0
+        self.window_latencies = []
+        self.saturated = False
+
+    def on_acquire(self, outstanding):
+        if outstanding >= self.limit:
+            self.saturated = True
+
+    def on_success(self, tokens, seconds):
+        self.window_tokens += tokens
+        self.window_latencies.append(seconds / max(1, tokens))
+        if len(self.window_latencies) >= max(ADAPT_MIN_SAMPLES, 2 * self.limit):
+            self.evaluate()
+
+    def on_failure(self):
+        self.decrease()
+
+    def evaluate(self):
+        elapsed = max(time.monotonic() - self.window_start, 1e-6)
+        throughput = self.window_tokens / elapsed
+        latency = statistics.median(self.window_latencies)
+        # Let the baseline drift up slowly so one lucky window doesn't pin it forever
+        self.best_latency = latency if self.best_latency is None else min(latency, self.best_latency * 1.02)
+
+        if latency > self.best_latency * LATENCY_TOLERANCE:
+            self.decrease()
+        elif self.saturated and (self.last_throughput is None or throughput > self.last_throughput * THROUGHPUT_GAIN):
+            self.limit = min(self.maximum, self.limit + 1)
+        elif self.saturated and throughput * THROUGHPUT_GAIN < self.last_throughput:
+            # The last increase didn't pay off, step back
+            self.limit = max(1, self.limit - 1)
+        self.last_throughput = throughput
+        self.reset_window()
+
+    def decrease(self):
+        self.limit = max(1, int(self.limit * DECREASE_FACTOR))
+        self.reset_window()
+
+
+class Backend:
+    """One Ollama host."""
+
+    def __init__(self, url, max_concurrency=1):
+        self.url = url
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.concurrency = ConcurrencyLimit(self.max_concurrency)
+        self.client = ollama.Client(host=url, timeout=REQUEST_TIMEOUT)
+        self.health_client = ollama.Client(host=url, timeout=HEALTH_CHECK_TIMEOUT)
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+
+    def load(self):
+        return self.outstanding / self.concurrency.limit
+
+    def has_capacity(self):
+        return self.healthy and self.outstanding < self.concurrency.limit
+
+    def check(self, model):
+        """True if the host answers and has the model available."""
+        try:
+            models = self.health_client.list()
+        except Exception as e:
+            logger.warning(f"Health check failed for {self.url}: {str(e)}")
+            return False
+        names = [m.get('model') or m.get('name') for m in models.get('models', [])]
+        if model not in names and f"{model}:latest" not in names:
+            logger.warning(f"{self.url} does not have model {model}")
+            return False
+        return True
+
+
+def is_backend_error(error):
+    """Errors that mean the host is unusable, as opposed to a problem with the request itself."""
+    if isinstance(error, resilience.DeadlineExceeded):
+        return False
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code >= 500 or error.status_code == 404
+    return True
+
+
+class BackendPool:
+    def __init__(self, hosts, model=OLLAMA_MODEL):
+        self.model = model
+        self.backends = [Backend(h["url"], h.get("max_concurrency", 1)) for h in hosts]
+        self.condition = threading.Condition()
+        self.health_thread = None
+        for backend in self.backends:
+            metrics.BACKEND_HEALTHY.set(1, backend=backend.url)
+            metrics.BACKEND_OUTSTANDING.set(0, backend=backend.url)
+            metrics.BACKEND_CONCURRENCY_LIMIT.set(backend.concurrency.limit, backend=backend.url)
+
+    def capacity(self):
+        """Requests the healthy backends can run at once (at least 1 so work keeps flowing)."""
+        with self.condition:
+            return max(1, sum(b.concurrency.limit for b in self.backends if b.healthy))
+
+    def acquire(self, exclude=(), timeout=ACQUIRE_TIMEOUT):
+        """Reserve a slot on the least loaded healthy backend, waiting for one to free up."""
+        deadline = time.time() + timeout
+        with self.condition:
+            while True:
+                candidates = [b for b in self.backends if b.has_capacity() and b not in exclude]
+                if candidates:
+                    backend = min(candidates, key=Backend.load)
+                    backend.outstanding += 1
+                    backend.concurrency.on_acquire(backend.outstanding)
+                    metrics.BACKEND_OUTSTANDING.set(backend.outstanding, backend=backend.url)
+                    return backend
+                if all(not b.healthy or b in exclude for b in self.backends):
+                    # Nothing can free up on its own, but a health check might bring a host back
+                    exclude = ()
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise NoBackendAvailable("No Ollama backend available")
+                self.condition.wait(min(remaining, HEALTH_CHECK_INTERVAL))
+
+    def release(self, backend, failed=False, tokens=0, seconds=0.0):
+        with self.condition:
+            backend.outstanding -= 1
+            metrics.BACKEND_OUTSTANDING.set(backend.outstanding, backend=backend.url)
+            if tokens:
+                backend.concurrency.on_success(tokens, seconds)
+            if failed:
+                backend.concurrency.on_failure()
+                backend.failures += 1
+                if backend.healthy:
+                    backend.healthy = False
+                    metrics.BACKEND_HEALTHY.set(0, backend=backend.url)
+                    logger.warning(f"Marked Ollama backend {backend.url} as down")
+            metrics.BACKEND_CONCURRENCY_LIMIT.set(backend.concurrency.limit, backend=backend.url)
+            self.condition.notify_all()
+
+    def run(self, fn, count_tokens=None):
+        """
+        Call fn(backend) on a pooled backend. If the backend fails, it is marked down and the
+        call is retried from scratch on another one, so fn must be safe to repeat.
+        count_tokens(result) gives the tokens generated, which drives the adaptive limit.
+        """
+        tried = []
+        while True:
+            # Don't wait for a backend past the caller's deadline
+            backend = self.acquire(exclude=tried, timeout=resilience.cap_timeout(ACQUIRE_TIMEOUT))
+            started = time.monotonic()
+            try:
+                result = fn(backend)
+            except Exception as e:
+                failed = is_backend_error(e)
+                self.release(backend, failed=failed)
+                tried.append(backend)
+                if not failed:
+                    raise
+                if len(tried) >= len(self.backends):
+                    raise NoBackendAvailable(f"Every Ollama backend failed, last error: {str(e)}") from e
+                metrics.BACKEND_FAILOVERS.inc(backend=backend.url)
+                logger.warning(f"Generation on {backend.url} failed, failing over: {str(e)}")
+                continue
+            tokens = count_tokens(result) if count_tokens else 0
+            self.release(backend, tokens=tokens, seconds=time.monotonic() - started)
+            return result
+
+    def check_health(self):
+        for backend in self.backends:
+            healthy = backend.check(self.model)
+            with self.condition:
+                if healthy != backend.healthy:
+                    logger.info(f"Ollama backend {backend.url} is {'up' if healthy else 'down'}")
+                    backend.healthy = healthy
+                    metrics.BACKEND_HEALTHY.set(int(healthy), backend=backend.url)
+                    self.condition.notify_all()
+
+    def start_health_checks(self):
+        """Start the background health checker (idempotent)."""
+        if self.health_thread is None or not self.health_thread.is_alive():
+            self.health_thread = threading.Thread(target=self._health_loop, name='ollama-health', daemon=True)
+            self.health_thread.start()
+
+    def _health_loop(self):
+        while True:
+            try:
+                self.check_health()
+            except Exception as e:
+                logger.error(f"Error checking Ollama backends: {str(e)}")
+            time.sleep(HEALTH_CHECK_INTERVAL)
+
+
+POOL = BackendPool(OLLAMA_HOSTS)
@@ -0,0 +1,280 @@
+"""
+Lightweight in-process metrics for the incident pipeline, rendered in the Prometheus text format.
+Every pipeline stage gets a latency histogram plus call, error, byte and token counters.
+"""
+import threading
+import time
+
+# Histogram buckets in seconds, wide enough for both millisecond DB writes and multi-minute LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base class for a named metric family with optional labels."""
+    metric_type = 'untyped'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple((name, labels.get(name, '')) for name in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.metric_type}']
+
+
+class Counter(Metric):
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+    def render(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return self.header() + [f'{self.name}{_format_labels(key)} {_format_value(value)}' for key, value in items]
+
+
+class Gauge(Metric):
+    metric_type = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+    def render(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return self.header() + [f'{self.name}{_format_labels(key)} {_format_value(value)}' for key, value in items]
+
+
+class Histogram(Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][index] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            items = sorted((key, dict(state, counts=list(state['counts']))) for key, state in self.values.items())
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(key + (("le", _format_value(float(bound))),))} {cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(key + (("le", "+Inf"),))} {state["count"]}')
+            lines.append(f'{self.name}_sum{_format_labels(key)} {_format_value(state["sum"])}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {state["count"]}')
+        return lines
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+STAGE_DURATION = register(Histogram(
+    'incidentgpt_stage_duration_seconds', 'Time spent in each pipeline stage.', ('stage',)))
+STAGE_CALLS = register(Counter(
+    'incidentgpt_stage_calls_total', 'Calls to each pipeline stage.', ('stage',)))
+STAGE_ERRORS = register(Counter(
+    'incidentgpt_stage_errors_total', 'Failed calls to each pipeline stage.', ('stage',)))
+STAGE_BYTES = register(Counter(
+    'incidentgpt_stage_bytes_total', 'Bytes received or produced by each pipeline stage.', ('stage',)))
+STAGE_TOKENS = register(Counter(
+    'incidentgpt_stage_tokens_total', 'LLM tokens processed by each pipeline stage.', ('stage', 'kind')))
+REGENERATIONS = register(Counter(
+    'incidentgpt_generations_total', 'Solution generations by prompt mode (full or incremental).', ('mode',)))
+PREFILL_TOKENS_SAVED = register(Counter(
+    'incidentgpt_prefill_tokens_saved_total', 'Prompt tokens not re-processed thanks to context reuse.'))
+BACKEND_OUTSTANDING = register(Gauge(
+    'incidentgpt_backend_outstanding_requests', 'Generation requests in flight per Ollama backend.', ('backend',)))
+BACKEND_HEALTHY = register(Gauge(
+    'incidentgpt_backend_healthy', 'Whether each Ollama backend passed its last health check.', ('backend',)))
+BACKEND_CONCURRENCY_LIMIT = register(Gauge(
+    'incidentgpt_backend_concurrency_limit', 'Current adaptive concurrency limit per Ollama backend.', ('backend',)))
+BACKEND_FAILOVERS = register(Counter(
+    'incidentgpt_backend_failovers_total', 'Generations moved to another backend after this one failed.', ('backend',)))
+UPSTREAM_CIRCUIT_OPEN = register(Gauge(
+    'incidentgpt_upstream_circuit_open', 'Whether the circuit breaker of each upstream is open.', ('upstream',)))
+UPSTREAM_REJECTED = register(Counter(
+    'incidentgpt_upstream_rejected_total', 'Calls failed fast because the upstream circuit was open.', ('upstream',)))
+UPSTREAM_RETRIES = register(Counter(
+    'incidentgpt_upstream_retries_total', 'Upstream calls retried after an error or 5xx/429 answer.', ('upstream',)))
+TRACE_SPANS_DROPPED = register(Counter(
+    'incidentgpt_trace_spans_dropped_total', 'Trace spans dropped because the trace writer buffer was full.'))
+DEADLINES_EXCEEDED = register(Counter(
+    'incidentgpt_deadlines_exceeded_total', 'Solution generations stopped by their end-to-end deadline.'))
+SOLUTIONS_DERIVED = register(Counter(
+    'incidentgpt_solutions_derived_total', 'Solutions reused from a near-duplicate incident instead of generated.'))
+POLLS = register(Counter(
+    'incidentgpt_polls_total', 'ServiceNow polls by outcome (changed, idle, slow or error).', ('result',)))
+POLL_INTERVAL = register(Gauge(
+    'incidentgpt_poll_interval_seconds', 'Current adaptive ServiceNow poll interval, before jitter.'))
+POLL_REQUESTS_SAVED = register(Gauge(
+    'incidentgpt_poll_requests_saved', 'ServiceNow polls avoided compared to a fixed 5 minute schedule.'))
+RENDER_CACHE = register(Counter(
+    'incidentgpt_render_cache_total', 'Dashboard responses by render cache result (hit, miss or not_modified).',
+    ('result',)))
+QUEUE_DEPTH = register(Gauge(
+    'incidentgpt_solution_queue_depth', 'Incidents waiting for solution generation.'))
+WORKERS_BUSY = register(Gauge(
+    'incidentgpt_workers_busy', 'Solution workers currently generating.'))
+WORKER_BUSY_SECONDS = register(Counter(
+    'incidentgpt_worker_busy_seconds_total', 'Total seconds solution workers spent generating.'))
+WORKER_UTILIZATION = register(Gauge(
+    'incidentgpt_worker_utilization', 'Fraction of the last minute the solution workers were busy.'))
+
+UTILIZATION_WINDOW = 60.0
+
+
+class Stage:
+    """
+    Context manager that times one call to a pipeline stage. An exception escaping the block,
+    or an explicit fail(), counts as an error.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.failed = False
+        self.start = None
+
+    def fail(self):
+        self.failed = True
+
+    def add_bytes(self, count):
+        STAGE_BYTES.inc(count, stage=self.name)
+
+    def add_tokens(self, kind, count):
+        if count:
+            STAGE_TOKENS.inc(count, stage=self.name, kind=kind)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_DURATION.observe(time.perf_counter() - self.start, stage=self.name)
+        STAGE_CALLS.inc(stage=self.name)
+        if exc_type is not None or self.failed:
+            STAGE_ERRORS.inc(stage=self.name)
+        return False
+
+
+def stage(name):
+    """Time a pipeline stage: `with metrics.stage('poll') as s: ...`"""
+    return Stage(name)
+
+
+class _WorkerTracker:
+    """Tracks busy time of the solution workers over a sliding window."""
+
+    def __init__(self, window=UTILIZATION_WINDOW):
+        self.window = window
+        self.lock = threading.Lock()
+        self.intervals = []  # (start, end) of finished work within the window
+        self.active = {}  # thread id -> start time
+
+    def start(self):
+        with self.lock:
+            self.active[threading.get_ident()] = time.monotonic()
+        WORKERS_BUSY.inc()
+
+    def stop(self):
+        now = time.monotonic()
+        with self.lock:
+            started = self.active.pop(threading.get_ident(), now)
+            self.intervals.append((started, now))
+        WORKERS_BUSY.dec()
+        WORKER_BUSY_SECONDS.inc(now - started)
+
+    def utilization(self, workers=1):
+        now = time.monotonic()
+        window_start = now - self.window
+        with self.lock:
+            self.intervals = [(s, e) for s, e in self.intervals if e > window_start]
+            busy = sum(e - max(s, window_start) for s, e in self.intervals)
+            busy += sum(now - max(s, window_start) for s in self.active.values())
+        return min(1.0, busy / (self.window * max(1, workers)))
+
+
+WORKER_TRACKER = _WorkerTracker()
+
+
+class worker_busy:
+    """Context manager marking the current solution worker as busy."""
+
+    def __enter__(self):
+        WORKER_TRACKER.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        WORKER_TRACKER.stop()
+        return False
+
+
+def render(workers=1):
+    """Render every registered metric in the Prometheus text exposition format."""
+    WORKER_UTILIZATION.set(round(WORKER_TRACKER.utilization(workers), 4))
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
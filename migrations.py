@@ -0,0 +1,199 @@
+"""
+Versioned schema migrations. The schema version is kept in SQLite's `PRAGMA user_version`
+and every migration with a higher number than the database's runs once, in order, in its own
+transaction together with the version bump. Data is preserved across restarts, so a new
+migration must be appended to MIGRATIONS, never edit one that has shipped.
+
+Databases created before migrations existed are at version 0 and may already hold some of
+the tables, so the early migrations only create or change what is missing.
+"""
+import hashlib
+import logging
+
+import blobs
+import jobs
+import render_cache
+import search
+
+logger = logging.getLogger('incidentgpt.migrations')
+
+
+def incident_content_hash(description, config_item, work_notes):
+    """Hash of the incident fields a solution is generated from."""
+    digest = hashlib.sha256()
+    for value in (description, config_item, work_notes):
+        digest.update((value or '').encode('utf-8'))
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def add_column(conn, table, column, definition):
+    """ALTER TABLE ADD COLUMN unless the column already exists. Returns True if it was added."""
+    if column in columns(conn, table):
+        return False
+    conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return True
+
+
+def create_base_schema(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS incidents (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        incident_number TEXT UNIQUE,
+        description TEXT,
+        short_description TEXT,
+        config_item TEXT,
+        status TEXT,
+        work_notes TEXT,
+        last_updated TEXT,
+        snurl TEXT,
+        archived BOOLEAN DEFAULT 0,
+        resolved_at TEXT
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS solutions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        incident_number TEXT,
+        solution TEXT,
+        generated_at TEXT,
+        work_notes_snapshot TEXT,
+        rag_context TEXT,
+        generation_id TEXT,
+        FOREIGN KEY (incident_number) REFERENCES incidents(incident_number)
+    )''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_solutions_incident ON solutions (incident_number, generated_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_incidents_archived ON incidents (archived, last_updated)')
+
+    # Pipeline trace spans, written in batches by tracing.py
+    conn.execute('''CREATE TABLE IF NOT EXISTS traces (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        incident_number TEXT,
+        generation_id TEXT,
+        name TEXT,
+        started_at REAL,
+        ended_at REAL,
+        attrs TEXT
+    )''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_traces_incident ON traces (incident_number, started_at)')
+
+
+def add_latest_solution_pointer(conn):
+    if add_column(conn, 'incidents', 'latest_solution_id', 'INTEGER'):
+        conn.execute('''
+            UPDATE incidents SET latest_solution_id = (
+                SELECT MAX(s.id) FROM solutions s WHERE s.incident_number = incidents.incident_number
+            )
+        ''')
+
+
+def move_text_to_blobs(conn):
+    blobs.migrate_inline_columns(conn, commit=False)
+
+
+def add_full_text_search(conn):
+    search.create_tables(conn)
+    search.rebuild(conn)
+
+
+def add_content_hashes(conn):
+    add_column(conn, 'incidents', 'content_hash', 'TEXT')
+    add_column(conn, 'solutions', 'content_hash', 'TEXT')
+    rows = conn.execute('SELECT id, description, config_item, work_notes FROM incidents').fetchall()
+    conn.executemany('UPDATE incidents SET content_hash = ? WHERE id = ?',
+                     [(incident_content_hash(*row[1:]), row[0]) for row in rows])
+    # Existing latest solutions were generated from the stored content, keep them
+    conn.execute('''
+        UPDATE solutions SET content_hash = (
+            SELECT i.content_hash FROM incidents i WHERE i.latest_solution_id = solutions.id
+        )
+        WHERE id IN (SELECT latest_solution_id FROM incidents)
+    ''')
+
+
+def add_derived_from(conn):
+    add_column(conn, 'solutions', 'derived_from', 'TEXT')
+
+
+def add_jobs(conn):
+    jobs.create_table(conn)
+
+
+def add_assignment_group(conn):
+    # Filled in by the next poll for active incidents, older archived ones stay without a group
+    add_column(conn, 'incidents', 'assignment_group', 'TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_incidents_group ON incidents (assignment_group, archived, last_updated)')
+
+
+def add_sys_id(conn):
+    if add_column(conn, 'incidents', 'sys_id', 'TEXT'):
+        # Until now the sys_id was only kept in the ServiceNow link
+        conn.execute('''
+            UPDATE incidents SET sys_id = substr(snurl, instr(snurl, 'sys_id=') + 7)
+            WHERE instr(snurl, 'sys_id=') > 0
+        ''')
+
+
+def add_change_counter(conn):
+    render_cache.create_table(conn)
+
+
+def add_solution_generation_id(conn):
+    # Migration 1 only creates missing tables, solutions tables from before it lack the column
+    add_column(conn, 'solutions', 'generation_id', 'TEXT')
+
+
+def skip_unchanged_reindex(conn):
+    search.replace_update_trigger(conn)
+
+
+# (version, description, function(conn)), in order
+MIGRATIONS = [
+    (1, "base schema", create_base_schema),
+    (2, "latest solution pointer", add_latest_solution_pointer),
+    (3, "solution text in blobs", move_text_to_blobs),
+    (4, "full-text search", add_full_text_search),
+    (5, "content hashes", add_content_hashes),
+    (6, "near-duplicate solution source", add_derived_from),
+    (7, "generation jobs", add_jobs),
+    (8, "incident assignment group", add_assignment_group),
+    (9, "incident sys_id", add_sys_id),
+    (10, "dashboard change counter", add_change_counter),
+    (11, "solution generation id on pre-migration databases", add_solution_generation_id),
+    (12, "search index skips unchanged incidents", skip_unchanged_reindex),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Bring the database up to LATEST_VERSION. Needs a db.connect() connection (the search
+    triggers use its html_to_text function). Each step takes the write lock before reading the
+    version, so processes starting at the same time don't apply a migration twice.
+    """
+    if conn.in_transaction:
+        conn.rollback()
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = current_version(conn)
+            if version > LATEST_VERSION:
+                raise RuntimeError(f"Database schema version {version} is newer than this code ({LATEST_VERSION})")
+            pending = [m for m in MIGRATIONS if m[0] > version]
+            if not pending:
+                conn.commit()
+                return version
+            number, description, apply = pending[0]
+            logger.info(f"Migrating database to version {number} ({description})")
+            apply(conn)
+            conn.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
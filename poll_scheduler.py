@@ -0,0 +1,61 @@
+"""
+Adaptive ServiceNow poll interval. A poll that finds changes pulls the interval down to the
+floor, idle polls back it off exponentially towards the ceiling, and so do failed or slow
+polls, so a struggling ServiceNow instance isn't hammered. Each delay gets random jitter so
+several pollers don't line up.
+"""
+import random
+import time
+
+import credentials
+import metrics
+
+POLL_MIN_INTERVAL = getattr(credentials, "POLL_MIN_INTERVAL", 60)  # Seconds between polls while incidents are changing
+POLL_MAX_INTERVAL = getattr(credentials, "POLL_MAX_INTERVAL", 600)  # Longest wait when idle or backing off
+POLL_JITTER = getattr(credentials, "POLL_JITTER", 0.1)  # Random +/- fraction added to every delay
+POLL_BACKOFF = 2.0  # Interval multiplier after an idle, slow or failed poll
+POLL_SLOW_SECONDS = 20  # A poll taking longer than this means ServiceNow is under load
+BASELINE_INTERVAL = 300  # The old fixed interval, the requests saved are counted against it
+
+
+class PollScheduler:
+    def __init__(self, floor=POLL_MIN_INTERVAL, ceiling=POLL_MAX_INTERVAL, jitter=POLL_JITTER,
+                 backoff=POLL_BACKOFF, slow_seconds=POLL_SLOW_SECONDS):
+        self.floor = floor
+        self.ceiling = max(floor, ceiling)
+        self.jitter = jitter
+        self.backoff = backoff
+        self.slow_seconds = slow_seconds
+        self.interval = floor
+        self.started = time.time()
+        self.polls = 0
+        metrics.POLL_INTERVAL.set(self.interval)
+
+    def record(self, changes, seconds):
+        """
+        Adjust the interval after a poll that found `changes` new, changed or archived
+        incidents (None if it failed) and took `seconds`. Returns the delay until the next one.
+        """
+        self.polls += 1
+        if changes is None:
+            result = 'error'
+        elif seconds > self.slow_seconds:
+            result = 'slow'
+        elif changes:
+            result = 'changed'
+        else:
+            result = 'idle'
+
+        if result == 'changed':
+            self.interval = self.floor
+        else:
+            self.interval = min(self.ceiling, self.interval * self.backoff)
+
+        metrics.POLLS.inc(result=result)
+        metrics.POLL_INTERVAL.set(self.interval)
+        metrics.POLL_REQUESTS_SAVED.set(round(self.requests_saved(), 1))
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def requests_saved(self):
+        """Polls a fixed BASELINE_INTERVAL schedule would have made by now, minus the ones made."""
+        return (time.time() - self.started) / BASELINE_INTERVAL + 1 - self.polls
@@ -0,0 +1,152 @@
+"""
+Token-budgeted prompt assembly for solution generation. The model gets plain text only, and
+the budget is split between the RAG sections (by relevance score), the problem and the work
+notes so prefill time stays bounded no matter how long an incident's history gets.
+"""
+import logging
+import threading
+
+import credentials
+
+try:
+    import tiktoken
+except ImportError:  # Optional, falls back to a calibrated character estimate
+    tiktoken = None
+
+logger = logging.getLogger('incidentgpt.prompt')
+
+# Budgets in tokens, overridable from credentials.py
+PROMPT_TOKEN_BUDGET = getattr(credentials, "PROMPT_TOKEN_BUDGET", 3000)
+NUM_PREDICT = getattr(credentials, "NUM_PREDICT", 256)  # Cap on generated tokens
+DESCRIPTION_SHARE = 0.15  # Most of the budget the problem description may use
+WORK_NOTES_SHARE = 0.30  # Budget reserved for the work notes, the rest goes to the RAG sections
+MIN_SECTION_TOKENS = 60  # Sections that would get less than this are dropped rather than cut to nothing
+
+TRUNCATION_MARKER = " [...]"
+
+
+class TokenCounter:
+    """
+    Counts tokens with tiktoken when it is installed. Otherwise estimates from the character
+    count, with the characters-per-token ratio calibrated against Ollama's prompt_eval_count.
+    """
+
+    def __init__(self, chars_per_token=4.0):
+        self.lock = threading.Lock()
+        self.chars_per_token = chars_per_token
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                logger.warning(f"tiktoken encoding unavailable, estimating tokens from characters: {str(e)}")
+        self.scale = 1.0  # Correction for the gap between tiktoken's vocabulary and the model's
+
+    def count(self, text):
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return int(len(self.encoding.encode(text, disallowed_special=())) * self.scale) + 1
+        return int(len(text) / self.chars_per_token) + 1
+
+    def truncate(self, text, max_tokens):
+        """Cut `text` down to roughly `max_tokens`, on a word boundary, marking the cut."""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            cut = self.encoding.decode(tokens[:max(1, int(max_tokens / self.scale))])
+        else:
+            cut = text[:int(max_tokens * self.chars_per_token)]
+        space = cut.rfind(" ")
+        if space > len(cut) // 2:
+            cut = cut[:space]
+        return cut.rstrip() + TRUNCATION_MARKER
+
+    def calibrate(self, text, actual_tokens):
+        """Nudge the estimate towards the token count the model actually reported for `text`."""
+        if not text or not actual_tokens:
+            return
+        with self.lock:
+            if self.encoding is not None:
+                estimated = len(self.encoding.encode(text, disallowed_special=()))
+                ratio = actual_tokens / max(1, estimated)
+                # Prompt caching on the server can make the reported count much smaller, ignore those
+                if 0.5 < ratio < 2.0:
+                    self.scale = 0.8 * self.scale + 0.2 * ratio
+            else:
+                ratio = len(text) / actual_tokens
+                if 1.5 < ratio < 8.0:
+                    self.chars_per_token = 0.8 * self.chars_per_token + 0.2 * ratio
+
+
+COUNTER = TokenCounter()
+
+
+def allocate(sections, budget, counter=COUNTER):
+    """
+    Share `budget` tokens across RAG sections in proportion to their relevance score. Budget a
+    section doesn't need (because it is shorter than its share) is handed on to the others.
+    Returns the sections in score order with their text cut to fit.
+    """
+    ranked = sorted(sections, key=lambda s: s.get("score") or 0, reverse=True)
+    sizes = [counter.count(s["text"]) for s in ranked]
+    allotted = [0] * len(ranked)
+    pending = list(range(len(ranked)))
+    remaining = budget
+
+    while pending and remaining > 0:
+        total_score = sum(max(ranked[i].get("score") or 0, 0.01) for i in pending)
+        shares = {i: remaining * max(ranked[i].get("score") or 0, 0.01) / total_score for i in pending}
+        fits = [i for i in pending if sizes[i] <= shares[i]]
+        if not fits:
+            for i in pending:
+                allotted[i] = int(shares[i])
+            break
+        # Sections that fit whole take only what they need, the rest is shared again
+        for i in fits:
+            allotted[i] = sizes[i]
+            remaining -= sizes[i]
+            pending.remove(i)
+
+    result = []
+    for section, size, tokens in zip(ranked, sizes, allotted):
+        if tokens >= size:
+            result.append(section)
+        elif tokens >= MIN_SECTION_TOKENS:
+            result.append(dict(section, text=counter.truncate(section["text"], tokens)))
+    return result
+
+
+def build_rag_context(sections, budget, counter=COUNTER):
+    """Plain-text RAG context for the prompt, numbered by relevance."""
+    fitted = allocate(sections or [], budget, counter)
+    if not fitted:
+        return "No relevant previous incidents found."
+    return "\n\n".join(f"---- {idx + 1} ----\n{section['text']}" for idx, section in enumerate(fitted))
+
+
+def fit_work_notes(work_notes, budget, counter=COUNTER):
+    """Keep the newest work notes that fit the budget (ServiceNow lists them newest first)."""
+    if not work_notes:
+        return "None"
+    return counter.truncate(work_notes, budget)
+
+
+def fit_prompt(prefix_template, notes_template, ci, description, sections, work_notes, budget=None, counter=COUNTER):
+    """
+    Fill the prompt templates within `budget` tokens and return (prefix, work notes). The RAG
+    budget doesn't depend on the work notes, so the prefix is unchanged when only notes are added,
+    as long as the counter isn't calibrated in between. Callers reusing a model context keep the
+    prefix they built it from.
+    """
+    budget = budget or PROMPT_TOKEN_BUDGET
+    description = counter.truncate(description, int(budget * DESCRIPTION_SHARE))
+    notes_budget = int(budget * WORK_NOTES_SHARE)
+    fixed = (counter.count(prefix_template.format(rag_context="", ci=ci, description=description)) +
+             counter.count(notes_template.format(work_notes="")))
+    rag_context = build_rag_context(sections, budget - fixed - notes_budget, counter)
+    prefix = prefix_template.format(rag_context=rag_context, ci=ci, description=description)
+    return prefix, fit_work_notes(work_notes, notes_budget, counter)
@@ -0,0 +1,140 @@
+"""
+Shared cache of rendered dashboard responses. Every write that changes what the dashboard
+shows (stored or archived incidents, new solutions) bumps a change counter in the database in
+the same transaction, and the counter is part of the cache key. So a page is rendered once
+per change however many viewers load it, and web processes notice writes made by a separate
+poller or worker.
+
+Responses carry a strong ETag (a hash of the rendered bytes) and are answered with 304 when
+the client already has them. They are compressed with brotli if it is installed and the
+client accepts it, else gzip. Each variant is compressed once and shared as well.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import Response, request
+
+import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CACHE_SIZE = 32  # Rendered responses kept, one per URL and change counter value
+MIN_COMPRESS_BYTES = 1024  # Smaller responses are sent as they are
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # Close to gzip's speed with a better ratio
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0)',
+    "INSERT OR IGNORE INTO counters (name, value) VALUES ('dashboard', 0)",
+)
+
+
+def create_table(conn):
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+
+def bump(conn):
+    """Invalidate the rendered pages, inside the caller's write transaction."""
+    conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'dashboard'")
+
+
+def version(conn):
+    return conn.execute("SELECT value FROM counters WHERE name = 'dashboard'").fetchone()[0]
+
+
+class Rendered:
+    """One rendered response, its ETag and the compressed variants made so far."""
+
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.variants = {'identity': body}
+        self.lock = threading.Lock()
+
+    def encode(self, encoding):
+        with self.lock:
+            if encoding not in self.variants:
+                if encoding == 'br':
+                    self.variants[encoding] = brotli.compress(self.body, quality=BROTLI_QUALITY)
+                else:
+                    self.variants[encoding] = gzip.compress(self.body, compresslevel=GZIP_LEVEL)
+            return self.variants[encoding]
+
+
+class RenderCache:
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # One per key being rendered, so viewers arriving together after a change wait for one
+        # render of their page without holding up the other pages
+        self.render_locks = {}
+
+    def lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def get(self, key, render, mimetype):
+        """The cached response for `key`, calling render() for its bytes on a miss."""
+        entry = self.lookup(key)
+        if entry is not None:
+            metrics.RENDER_CACHE.inc(result='hit')
+            return entry
+        with self.lock:
+            render_lock = self.render_locks.setdefault(key, threading.Lock())
+        with render_lock:
+            entry = self.lookup(key)
+            if entry is not None:
+                metrics.RENDER_CACHE.inc(result='hit')
+                return entry
+            metrics.RENDER_CACHE.inc(result='miss')
+            try:
+                # Nothing is cached if render() raises
+                entry = Rendered(render(), mimetype)
+                with self.lock:
+                    self.entries[key] = entry
+                    while len(self.entries) > self.size:
+                        self.entries.popitem(last=False)
+            finally:
+                with self.lock:
+                    self.render_locks.pop(key, None)
+        return entry
+
+
+CACHE = RenderCache()
+
+
+def choose_encoding(entry):
+    if len(entry.body) < MIN_COMPRESS_BYTES:
+        return 'identity'
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(offered, default='identity')
+
+
+def respond(entry):
+    """Response for the current request: 304 if the client's copy is current, else the best encoding."""
+    encoding = choose_encoding(entry)
+    # Each encoding is a different representation, so it gets its own strong ETag
+    etag = entry.etag if encoding == 'identity' else f"{entry.etag}-{encoding}"
+    if request.if_none_match.contains(etag):
+        metrics.RENDER_CACHE.inc(result='not_modified')
+        response = Response(status=304)
+    else:
+        response = Response(entry.encode(encoding), mimetype=entry.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Browsers revalidate on every load, which costs a 304 while nothing changed
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
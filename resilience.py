@@ -0,0 +1,222 @@
+"""
+Timeouts, retries and circuit breakers for the calls to ServiceNow, PrivateGPT and Wiki.js.
+
+Every call goes through request(), which sets a (connect, read) timeout, retries connection
+errors and 5xx/429 answers with jittered exponential backoff, and counts the outcome against
+the upstream's circuit breaker. After BREAKER_FAILURES failures in a row the breaker opens and
+calls fail at once with CircuitOpen, so a dead upstream costs nothing instead of a timeout
+per call. After BREAKER_RESET seconds one trial call is let through to see if it is back.
+
+A deadline (`with deadline(seconds):`) caps the timeouts and retries of all the calls made
+inside it, so a whole solution generation can't take longer than its budget. The deadline is
+thread local, which gevent makes greenlet local.
+
+Only needs `requests`, so the tools can use it too. The Ollama backends have their own
+health checks and failover in llm_pool.py.
+"""
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+try:
+    import metrics
+except ImportError:  # Imported from the tools as incidentgpt.resilience
+    metrics = None
+
+logger = logging.getLogger('incidentgpt.resilience')
+
+# (connect, read) timeouts in seconds per upstream
+TIMEOUTS = {
+    "servicenow": (5, 30),
+    "privategpt": (5, 60),
+    "wiki": (5, 60),
+}
+INGEST_TIMEOUT = (5, 600)  # PrivateGPT embeds an uploaded file before it answers
+RETRY_ATTEMPTS = 3  # Attempts per call, for idempotent requests
+RETRY_BASE_DELAY = 0.5  # Seconds, doubled every retry
+RETRY_MAX_DELAY = 8  # Longest wait between attempts
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+BREAKER_FAILURES = 5  # Failed calls in a row that open a circuit
+BREAKER_RESET = 30  # Seconds an open circuit waits before letting a trial call through
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the time budget of the current deadline has run out."""
+
+
+class Deadline:
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+
+_local = threading.local()
+
+
+@contextmanager
+def deadline(seconds):
+    """Run the block with a time budget. A nested deadline can only shorten the outer one."""
+    outer = getattr(_local, 'deadline', None)
+    current = Deadline(seconds)
+    if outer is not None and outer.expires_at < current.expires_at:
+        current = outer
+    _local.deadline = current
+    try:
+        yield current
+    finally:
+        _local.deadline = outer
+
+
+def remaining():
+    """Seconds left in the current deadline, None if there is none."""
+    current = getattr(_local, 'deadline', None)
+    return None if current is None else current.remaining()
+
+
+def check_deadline():
+    """Raise DeadlineExceeded if the current deadline has passed."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("Deadline exceeded")
+
+
+def cap_timeout(limit):
+    """`limit` (seconds or a (connect, read) tuple) capped by the time left in the deadline."""
+    left = remaining()
+    if left is None:
+        return limit
+    if left <= 0:
+        raise DeadlineExceeded("Deadline exceeded")
+    if isinstance(limit, tuple):
+        return tuple(min(part, left) for part in limit)
+    return min(limit, left)
+
+
+def backoff_delay(attempt):
+    """Full jitter: a random wait up to the exponential backoff for this attempt."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Closed until `failures` calls in a row fail, then open for `reset` seconds, then half open:
+    one trial call decides whether it closes again or stays open for another `reset`.
+    """
+
+    def __init__(self, name, failures=BREAKER_FAILURES, reset=BREAKER_RESET):
+        self.name = name
+        self.failures = failures
+        self.reset = reset
+        self.lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._set_metric()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset:
+            return 'half_open'
+        return 'open'
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may go ahead."""
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return
+            if state == 'half_open' and not self.trial_running:
+                self.trial_running = True
+                return
+        if metrics is not None:
+            metrics.UPSTREAM_REJECTED.inc(upstream=self.name)
+        raise CircuitOpen(f"{self.name} circuit is open")
+
+    def on_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logger.info(f"{self.name} is answering again, closing its circuit")
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.trial_running = False
+        self._set_metric()
+
+    def on_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            if self.trial_running or (self.opened_at is None and self.consecutive_failures >= self.failures):
+                logger.warning(f"{self.name} failed {self.consecutive_failures} times in a row, opening its circuit")
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+        self._set_metric()
+
+    def _set_metric(self):
+        if metrics is not None:
+            metrics.UPSTREAM_CIRCUIT_OPEN.set(int(self.opened_at is not None), upstream=self.name)
+
+
+BREAKERS = {name: CircuitBreaker(name) for name in TIMEOUTS}
+
+
+def request(upstream, method, url, timeout=None, retries=None, **kwargs):
+    """
+    requests.request() against `upstream` (a TIMEOUTS key) with its timeout, retries and
+    circuit breaker. Retries default to RETRY_ATTEMPTS for idempotent methods and none for
+    the others. A 5xx answer is returned after the last attempt so callers can still report
+    it. Raises CircuitOpen, DeadlineExceeded or the last requests exception.
+    """
+    breaker = BREAKERS[upstream]
+    limit = timeout or TIMEOUTS[upstream]
+    if retries is None:
+        retries = RETRY_ATTEMPTS - 1 if method.upper() in IDEMPOTENT_METHODS else 0
+    attempt = 0
+    while True:
+        call_timeout = cap_timeout(limit)
+        breaker.before_call()
+        try:
+            response = requests.request(method, url, timeout=call_timeout, **kwargs)
+        except requests.RequestException as e:
+            breaker.on_failure()
+            error, response = e, None
+        except Exception:
+            breaker.on_failure()
+            raise
+        else:
+            if response.status_code >= 500:
+                breaker.on_failure()
+            else:
+                breaker.on_success()
+            if response.status_code not in RETRY_STATUSES:
+                return response
+            error = None
+
+        if attempt >= retries or breaker.state != 'closed':
+            if response is not None:
+                return response
+            raise error
+        delay = backoff_delay(attempt)
+        left = remaining()
+        if left is not None and left <= delay:
+            if response is not None:
+                return response
+            raise error
+        if metrics is not None:
+            metrics.UPSTREAM_RETRIES.inc(upstream=upstream)
+        logger.info(f"Retrying {upstream} {method} in {delay:.1f}s: "
+                    f"{error or f'HTTP {response.status_code}'}")
+        attempt += 1
+        time.sleep(delay)
+
@@ -0,0 +1,129 @@
+"""
+Full-text search over stored incidents and generated solutions with SQLite FTS5. The FTS
+tables hold a plain-text copy (the stored values are display HTML) and are kept up to date by
+triggers, so every insert or update of an incident or solution is indexed in the same
+transaction. Triggers call html_to_text(), which db.connect() registers on every connection.
+"""
+import html
+import re
+
+SNIPPET_START = '\x02'
+SNIPPET_END = '\x03'
+SNIPPET_TOKENS = 16  # Tokens of context per snippet
+
+# Re-indexing runs html_to_text() and rewrites the FTS rows, so it's skipped when an update
+# (e.g. a poll storing an unchanged incident) leaves the indexed columns as they were
+INCIDENTS_FTS_UPDATE = '''CREATE TRIGGER IF NOT EXISTS incidents_fts_update
+    AFTER UPDATE OF config_item, short_description, description, work_notes ON incidents
+    WHEN old.config_item IS NOT new.config_item OR old.short_description IS NOT new.short_description
+        OR old.description IS NOT new.description OR old.work_notes IS NOT new.work_notes
+    BEGIN
+        DELETE FROM incidents_fts WHERE rowid = old.id;
+        INSERT INTO incidents_fts (rowid, incident_number, config_item, short_description, description, work_notes)
+        VALUES (new.id, new.incident_number, new.config_item, new.short_description, new.description,
+                html_to_text(new.work_notes));
+    END'''
+
+SCHEMA = (
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS incidents_fts USING fts5(
+        incident_number, config_item, short_description, description, work_notes,
+        tokenize = 'porter unicode61'
+    )''',
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS solutions_fts USING fts5(
+        incident_number UNINDEXED, solution,
+        tokenize = 'porter unicode61'
+    )''',
+    # The FTS rowid is the incidents / solutions id
+    '''CREATE TRIGGER IF NOT EXISTS incidents_fts_insert AFTER INSERT ON incidents BEGIN
+        INSERT INTO incidents_fts (rowid, incident_number, config_item, short_description, description, work_notes)
+        VALUES (new.id, new.incident_number, new.config_item, new.short_description, new.description,
+                html_to_text(new.work_notes));
+    END''',
+    INCIDENTS_FTS_UPDATE,
+    '''CREATE TRIGGER IF NOT EXISTS incidents_fts_delete AFTER DELETE ON incidents BEGIN
+        DELETE FROM incidents_fts WHERE rowid = old.id;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS solutions_fts_insert AFTER INSERT ON solutions BEGIN
+        INSERT INTO solutions_fts (rowid, incident_number, solution)
+        VALUES (new.id, new.incident_number, html_to_text(new.solution));
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS solutions_fts_delete AFTER DELETE ON solutions BEGIN
+        DELETE FROM solutions_fts WHERE rowid = old.id;
+    END''',
+)
+
+
+def create_tables(conn):
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+
+def replace_update_trigger(conn):
+    """Swap the incidents update trigger of an existing database for the current one."""
+    conn.execute('DROP TRIGGER IF EXISTS incidents_fts_update')
+    conn.execute(INCIDENTS_FTS_UPDATE)
+
+
+def rebuild(conn):
+    """Re-index everything, for databases that had rows before the FTS tables existed."""
+    conn.execute('DELETE FROM incidents_fts')
+    conn.execute('DELETE FROM solutions_fts')
+    conn.execute('''
+        INSERT INTO incidents_fts (rowid, incident_number, config_item, short_description, description, work_notes)
+        SELECT id, incident_number, config_item, short_description, description, html_to_text(work_notes)
+        FROM incidents
+    ''')
+    conn.execute('''
+        INSERT INTO solutions_fts (rowid, incident_number, solution)
+        SELECT id, incident_number, html_to_text(solution) FROM solutions
+    ''')
+
+
+def build_query(text):
+    """
+    Turn free text into a safe FTS5 query: every word must match, and the last one is a prefix
+    so results show up while typing. FTS5 operators and punctuation in the input are ignored.
+    """
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def format_snippet(snippet):
+    """Escape a snippet for HTML and turn the match markers into <mark> tags."""
+    return html.escape(snippet or '').replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>')
+
+
+def search(conn, text, limit=20, offset=0):
+    """
+    Ranked (bm25) matches across incidents and solutions. Returns (results, has_more), each
+    result has the incident number, whether it matched the incident or one of its solutions,
+    and an HTML snippet with the matched terms marked.
+    """
+    query = build_query(text)
+    if query is None:
+        return [], False
+    rows = conn.execute(f'''
+        SELECT kind, incident_number, snippet, rank FROM (
+            SELECT 'incident' AS kind, incident_number,
+                   snippet(incidents_fts, -1, ?, ?, '...', {SNIPPET_TOKENS}) AS snippet, rank
+            FROM incidents_fts WHERE incidents_fts MATCH ?
+            UNION ALL
+            SELECT 'solution' AS kind, incident_number,
+                   snippet(solutions_fts, 1, ?, ?, '...', {SNIPPET_TOKENS}) AS snippet, rank
+            FROM solutions_fts WHERE solutions_fts MATCH ?
+        )
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+    ''', (SNIPPET_START, SNIPPET_END, query, SNIPPET_START, SNIPPET_END, query, limit + 1, offset)).fetchall()
+
+    results = [{
+        'kind': kind,
+        'incident_number': incident_number,
+        'snippet': format_snippet(snippet),
+        'rank': round(rank, 4)
+    } for kind, incident_number, snippet, rank in rows[:limit]]
+    return results, len(rows) > limit
@@ -0,0 +1,40 @@
+"""
+Production entry point. Runs the app on gevent instead of the Werkzeug development server:
+the process is monkey patched before anything else is imported, so the ServiceNow /
+PrivateGPT `requests` calls, the Ollama client, the poller, the solution workers and every
+SocketIO connection become greenlets that yield while they wait on the network. An idle
+client costs a few kB instead of a thread.
+
+SQLite calls still run on the event loop. They are short and no write transaction spans a
+network call, so they don't hold the other greenlets up for long.
+
+Requires `pip install gevent gevent-websocket` (without gevent-websocket clients fall back
+to long-polling). Takes the same --role option as app.py. Usage:
+    python serve.py --host 0.0.0.0 --port 5001
+    python serve.py --role worker
+"""
+from gevent import monkey
+
+monkey.patch_all()
+
+import logging  # noqa: E402
+
+import app as incidentgpt  # noqa: E402
+
+logger = logging.getLogger('incidentgpt.serve')
+
+
+def main():
+    args = incidentgpt.parse_args("Run IncidentGPT on the gevent server.")
+    if incidentgpt.socketio.async_mode != 'gevent':
+        raise RuntimeError(f"Expected gevent async mode, got {incidentgpt.socketio.async_mode}")
+    incidentgpt.start_services(args.role)
+    if args.role in ('all', 'web'):
+        logger.info(f"Starting gevent server on http://{args.host}:{args.port}")
+        incidentgpt.socketio.run(incidentgpt.app, host=args.host, port=args.port, debug=False, log_output=False)
+    else:
+        incidentgpt.wait_forever()
+
+
+if __name__ == '__main__':
+    main()
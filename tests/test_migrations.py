@@ -0,0 +1,95 @@
+"""
+Schema migrations on a fresh database and on one created by the app before migrations existed.
+
+Usage (from the repository root):
+    python -m pytest tests
+"""
+import os
+import sys
+
+repo_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+if repo_dir not in sys.path:
+    sys.path.insert(0, repo_dir)
+
+import blobs  # noqa: E402
+import db  # noqa: E402
+import migrations  # noqa: E402
+
+# The schema init_db() created before migrations.py
+BASELINE_SCHEMA = (
+    '''CREATE TABLE incidents (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        incident_number TEXT UNIQUE,
+        description TEXT,
+        short_description TEXT,
+        config_item TEXT,
+        status TEXT,
+        work_notes TEXT,
+        last_updated TEXT,
+        snurl TEXT,
+        archived BOOLEAN DEFAULT 0,
+        resolved_at TEXT
+    )''',
+    '''CREATE TABLE solutions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        incident_number TEXT,
+        solution TEXT,
+        generated_at TEXT,
+        work_notes_snapshot TEXT,
+        rag_context TEXT,
+        FOREIGN KEY (incident_number) REFERENCES incidents(incident_number)
+    )''',
+)
+
+
+def store_solution(conn, number):
+    """The INSERT generate_and_store_solution makes."""
+    conn.execute('''
+        INSERT INTO solutions
+        (incident_number, solution, generated_at, work_notes_hash, rag_context_hash,
+        generation_id, content_hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (number, 'Restart the interface', '2024-01-02 10:00:00', blobs.put(conn, 'notes'),
+          blobs.put(conn, 'context'), 'gen-1', 'hash'))
+    conn.commit()
+
+
+def test_fresh_database(tmp_path):
+    conn = db.connect(str(tmp_path / 'fresh.db'))
+    assert migrations.migrate(conn) == migrations.LATEST_VERSION
+    conn.execute("INSERT INTO incidents (incident_number, snurl) VALUES ('INC1', 'x?sys_id=abc')")
+    store_solution(conn, 'INC1')
+    assert migrations.migrate(conn) == migrations.LATEST_VERSION
+
+
+def test_baseline_database(tmp_path):
+    conn = db.connect(str(tmp_path / 'baseline.db'))
+    for statement in BASELINE_SCHEMA:
+        conn.execute(statement)
+    conn.execute('''
+        INSERT INTO incidents (incident_number, description, config_item, work_notes, snurl)
+        VALUES ('INC1', 'Feed down', 'CI1', 'notes', 'https://sn/nav_to.do?uri=incident.do?sys_id=abc123')
+    ''')
+    conn.execute('''
+        INSERT INTO solutions (incident_number, solution, generated_at, work_notes_snapshot, rag_context)
+        VALUES ('INC1', 'Old solution', '2024-01-01 10:00:00', 'notes', 'context')
+    ''')
+    conn.commit()
+
+    assert migrations.migrate(conn) == migrations.LATEST_VERSION
+    columns = migrations.columns(conn, 'solutions')
+    assert {'generation_id', 'content_hash', 'derived_from', 'work_notes_hash', 'rag_context_hash'} <= columns
+    assert not {'work_notes_snapshot', 'rag_context'} & columns
+
+    latest, rag_context_hash = conn.execute('''
+        SELECT i.latest_solution_id, s.rag_context_hash
+        FROM incidents i JOIN solutions s ON s.id = i.latest_solution_id
+    ''').fetchone()
+    assert latest == 1
+    assert blobs.get(conn, rag_context_hash) == 'context'
+    assert conn.execute('SELECT sys_id FROM incidents').fetchone()[0] == 'abc123'
+    trigger = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'incidents_fts_update'").fetchone()[0]
+    assert 'old.description IS NOT new.description' in trigger
+
+    store_solution(conn, 'INC1')
+    assert conn.execute('SELECT COUNT(*) FROM solutions').fetchone()[0] == 2
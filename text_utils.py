@@ -0,0 +1,30 @@
+"""
+Plain-text helpers shared by the live pipeline and the ServiceNow ingest tool.
+"""
+import html
+import re
+
+BR_PATTERN = re.compile(r'<br\s*/?>', re.IGNORECASE)
+TAG_PATTERN = re.compile(r'<[^>]+>')
+ESCALATION_PATTERN = re.compile(r"Escalate in \d+ minutes to [^\n]+\n")
+
+
+def html_to_text(text):
+    """Turn the <br>/<a href> HTML we build for display back into plain text."""
+    if not text:
+        return ""
+    text = BR_PATTERN.sub("\n", text)
+    text = TAG_PATTERN.sub("", text)
+    return html.unescape(text)
+
+
+def clean_work_notes(work_notes):
+    """Collapse blank lines and strip the escalation boilerplate ServiceNow adds to work notes."""
+    cleaned = re.sub(r'\n+', '\n', work_notes.strip())
+    cleaned = ESCALATION_PATTERN.sub("", cleaned)
+    return cleaned.replace(
+        " (Work notes)", ""
+    ).replace(
+        "This incident escalation is in progress using the following escalation plan:",
+        "Escalation in progress."
+    )
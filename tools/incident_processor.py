@@ -7,7 +7,6 @@ import glob
 import logging
 import schedule
 import time
-import requests
 from datetime import datetime
 from unidecode import unidecode
 from requests.auth import HTTPBasicAuth
@@ -19,6 +18,8 @@ if pgpt_dir not in sys.path:
     sys.path.insert(0, pgpt_dir)
 
 from incidentgpt import credentials
+from incidentgpt import resilience
+from incidentgpt.text_utils import clean_work_notes
 
 class Record:
     """Represents a ServiceNow incident record with formatting capabilities."""
@@ -41,18 +42,7 @@ class Record:
         self.resolved_by = row_dict['resolved_by']
         self.close_notes = row_dict['close_notes'].strip()
         self.close_notes_compact = re.sub(r'\n+', '\n', self.close_notes)
-        self.work_notes_compact_cleaned = re.sub(
-            r"Escalate in \d+ minutes to [^\n]+\n", 
-            "", 
-            self.work_notes_compact, 
-            flags=re.DOTALL
-        )
-        self.work_notes_compact_cleaned_further = self.work_notes_compact_cleaned.replace(
-            " (Work notes)", ""
-        ).replace(
-            "This incident escalation is in progress using the following escalation plan:",
-            "Escalation in progress."
-        )
+        self.work_notes_compact_cleaned_further = clean_work_notes(self.work_notes)
         self.configuration_item = row_dict['cmdb_ci']
 
     @staticmethod
@@ -92,17 +82,25 @@ class ServiceNowClient:
                 "assignment_group,assigned_to,work_notes,resolved_at,resolved_by,"
                 "close_notes,cmdb_ci,comments_and_work_notes"
             ),
-            "assignment_group": "Medical Devices-Medical System Middleware",
             "sysparm_query": "state=6^ORstate=7^ORDERBYDESCresolved_at",
         }
+        # Same groups as the app polls (ASSIGNMENT_GROUPS in credentials.py), so they share one RAG corpus
+        groups = getattr(credentials, "ASSIGNMENT_GROUPS", None)
+        if groups:
+            self.params["sysparm_query"] = (
+                f"assignment_groupIN{','.join(group['sys_id'] for group in groups)}^{self.params['sysparm_query']}")
+        else:
+            self.params["assignment_group"] = "Medical Devices-Medical System Middleware"
 
     def get_incidents(self):
         """Retrieves incidents from ServiceNow."""
         logging.info("Retrieving incidents from ServiceNow...")
         
         try:
-            response = requests.get(
-                self.endpoint,
+            # The export of every resolved incident can take a while to produce
+            response = resilience.request(
+                "servicenow", "GET", self.endpoint,
+                timeout=(5, 300),
                 auth=self.auth,
                 headers=self.headers,
                 params=self.params
@@ -194,8 +192,8 @@ class RAGFormatter:
 class IngestClient:
     """Handles interactions with the ingest API."""
     
-    def __init__(self):
-        self.base_url = "https://wsmwsllm01.healthy.bewell.ca:8001"
+    def __init__(self, base_url=None):
+        self.base_url = base_url or getattr(credentials, "PRIVATEGPT_URL", "https://wsmwsllm01.healthy.bewell.ca:8001")
         
     def submit_file(self, file_path):
         """Submits a file to the ingest endpoint."""
@@ -204,7 +202,8 @@ class IngestClient:
         try:
             with open(file_path, 'rb') as f:
                 files = {'file': (os.path.basename(file_path), f)}
-                response = requests.post(url, files=files, verify=False)
+                response = resilience.request("privategpt", "POST", url, files=files, verify=False,
+                                              timeout=resilience.INGEST_TIMEOUT)
                 response.raise_for_status()
                 logging.info(f"Successfully submitted file: {file_path}")
                 return True
@@ -217,7 +216,7 @@ class IngestClient:
         url = f"{self.base_url}/v1/ingest/list"
         
         try:
-            response = requests.get(url, verify=False)
+            response = resilience.request("privategpt", "GET", url, verify=False)
             response.raise_for_status()
             data = response.json()
             
@@ -259,7 +258,7 @@ class IngestClient:
         url = f"{self.base_url}/v1/ingest/{doc_info['id']}"
         
         try:
-            response = requests.delete(url, verify=False)
+            response = resilience.request("privategpt", "DELETE", url, verify=False)
             response.raise_for_status()
             logging.info(f"Successfully deleted document: {doc_info['filename']} (ID: {doc_info['id']})")
             return True
@@ -2,8 +2,13 @@ import os
 import sys
 from gql import gql, Client
 from gql.transport.requests import RequestsHTTPTransport
-import requests
 import logging
+import hashlib
+import json
+import re
+import queue
+import argparse
+import threading
 from datetime import datetime
 import urllib3
 
@@ -17,10 +22,17 @@ if pgpt_dir not in sys.path:
     sys.path.insert(0, pgpt_dir)
 
 from incidentgpt import credentials
+from incidentgpt import resilience
 
 apikey = credentials.WIKIAPITOKEN
 apiurl = credentials.WIKIURL
 
+# Local record of what has been ingested for each wiki page (content hashes, filenames, metadata)
+MANIFEST_PATH = os.path.join(script_dir, "ingest_manifest.json")
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+FENCE_PATTERN = re.compile(r"^\s*(```|~~~)")
+
 class Page:
     def __init__(self, page_id, path, title):
         """
@@ -63,6 +75,43 @@ class Page:
             self.created_at = details.get("createdAt")
             self.updated_at = details.get("updatedAt")
 
+    def content_hash(self):
+        """
+        Returns a hash of the normalized page content, so metadata-only edits don't look like changes.
+        """
+        return hash_content(self.content or "")
+
+    def split_sections(self):
+        """
+        Splits the page content at markdown headings into section documents.
+        Sections are keyed by their heading path, so a section keeps its identity (and hash)
+        when other parts of the page are edited.
+
+        :return: List of section dicts with key, heading_path, content, hash and filename
+        """
+        safe_title = "".join(c if c.isalnum() or c in " _-" else "_" for c in self.title)
+        sections = []
+
+        for heading_path, text in split_markdown_sections(self.content or ""):
+            key = " > ".join(heading_path)
+            section_hash = hash_content(f"{key}\n{text}")
+            slug = "".join(c if c.isalnum() else "_" for c in key)[:80] or "intro"
+
+            # Prefix the page title and heading path so each section reads on its own in retrieval
+            header = f"# {self.title}\n"
+            if key:
+                header += f"## {key}\n"
+
+            sections.append({
+                "key": key,
+                "heading_path": list(heading_path),
+                "content": f"{header}\n{text}\n",
+                "hash": section_hash,
+                "filename": f"{self.id} - {safe_title} - {slug} - {section_hash[:12]}.md"
+            })
+
+        return sections
+
     def save_to_markdown(self, directory="pages"):
         """
         Saves the page content to a Markdown (.md) file.
@@ -105,8 +154,8 @@ class Page:
 class IngestClient:
     """Handles interactions with the ingest API."""
     
-    def __init__(self):
-        self.base_url = "https://wsmwsllm01.healthy.bewell.ca:8001"
+    def __init__(self, base_url=None):
+        self.base_url = base_url or getattr(credentials, "PRIVATEGPT_URL", "https://wsmwsllm01.healthy.bewell.ca:8001")
         
     def submit_file(self, file_path):
         """Submits a file to the ingest endpoint."""
@@ -115,7 +164,8 @@ class IngestClient:
         try:
             with open(file_path, 'rb') as f:
                 files = {'file': (os.path.basename(file_path), f)}
-                response = requests.post(url, files=files, verify=False)
+                response = resilience.request("privategpt", "POST", url, files=files, verify=False,
+                                              timeout=resilience.INGEST_TIMEOUT)
                 response.raise_for_status()
                 print(f"Successfully submitted file: {file_path}")
                 logging.info(f"Successfully submitted file: {file_path}")
@@ -125,12 +175,29 @@ class IngestClient:
             logging.error(f"Error submitting file: {str(e)}")
             return False
 
+    def submit_content(self, filename, content):
+        """Submits in-memory content to the ingest endpoint as if it were a file."""
+        url = f"{self.base_url}/v1/ingest/file"
+        
+        try:
+            files = {'file': (filename, content.encode("utf-8"))}
+            response = resilience.request("privategpt", "POST", url, files=files, verify=False,
+                                          timeout=resilience.INGEST_TIMEOUT)
+            response.raise_for_status()
+            print(f"Successfully submitted: {filename}")
+            logging.info(f"Successfully submitted: {filename}")
+            return True
+        except Exception as e:
+            print(f"Error submitting {filename}: {str(e)}")
+            logging.error(f"Error submitting {filename}: {str(e)}")
+            return False
+
     def get_doc_info(self):
         """Gets document IDs and filenames for RAG files."""
         url = f"{self.base_url}/v1/ingest/list"
         
         try:
-            response = requests.get(url, verify=False)
+            response = resilience.request("privategpt", "GET", url, verify=False)
             response.raise_for_status()
             data = response.json()
             
@@ -169,7 +236,7 @@ class IngestClient:
         url = f"{self.base_url}/v1/ingest/{doc_info['id']}"
         
         try:
-            response = requests.delete(url, verify=False)
+            response = resilience.request("privategpt", "DELETE", url, verify=False)
             response.raise_for_status()
             print(f"Successfully deleted document: {doc_info['filename']} (ID: {doc_info['id']})")
             logging.info(f"Successfully deleted document: {doc_info['filename']} (ID: {doc_info['id']})")
@@ -179,6 +246,26 @@ class IngestClient:
             logging.error(f"Error deleting document {doc_info['filename']} (ID: {doc_info['id']}): {str(e)}")
             return False
 
+    def delete_files(self, filenames, docs=None):
+        """
+        Deletes every chunk of the given files.
+
+        :param filenames: Filenames to delete
+        :param docs: Document list from get_doc_info (fetched if not given)
+        :return: Number of chunks deleted
+        """
+        filenames = set(filenames)
+        if not filenames:
+            return 0
+        if docs is None:
+            docs = self.get_doc_info()
+
+        deleted = 0
+        for doc in docs:
+            if doc["filename"] in filenames and self.delete_document(doc):
+                deleted += 1
+        return deleted
+
     def cleanup_old_versions(self):
         """
         Identifies and deletes old versions of documents, keeping only the latest version
@@ -207,16 +294,17 @@ class IngestClient:
                     filename_groups[filename] = []
                 filename_groups[filename].append(doc)
             
-            # Then group by base name (ID - Title) to compare dates
+            # Then group by page ID to compare dates. Titles can change without a re-ingest
+            # (see the content hash check), so the ID is the only stable part of the name.
             base_groups = {}
             for filename, chunks in filename_groups.items():
-                # Extract base name (ID - Title) from filename
+                # Extract page ID from filename
                 # Format: ID - Title - Date.md
                 parts = filename.split(" - ")
-                if len(parts) != 3:
+                if len(parts) < 3:
                     continue
                 
-                base_name = f"{parts[0]} - {parts[1]}"
+                base_name = parts[0]
                 if base_name not in base_groups:
                     base_groups[base_name] = []
                 # Store the whole chunk group together
@@ -253,16 +341,13 @@ class IngestClient:
             print(f"Error during document cleanup: {str(e)}")
             logging.error(f"Error during document cleanup: {str(e)}")
 
-def initialize_pages(api_response, client):
+def iter_pages(api_response, client):
     """
-    Parses API response and initializes Page objects with details.
+    Parses API response and yields Page objects as their content is fetched.
 
     :param api_response: The initial API response containing a list of pages
     :param client: GraphQL Client instance to fetch additional details
-    :return: List of Page objects
     """
-    pages = []
-
     for page_data in api_response.get("pages", {}).get("list", []):
         page = Page(
             page_id=page_data["id"],
@@ -285,9 +370,51 @@ def initialize_pages(api_response, client):
             page.content = response["pages"]["single"].get("content")
         # Set updatedAt from initial fetch
         page.updated_at = page_data.get("updatedAt")
-        pages.append(page)
+        yield page
+
+def initialize_pages(api_response, client):
+    """
+    Parses API response and initializes Page objects with details.
 
-    return pages
+    :param api_response: The initial API response containing a list of pages
+    :param client: GraphQL Client instance to fetch additional details
+    :return: List of Page objects
+    """
+    return list(iter_pages(api_response, client))
+
+def stream_pages(api_response, client, queue_size=8):
+    """
+    Fetches page content on a background thread and yields pages as they arrive,
+    so the caller can upload one page while the next is being fetched.
+
+    :param api_response: The (filtered) API response containing a list of pages
+    :param client: GraphQL Client instance to fetch additional details
+    :param queue_size: Maximum number of fetched pages waiting to be uploaded
+    """
+    page_queue = queue.Queue(maxsize=queue_size)
+    done = object()
+    errors = []
+
+    def producer():
+        try:
+            for page in iter_pages(api_response, client):
+                page_queue.put(page)
+        except Exception as e:
+            logging.error(f"Error fetching page content: {str(e)}")
+            errors.append(e)
+        finally:
+            page_queue.put(done)
+
+    threading.Thread(target=producer, daemon=True).start()
+
+    while True:
+        page = page_queue.get()
+        if page is done:
+            break
+        yield page
+
+    if errors:
+        raise errors[0]
 
 def setup_logging():
     """Configure and initialize logging."""
@@ -310,7 +437,9 @@ def initialize_client():
         transport = RequestsHTTPTransport(
             url=apiurl,
             verify=False,
-            headers={"Authorization": f"Bearer {apikey}"}
+            headers={"Authorization": f"Bearer {apikey}"},
+            timeout=resilience.TIMEOUTS["wiki"][1],
+            retries=resilience.RETRY_ATTEMPTS - 1
         )
         client = Client(transport=transport, fetch_schema_from_transport=False)
         print("Successfully initialized GraphQL client")
@@ -348,6 +477,212 @@ def fetch_pages(client):
         logging.error(f"Failed to fetch pages: {str(e)}")
         raise
 
+def normalize_content(content):
+    """Normalize page content before hashing (line endings, trailing whitespace, blank runs)."""
+    lines = [line.rstrip() for line in content.replace("\r\n", "\n").replace("\r", "\n").split("\n")]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+def hash_content(content):
+    """Return the SHA-256 hex digest of the normalized content."""
+    return hashlib.sha256(normalize_content(content).encode("utf-8")).hexdigest()
+
+def load_manifest(path=None):
+    """Load the ingest manifest, or an empty one if it doesn't exist yet."""
+    path = path or MANIFEST_PATH
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        manifest.setdefault("pages", {})
+        return manifest
+    except FileNotFoundError:
+        return {"pages": {}}
+    except Exception as e:
+        print(f"Could not read manifest {path}, starting fresh: {str(e)}")
+        logging.warning(f"Could not read manifest {path}, starting fresh: {str(e)}")
+        return {"pages": {}}
+
+def save_manifest(manifest, path=None):
+    """Write the ingest manifest atomically."""
+    path = path or MANIFEST_PATH
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def split_markdown_sections(content):
+    """
+    Split markdown content at headings into (heading path, text) pairs.
+    Headings inside fenced code blocks are ignored, text before the first heading gets an
+    empty heading path, and sections with no text of their own are dropped.
+    """
+    raw_sections = []
+    stack = []
+    current_path = ()
+    current_lines = []
+    in_fence = False
+
+    for line in content.replace("\r\n", "\n").split("\n"):
+        if FENCE_PATTERN.match(line):
+            in_fence = not in_fence
+        match = None if in_fence else HEADING_PATTERN.match(line)
+        if match:
+            raw_sections.append((current_path, "\n".join(current_lines)))
+            level = len(match.group(1))
+            stack = [(lvl, title) for lvl, title in stack if lvl < level]
+            stack.append((level, match.group(2).strip()))
+            current_path = tuple(title for _, title in stack)
+            current_lines = []
+        else:
+            current_lines.append(line)
+    raw_sections.append((current_path, "\n".join(current_lines)))
+
+    sections = []
+    seen = {}
+    for path, text in raw_sections:
+        text = normalize_content(text)
+        if not text:
+            continue
+        # Repeated headings under the same parent get a counter so their keys stay unique
+        seen[path] = seen.get(path, 0) + 1
+        if seen[path] > 1:
+            path = path[:-1] + (f"{path[-1]} ({seen[path]})",)
+        sections.append((path, text))
+
+    return sections
+
+def entry_filenames(entry):
+    """Return every ingested filename recorded for a manifest entry."""
+    if "sections" in entry:
+        return [section["filename"] for section in entry["sections"].values()]
+    return [entry["filename"]] if entry.get("filename") else []
+
+def is_unchanged(page, manifest, existing_files):
+    """
+    Check whether a page's content matches what was last ingested. If it does, apply a
+    metadata-only manifest update so the page isn't re-ingested.
+    """
+    entry = manifest["pages"].get(str(page.id))
+    if (entry and entry.get("content_hash") == page.content_hash()
+            and all(f in existing_files for f in entry_filenames(entry))):
+        entry.update({"title": page.title, "path": page.path, "updated_at": page.updated_at})
+        logging.info(f"Content unchanged for {page.title} (ID: {page.id}), metadata-only update")
+        return True
+    return False
+
+def skip_unchanged_pages(pages, manifest, existing_files):
+    """
+    Split pages into those whose content changed and those that only had a metadata touch.
+    Unchanged pages get a metadata-only manifest update and are not re-ingested.
+
+    :return: Tuple of (changed pages, number of skipped pages)
+    """
+    changed = []
+    skipped = 0
+    for page in pages:
+        if is_unchanged(page, manifest, existing_files):
+            skipped += 1
+        else:
+            changed.append(page)
+
+    print(f"Skipped {skipped} pages with unchanged content")
+    logging.info(f"Skipped {skipped} pages with unchanged content")
+    return changed, skipped
+
+def plan_section_updates(pages, manifest, existing_files):
+    """
+    Compare each changed page's sections against the manifest to find the sections that need
+    embedding. Sections whose hash matches an already-ingested document are left alone.
+    A page that was emptied has no sections, so its old section documents get deleted.
+
+    :return: List of dicts with the page, its current sections and the sections to upload
+    """
+    plans = []
+    for page in pages:
+        # None means the content couldn't be fetched, unlike an empty page
+        if page.content is None:
+            print(f"Skipping {page.title}: No content available.")
+            logging.info(f"Skipping {page.title}: No content available.")
+            continue
+
+        entry = manifest["pages"].get(str(page.id), {})
+        old_sections = entry.get("sections", {})
+        sections = page.split_sections()
+        to_upload = [
+            section for section in sections
+            if old_sections.get(section["key"], {}).get("hash") != section["hash"]
+            or old_sections[section["key"]]["filename"] not in existing_files
+        ]
+
+        logging.info(f"{page.title} (ID: {page.id}): {len(sections)} sections, {len(to_upload)} changed")
+        plans.append({"page": page, "sections": sections, "to_upload": to_upload})
+
+    return plans
+
+def save_sections(plans, directory="pages"):
+    """Save the changed sections of each plan to markdown files for upload."""
+    os.makedirs(directory, exist_ok=True)
+    for plan in plans:
+        for section in plan["to_upload"]:
+            filepath = os.path.join(directory, section["filename"])
+            with open(filepath, "w", encoding="utf-8") as file:
+                file.write(section["content"])
+            logging.info(f"Saved: {filepath}")
+
+def apply_section_updates(plans, uploaded, manifest, ingest_client, ragdocs):
+    """
+    Record uploaded sections in the manifest and delete the documents they replaced.
+    Removed sections and legacy whole-page documents are only deleted once every changed
+    section of the page has been uploaded, so a failed upload never leaves a gap.
+
+    :param uploaded: Set of filenames uploaded successfully
+    :param ragdocs: Document list from get_doc_info, taken before the upload
+    :return: Number of document chunks deleted
+    """
+    stale_files = set()
+
+    for plan in plans:
+        page = plan["page"]
+        entry = manifest["pages"].get(str(page.id), {})
+        old_sections = entry.get("sections", {})
+        new_sections = dict(old_sections)
+        complete = True
+
+        for section in plan["to_upload"]:
+            if section["filename"] not in uploaded:
+                complete = False
+                continue
+            old = old_sections.get(section["key"])
+            if old and old["filename"] != section["filename"]:
+                stale_files.add(old["filename"])
+            new_sections[section["key"]] = {"hash": section["hash"], "filename": section["filename"]}
+
+        if complete:
+            current_keys = {section["key"] for section in plan["sections"]}
+            for key in list(new_sections):
+                if key not in current_keys:
+                    stale_files.add(new_sections.pop(key)["filename"])
+            # Whole-page documents from before section ingestion (ID - Title - Date.md)
+            if entry.get("filename"):
+                stale_files.add(entry["filename"])
+            stale_files.update(
+                doc["filename"] for doc in ragdocs
+                if doc["update_date"] is not None and doc["filename"].split(" - ")[0] == str(page.id)
+            )
+
+        manifest["pages"][str(page.id)] = {
+            "title": page.title,
+            "path": page.path,
+            # Leave the hash and date unset after a partial upload so the page is retried next run
+            "updated_at": page.updated_at if complete else None,
+            "content_hash": page.content_hash() if complete else None,
+            "sections": new_sections
+        }
+
+    deleted = ingest_client.delete_files(stale_files, ragdocs)
+    print(f"Deleted {deleted} chunks from {len(stale_files)} replaced documents")
+    logging.info(f"Deleted {deleted} chunks from {len(stale_files)} replaced documents")
+    return deleted
+
 def construct_filename(page_id, title, updated_at):
     """Construct filename in the same format as save_to_markdown."""
     safe_title = "".join(c if c.isalnum() or c in " _-" else "_" for c in title)
@@ -355,7 +690,7 @@ def construct_filename(page_id, title, updated_at):
     formatted_date = filenamedate.strftime('%Y-%m-%d_%H-%M-%S')
     return f"{page_id} - {safe_title} - {formatted_date}.md"
 
-def filter_new_pages(pages, client):
+def filter_new_pages(pages, client, manifest=None):
     """Filter out pages that already exist in PrivateGPT."""
     try:
         # Get existing files from PrivateGPT
@@ -364,6 +699,7 @@ def filter_new_pages(pages, client):
         for file in existing_files:
             print(f"Existing file: {file}")
             logging.info(f"Existing file: {file}")
+        manifest_pages = (manifest or {}).get("pages", {})
         
         new_pages = []
         for page in pages.get("pages", {}).get("list", []):
@@ -376,8 +712,16 @@ def filter_new_pages(pages, client):
                     page["updatedAt"]
                 )
                 
+                # A page seen at this updatedAt before (possibly skipped as unchanged) is also current
+                entry = manifest_pages.get(str(page["id"]))
+                known_version = (
+                    entry is not None
+                    and entry.get("updated_at") == page["updatedAt"]
+                    and all(f in existing_files for f in entry_filenames(entry))
+                )
+                
                 # Only add page if its filename doesn't exist
-                if expected_filename not in existing_files:
+                if expected_filename not in existing_files and not known_version:
                     new_pages.append(page)
         
         print(f"Filtered out {len(pages.get('pages', {}).get('list', [])) - len(new_pages)} existing pages")
@@ -388,6 +732,49 @@ def filter_new_pages(pages, client):
         raise
     
 
+def ingest_stream(pages, manifest, ragdocs, ingest_client, export_dir=None):
+    """
+    Upload changed sections straight from memory as each page arrives from the wiki.
+
+    :param pages: Iterable of Page objects (e.g. from stream_pages)
+    :param ragdocs: Document list from get_doc_info, taken before any upload
+    :param export_dir: Also save each fetched page as markdown here (None to skip the disk export)
+    :return: Dict of run counts
+    """
+    existing_files = {doc["filename"] for doc in ragdocs}
+    stats = {"fetched": 0, "skipped": 0, "changed": 0, "sections": 0,
+             "uploaded": 0, "failed": 0, "deleted": 0}
+
+    for page in pages:
+        stats["fetched"] += 1
+        if export_dir:
+            page.save_to_markdown(export_dir)
+
+        if is_unchanged(page, manifest, existing_files):
+            stats["skipped"] += 1
+            continue
+
+        plans = plan_section_updates([page], manifest, existing_files)
+        if not plans:
+            continue
+
+        uploaded = set()
+        for section in plans[0]["to_upload"]:
+            if ingest_client.submit_content(section["filename"], section["content"]):
+                uploaded.add(section["filename"])
+            else:
+                stats["failed"] += 1
+
+        stats["changed"] += 1
+        stats["sections"] += len(plans[0]["sections"])
+        stats["uploaded"] += len(uploaded)
+        stats["deleted"] += apply_section_updates(plans, uploaded, manifest, ingest_client, ragdocs)
+        # Persist as we go so an interrupted run doesn't re-upload finished pages
+        save_manifest(manifest)
+
+    save_manifest(manifest)
+    return stats
+
 def save_pages(pages):
     """Save all pages to markdown files."""
     try:
@@ -407,25 +794,29 @@ def save_pages(pages):
         logging.error(f"Error during page saving process: {str(e)}")
         raise
 
-def upload_pages(limit=None):
+def upload_pages(md_files=None, limit=None):
     """
     Upload pages from the pages directory to the API.
     
+    :param md_files: Filenames in the pages directory to upload (None for every .md file)
     :param limit: Maximum number of files to upload (None for unlimited)
+    :return: List of filenames that were uploaded successfully
     """
     ingest_client = IngestClient()
     success_count = 0
     total_files = 0
+    uploaded = []
     
     try:
         # Get list of all markdown files
-        md_files = [f for f in os.listdir("pages") if f.endswith(".md")]
+        if md_files is None:
+            md_files = [f for f in os.listdir("pages") if f.endswith(".md")]
         
         # Apply limit if specified
-        if limit is not None:
+        if limit is not None and len(md_files) > limit:
+            print(f"Limiting upload to {limit} of {len(md_files)} files, the rest will be picked up next run")
+            logging.warning(f"Limiting upload to {limit} of {len(md_files)} files, the rest will be picked up next run")
             md_files = md_files[:limit]
-            print(f"Limiting upload to {limit} files")
-            logging.info(f"Limiting upload to {limit} files")
         
         # Process files
         for file in md_files:
@@ -433,58 +824,130 @@ def upload_pages(limit=None):
             file_path = os.path.join("pages", file)
             if ingest_client.submit_file(file_path):
                 success_count += 1
+                uploaded.append(file)
                 logging.info(f"Successfully uploaded {file}")
             else:
                 logging.error(f"Failed to upload {file}")
         
         logging.info(f"Upload complete: {success_count} of {total_files} files uploaded successfully")
         print(f"Upload complete: {success_count} of {total_files} files uploaded successfully")
+        return uploaded
         
     except Exception as e:
         logging.error(f"Error during file upload process: {str(e)}")
         raise
 
-def main():
-    """Main function."""
-    try:
-        # Delete contents of pages directory
-        for file in os.listdir("pages"):
-            file_path = os.path.join("pages", file)
+def ingest_staged(pages, manifest, ragdocs, ingest_client, directory="pages"):
+    """
+    Stage changed sections as markdown files in a directory, then upload exactly those files.
+
+    :param pages: List of Page objects
+    :param ragdocs: Document list from get_doc_info, taken before any upload
+    :return: Dict of run counts
+    """
+    # Clear out files left over from a previous run
+    if os.path.isdir(directory):
+        for file in os.listdir(directory):
+            file_path = os.path.join(directory, file)
             try:
                 if os.path.isfile(file_path):
                     os.unlink(file_path)
             except Exception as e:
                 logging.error(f"Error deleting file {file_path}: {str(e)}")
 
-        logger = setup_logging()
+    existing_files = {doc["filename"] for doc in ragdocs}
+
+    # Pages whose updatedAt moved but whose content didn't change only get a manifest update
+    changed_pages, skipped_count = skip_unchanged_pages(pages, manifest, existing_files)
+    save_manifest(manifest)
+
+    # Split changed pages at headings and stage only the sections whose hash changed
+    plans = plan_section_updates(changed_pages, manifest, existing_files)
+    save_sections(plans, directory)
+    staged_files = [section["filename"] for plan in plans for section in plan["to_upload"]]
+
+    print(f"Changed pages: {len(plans)} ({len(staged_files)} sections to submit)")
+    logging.info(f"Changed pages: {len(plans)} ({len(staged_files)} sections to submit)")
+    uploaded = set(upload_pages(staged_files))
+
+    # Only record sections that actually made it into PrivateGPT, then drop the ones they replaced
+    deleted_count = apply_section_updates(plans, uploaded, manifest, ingest_client, ragdocs)
+    save_manifest(manifest)
+
+    return {
+        "fetched": len(pages),
+        "skipped": skipped_count,
+        "changed": len(plans),
+        "sections": sum(len(plan["sections"]) for plan in plans),
+        "uploaded": len(uploaded),
+        "failed": len(staged_files) - len(uploaded),
+        "deleted": deleted_count
+    }
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Ingest Wiki.js pages into PrivateGPT.")
+    parser.add_argument(
+        "--staged", action="store_true",
+        help="Write changed sections to the pages directory and upload from disk instead of streaming"
+    )
+    parser.add_argument(
+        "--export-dir", default=None,
+        help="Also save each fetched page as markdown in this directory"
+    )
+    return parser.parse_args()
+
+def main():
+    """Main function."""
+    args = parse_args()
+    logger = setup_logging()
+
+    try:
         logger.info("Starting wiki page processing")
         print("Starting wiki page processing...")
         
         client = initialize_client()
         ingest_client = IngestClient()
+        manifest = load_manifest()
         
-        response = fetch_pages(client)
-        response = filter_new_pages(response, ingest_client)
-        pages = initialize_pages(response, client)
-        save_pages(pages)
-        
-        logger.info("Wiki page processing completed successfully")
-        print("Wiki page processing completed successfully")
-
         logger.info("Getting list of documents from PrivateGPT...")
         print("Getting list of documents from PrivateGPT...")
         ragdocs = ingest_client.get_doc_info()
-
         print(f"Documents in PrivateGPT: {len(ragdocs)}")
-        print(f"New documents to submit: {len(pages)}")
         
-        logger.info("Starting file upload process...")
-        print("Starting file upload process...")
-        upload_pages(limit=50)
+        response = fetch_pages(client)
+        total_listed = len(response.get("pages", {}).get("list", []))
+        response = filter_new_pages(response, ingest_client, manifest)
+        to_fetch = len(response.get("pages", {}).get("list", []))
+        print(f"Pages to fetch: {to_fetch}")
+        
+        if args.staged:
+            logger.info("Starting staged upload process...")
+            print("Starting staged upload process...")
+            pages = initialize_pages(response, client)
+            stats = ingest_staged(pages, manifest, ragdocs, ingest_client)
+        else:
+            # Fetch and upload overlap: each page is uploaded from memory while the next is fetched
+            logger.info("Starting streaming upload process...")
+            print("Starting streaming upload process...")
+            stats = ingest_stream(stream_pages(response, client), manifest, ragdocs,
+                                  ingest_client, export_dir=args.export_dir)
+        
+        logger.info("Wiki page processing completed successfully")
+        print("Wiki page processing completed successfully")
         
         logger.info("Starting cleanup of old document versions...")
         print("\nStarting cleanup of old document versions...")
         ingest_client.cleanup_old_versions()
+
+        summary = (
+            f"Run summary: {total_listed} pages listed, {total_listed - to_fetch} already current, "
+            f"{stats['skipped']} skipped (content unchanged), {stats['changed']} changed; "
+            f"sections: {stats['sections']} in changed pages, {stats['uploaded']} uploaded, "
+            f"{stats['failed']} failed, {stats['deleted']} old chunks deleted"
+        )
+        logger.info(summary)
+        print(f"\n{summary}")
         
         # Exit with success code
         logger.info("All operations completed successfully")
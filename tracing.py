@@ -0,0 +1,161 @@
+"""
+Per-incident pipeline tracing. Spans are handed to a background writer through a bounded
+queue and written to the `traces` table in batches, so recording a span on the hot path is
+just a queue put.
+"""
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import db
+import metrics
+
+logger = logging.getLogger('incidentgpt.tracing')
+
+FLUSH_INTERVAL = 1.0  # Seconds between batch writes
+BATCH_SIZE = 500  # Maximum spans per write
+MAX_BUFFERED = 10000  # Spans beyond this are dropped rather than blocking the pipeline
+RETENTION_DAYS = 14  # Traces older than this are pruned
+PRUNE_INTERVAL = 3600  # Seconds between prunes
+
+
+class Tracer:
+    """Buffers spans in memory and writes them to SQLite from a daemon thread."""
+
+    def __init__(self):
+        self.buffer = queue.Queue(maxsize=MAX_BUFFERED)
+        self.dropped = 0
+        self.db_path = None
+        self.thread = None
+        self.last_prune = 0
+
+    def start(self, db_path):
+        """Start the background writer (idempotent)."""
+        self.db_path = db_path
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name='trace-writer', daemon=True)
+            self.thread.start()
+
+    def record(self, incident_number, generation_id, name, started_at, ended_at=None, **attrs):
+        """Record a span (or a point event when ended_at is omitted). Never blocks."""
+        row = (
+            incident_number,
+            generation_id,
+            name,
+            started_at,
+            started_at if ended_at is None else ended_at,
+            json.dumps(attrs) if attrs else None
+        )
+        try:
+            self.buffer.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            metrics.TRACE_SPANS_DROPPED.inc()
+
+    def _drain(self):
+        rows = []
+        while len(rows) < BATCH_SIZE:
+            try:
+                rows.append(self.buffer.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def flush(self):
+        """Write everything currently buffered."""
+        while True:
+            rows = self._drain()
+            if not rows:
+                return
+            self._write(rows)
+
+    def _write(self, rows):
+        conn = db.get_connection(self.db_path)
+        try:
+            conn.executemany('''
+                INSERT INTO traces (incident_number, generation_id, name, started_at, ended_at, attrs)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            if time.time() - self.last_prune > PRUNE_INTERVAL:
+                conn.execute('DELETE FROM traces WHERE started_at < ?', (time.time() - RETENTION_DAYS * 86400,))
+                self.last_prune = time.time()
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error writing {len(rows)} trace spans: {str(e)}")
+            conn.rollback()
+
+    def _run(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error in trace writer: {str(e)}")
+
+
+TRACER = Tracer()
+
+
+def start(db_path):
+    TRACER.start(db_path)
+
+
+def record(incident_number, generation_id, name, started_at, ended_at=None, **attrs):
+    TRACER.record(incident_number, generation_id, name, started_at, ended_at, **attrs)
+
+
+def event(incident_number, generation_id, name, **attrs):
+    """Record a point event at the current time."""
+    TRACER.record(incident_number, generation_id, name, time.time(), **attrs)
+
+
+@contextmanager
+def span(incident_number, generation_id, name, **attrs):
+    """Time a block as a span: `with tracing.span(number, gen_id, 'retrieval'): ...`"""
+    started_at = time.time()
+    try:
+        yield
+    finally:
+        TRACER.record(incident_number, generation_id, name, started_at, time.time(), **attrs)
+
+
+def get_traces(conn, incident_number):
+    """
+    Load every span for an incident, grouped by generation. Incident-level events (like the first
+    poll sighting) have no generation and are returned separately.
+    """
+    c = conn.cursor()
+    c.execute('''
+        SELECT generation_id, name, started_at, ended_at, attrs
+        FROM traces
+        WHERE incident_number = ?
+        ORDER BY started_at, id
+    ''', (incident_number,))
+
+    incident_events = []
+    generations = {}
+    for generation_id, name, started_at, ended_at, attrs in c.fetchall():
+        entry = {
+            'name': name,
+            'started_at': started_at,
+            'ended_at': ended_at,
+            'duration': round(ended_at - started_at, 3),
+            'attrs': json.loads(attrs) if attrs else {}
+        }
+        if generation_id is None:
+            incident_events.append(entry)
+        else:
+            generations.setdefault(generation_id, []).append(entry)
+
+    return {
+        'incident_number': incident_number,
+        'events': incident_events,
+        'generations': [
+            {'generation_id': generation_id, 'spans': spans}
+            for generation_id, spans in sorted(generations.items(), key=lambda item: item[1][0]['started_at'])
+        ]
+    }